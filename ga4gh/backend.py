@@ -8,13 +8,22 @@ from __future__ import unicode_literals
 
 import os
 import json
+import time
+import logging
+import Queue
 import random
+import itertools
+import threading
+import collections
+import multiprocessing
 
 import ga4gh.protocol as protocol
+import ga4gh.datamodel as datamodel
 import ga4gh.datamodel.references as references
 import ga4gh.datamodel.reads as reads
 import ga4gh.exceptions as exceptions
 import ga4gh.datamodel.variants as variants
+import ga4gh.datamodel.repository as repository
 
 
 def _parsePageToken(pageToken, numValues):
@@ -35,7 +44,20 @@ def _parsePageToken(pageToken, numValues):
     return values
 
 
-def _getVariantSet(request, variantSetIdMap):
+def _parseIntervalPageToken(pageToken):
+    """
+    Parses the specified page token generated by an IntervalIterator and
+    returns the (startPosition, equalPositionsToSkip, cursorId) tuple.
+    Tokens that do not name a server-side cursor consist of two values,
+    and cursorId is None for these.
+    """
+    if pageToken.count(":") == 2:
+        return tuple(_parsePageToken(pageToken, 3))
+    startPosition, equalPositionsToSkip = _parsePageToken(pageToken, 2)
+    return startPosition, equalPositionsToSkip, None
+
+
+def _getVariantSetId(request, variantSetIdMap):
     if len(request.variantSetIds) != 1:
         if len(request.variantSetIds) == 0:
             msg = "Variant search requires specifying a variantSet"
@@ -44,23 +66,192 @@ def _getVariantSet(request, variantSetIdMap):
                    "not supported")
         raise exceptions.NotImplementedException(msg)
     variantSetId = request.variantSetIds[0]
+    if variantSetId not in variantSetIdMap:
+        raise exceptions.VariantSetNotFoundException(variantSetId)
+    return variantSetId
+
+
+def _getVariantSet(request, variantSetIdMap):
+    return variantSetIdMap[_getVariantSetId(request, variantSetIdMap)]
+
+
+def _getReadGroup(request, readGroupIdMap):
+    if len(request.readGroupIds) != 1:
+        if len(request.readGroupIds) == 0:
+            msg = "Read search requires a readGroup to be specified"
+        else:
+            msg = "Read search over multiple readGroups not supported"
+        raise exceptions.NotImplementedException(msg)
+    readGroupId = request.readGroupIds[0]
     try:
-        variantSet = variantSetIdMap[variantSetId]
+        readGroup = readGroupIdMap[readGroupId]
     except KeyError:
-        raise exceptions.VariantSetNotFoundException(variantSetId)
-    return variantSet
+        raise exceptions.ReadGroupNotFoundException(readGroupId)
+    return readGroup
+
+
+class SearchOptions(object):
+    """
+    Options for a search that are not part of the protocol request,
+    such as the field mask used to return partial responses and the
+    variant and read filters. These are given as a mapping from option names to
+    string values, for example the query parameters of an HTTP request.
+    Options that are not recognised are ignored.
+    """
+    def __init__(self, options=None):
+        if options is None:
+            options = {}
+        self._options = {}
+        self._fieldMask = None
+        fields = options.get("fields")
+        if fields is not None:
+            try:
+                self._fieldMask = protocol.FieldMask.parse(fields)
+            except ValueError:
+                raise exceptions.BadFieldMaskException(fields)
+            self._options["fields"] = fields
+        self._variantFilter = None
+        minQuality = self._getOption(options, "minQuality", float)
+        passOnly = self._getOption(options, "passOnly", self._parseBool)
+        nonReference = self._getOption(
+            options, "nonReference", self._parseBool)
+        minAlleleCount = self._getOption(options, "minAlleleCount", int)
+        maxAlleleCount = self._getOption(options, "maxAlleleCount", int)
+        if (minQuality is not None or passOnly or nonReference or
+                minAlleleCount is not None or maxAlleleCount is not None):
+            self._variantFilter = variants.VariantFilter(
+                minQuality, bool(passOnly), bool(nonReference),
+                minAlleleCount, maxAlleleCount)
+        self._readFilter = None
+        readFilterArgs = {}
+        for name in [
+                "excludeDuplicates", "excludeSecondary",
+                "excludeFailedQualityChecks", "mappedOnly"]:
+            if self._getOption(options, name, self._parseBool):
+                readFilterArgs[name] = True
+        for name, optionName, parse in [
+                ("minMappingQuality", "minMappingQuality", self._parseCount),
+                ("maxDepth", "maxDepth", self._parseCount),
+                ("windowSize", "depthWindowSize", self._parseLength),
+                ("seed", "downsamplingSeed", self._parseCount)]:
+            value = self._getOption(options, optionName, parse)
+            if value is not None:
+                readFilterArgs[name] = value
+        if len(readFilterArgs) > 0:
+            self._readFilter = reads.ReadFilter(**readFilterArgs)
+        self._binSize = self._getOption(options, "binSize", self._parseLength)
+        self._namePrefix = self._getOption(options, "namePrefix", unicode)
+
+    def _getOption(self, options, name, parse):
+        value = options.get(name)
+        if value is None:
+            return None
+        try:
+            parsedValue = parse(value)
+        except ValueError:
+            raise exceptions.BadSearchOptionException(name, value)
+        self._options[name] = value
+        return parsedValue
+
+    @classmethod
+    def _parseCount(cls, value):
+        count = int(value)
+        if count < 0:
+            raise ValueError(value)
+        return count
+
+    @classmethod
+    def _parseLength(cls, value):
+        length = int(value)
+        if length <= 0:
+            raise ValueError(value)
+        return length
+
+    @classmethod
+    def _parseBool(cls, value):
+        if value.lower() in ("true", "1"):
+            return True
+        if value.lower() in ("false", "0"):
+            return False
+        raise ValueError(value)
+
+    def getFieldMask(self):
+        """
+        Returns the FieldMask selecting the fields of the response that
+        are returned, or None if all fields are returned.
+        """
+        return self._fieldMask
+
+    def getValueFieldMask(self, valueListName):
+        """
+        Returns the FieldMask selecting the fields of each of the values
+        in the specified value list, or None if all fields are returned.
+        """
+        if self._fieldMask is None:
+            return None
+        return self._fieldMask.getSubMask(valueListName)
+
+    def getVariantFilter(self):
+        """
+        Returns the VariantFilter that variants must pass to be returned,
+        or None if variants are not filtered.
+        """
+        return self._variantFilter
+
+    def getReadFilter(self):
+        """
+        Returns the ReadFilter that reads must pass to be returned, or
+        None if reads are not filtered.
+        """
+        return self._readFilter
+
+    def getBinSize(self):
+        """
+        Returns the size in bases of the bins in which records are
+        counted, or None if only the total count is returned.
+        """
+        return self._binSize
+
+    def getNamePrefix(self):
+        """
+        Returns the prefix that the names of the returned objects must
+        start with, or None if names are not matched by prefix.
+        """
+        return self._namePrefix
+
+    def getKey(self):
+        """
+        Returns a string that is equal for equal sets of options.
+        """
+        return "&".join(
+            "{}={}".format(name, value)
+            for name, value in sorted(self._options.items()))
 
 
 class IntervalIterator(object):
     """
     Implements generator logic for types which accept a start/end
-    range to search for the object
+    range to search for the object. If a CursorTable is provided, the
+    page tokens include a cursor ID so that a later request for the next
+    page can continue reading from this iterator. If a SearchPipeline is
+    provided, the subclasses returning TranscodedRecords read them with
+    its worker processes.
     """
-    def __init__(self, request, containerIdMap):
+    def __init__(
+            self, request, containerIdMap, searchOptions=None,
+            cursorTable=None, searchPipeline=None):
         self._request = request
         self._containerIdMap = containerIdMap
+        self._searchPipeline = searchPipeline
+        if searchOptions is None:
+            searchOptions = SearchOptions()
+        self._searchOptions = searchOptions
         self._badPageTokenExceptionMessage = (
             "Inconsistent page token provided")
+        self._cursorId = None
+        if cursorTable is not None:
+            self._cursorId = cursorTable.newCursorId()
+        self._nextPageToken = None
         self._container = self._getContainer()
         self._startPosition, self._equalPositionsToSkip = \
             self._getIntervalCounters()
@@ -74,6 +265,42 @@ class IntervalIterator(object):
         obj = next(self._generator)
         return obj
 
+    def getCursorId(self):
+        """
+        Returns the cursor ID for this iterator, or None if it is not
+        associated with a CursorTable.
+        """
+        return self._cursorId
+
+    def canResume(self, request, searchOptions, iteratorClass):
+        """
+        Returns True if the specified request and options ask for the
+        next page of the search that this iterator is performing, as an
+        instance of the specified IntervalIterator class. Searches that
+        share a request type, such as those for variants and for allele
+        frequencies, must not resume each other's cursors.
+        """
+        if (type(self) is not iteratorClass or
+                type(request) != type(self._request) or
+                request.pageToken != self._nextPageToken or
+                searchOptions.getKey() != self._searchOptions.getKey()):
+            return False
+        return (self._getQueryDict(request) ==
+                self._getQueryDict(self._request))
+
+    @classmethod
+    def _getQueryDict(cls, request):
+        ret = request.toJsonDict()
+        del ret["pageToken"]
+        del ret["pageSize"]
+        return ret
+
+    def _formatPageToken(self, startPosition, equalPositionsToSkip):
+        if self._cursorId is None:
+            return "{}:{}".format(startPosition, equalPositionsToSkip)
+        return "{}:{}:{}".format(
+            startPosition, equalPositionsToSkip, self._cursorId)
+
     def _raiseBadPageTokenException(self):
         raise exceptions.BadPageTokenException(
             self._badPageTokenExceptionMessage)
@@ -82,17 +309,46 @@ class IntervalIterator(object):
         startPosition = self._request.start
         equalPositionsToSkip = 0
         if self._request.pageToken is not None:
-            startPosition, equalPositionsToSkip = _parsePageToken(
-                self._request.pageToken, 2)
+            startPosition, equalPositionsToSkip, _ = \
+                _parseIntervalPageToken(self._request.pageToken)
         return startPosition, equalPositionsToSkip
 
+    def _getMinStart(self):
+        """
+        Returns the position before which the container skips records
+        without converting them, or None on the first page. The records
+        that start before the start of a later page and overlap it, such
+        as long deletions and reads, were returned on an earlier page.
+        """
+        if self._request.pageToken is None:
+            return None
+        return self._startPosition
+
+    def _getTranscodedRecords(self, methodName, referenceName, args, kwargs):
+        """
+        Returns an iterator over the TranscodedRecords returned by the
+        specified method of the container, which is called with the
+        reference name, the interval of this search, the specified args
+        and kwargs and the minStart.
+        """
+        if self._searchPipeline is None or referenceName is None:
+            return getattr(self._container, methodName)(
+                referenceName, self._startPosition, self._request.end,
+                *args, minStart=self._getMinStart(), **kwargs)
+        return self._searchPipeline.getRecords(
+            self._container, self._containerMapName, methodName,
+            referenceName, self._startPosition, self._request.end,
+            self._getMinStart(), args, kwargs)
+
     def _internalIterator(self):
         obj = next(self._iterator, None)
         if self._request.pageToken is not None:
             # First, skip any records with getStart < startPosition
-            # or getEnd < request.start
+            # or that end at or before request.start. The containers
+            # already skip the records starting before minStart, so this
+            # only guards against those that ignore it.
             while (self._getStart(obj) < self._startPosition or
-                   self._getEnd(obj) < self._request.start):
+                   self._getEnd(obj) <= self._request.start):
                 obj = next(self._iterator, None)
                 if obj is None:
                     self._raiseBadPageTokenException()
@@ -115,8 +371,9 @@ class IntervalIterator(object):
                     self._equalPositionsToSkip += 1
                 else:
                     self._equalPositionsToSkip = 0
-                nextPageToken = "{}:{}".format(
+                nextPageToken = self._formatPageToken(
                     self._getStart(nextObj), self._equalPositionsToSkip)
+            self._nextPageToken = nextPageToken
             yield obj, nextPageToken
             obj = nextObj
 
@@ -125,24 +382,19 @@ class ReadsIntervalIterator(IntervalIterator):
     """
     An interval iterator for reads
     """
+    _containerMapName = "_readGroupIdMap"
+
     def _getContainer(self):
-        if len(self._request.readGroupIds) != 1:
-            if len(self._request.readGroupIds) == 0:
-                msg = "Read search requires a readGroup to be specified"
-            else:
-                msg = "Read search over multiple readGroups not supported"
-            raise exceptions.NotImplementedException(msg)
-        readGroupId = self._request.readGroupIds[0]
-        try:
-            readGroup = self._containerIdMap[self._request.readGroupIds[0]]
-        except KeyError:
-            raise exceptions.ReadGroupNotFoundException(readGroupId)
-        return readGroup
+        return _getReadGroup(self._request, self._containerIdMap)
 
     def _getIterator(self):
         iterator = self._container.getReadAlignments(
             self._request.referenceId,
-            self._startPosition, self._request.end)
+            self._startPosition, self._request.end,
+            fieldMask=self._searchOptions.getValueFieldMask(
+                protocol.SearchReadsResponse.getValueListName()),
+            readFilter=self._searchOptions.getReadFilter(),
+            minStart=self._getMinStart())
         return iterator
 
     @classmethod
@@ -151,14 +403,15 @@ class ReadsIntervalIterator(IntervalIterator):
 
     @classmethod
     def _getEnd(cls, readAlignment):
-        return cls._getStart(readAlignment) + \
-            len(readAlignment.alignedSequence)
+        return reads.getReadAlignmentEnd(readAlignment)
 
 
 class VariantsIntervalIterator(IntervalIterator):
     """
     An interval iterator for variants
     """
+    _containerMapName = "_variantSetIdMap"
+
     def _getContainer(self):
         return _getVariantSet(self._request, self._containerIdMap)
 
@@ -166,7 +419,11 @@ class VariantsIntervalIterator(IntervalIterator):
         iterator = self._container.getVariants(
             self._request.referenceName, self._startPosition,
             self._request.end, self._request.variantName,
-            self._request.callSetIds)
+            self._request.callSetIds,
+            fieldMask=self._searchOptions.getValueFieldMask(
+                protocol.SearchVariantsResponse.getValueListName()),
+            variantFilter=self._searchOptions.getVariantFilter(),
+            minStart=self._getMinStart())
         return iterator
 
     @classmethod
@@ -178,11 +435,376 @@ class VariantsIntervalIterator(IntervalIterator):
         return variant.end
 
 
+class TranscodedReadsIntervalIterator(ReadsIntervalIterator):
+    """
+    An interval iterator for reads that are transcoded directly into
+    JSON by the read group
+    """
+    def _getIterator(self):
+        return self._getTranscodedRecords(
+            "getTranscodedReadAlignments", self._request.referenceId, (),
+            dict(
+                fieldMask=self._searchOptions.getValueFieldMask(
+                    protocol.SearchReadsResponse.getValueListName()),
+                readFilter=self._searchOptions.getReadFilter()))
+
+    @classmethod
+    def _getStart(cls, record):
+        return record.start
+
+    @classmethod
+    def _getEnd(cls, record):
+        return record.end
+
+
+class TranscodedVariantsIntervalIterator(VariantsIntervalIterator):
+    """
+    An interval iterator for variants that are transcoded directly into
+    JSON by the variant set
+    """
+    def _getIterator(self):
+        return self._getTranscodedRecords(
+            "getTranscodedVariants", self._request.referenceName,
+            (self._request.variantName, self._request.callSetIds),
+            dict(
+                fieldMask=self._searchOptions.getValueFieldMask(
+                    protocol.SearchVariantsResponse.getValueListName()),
+                variantFilter=self._searchOptions.getVariantFilter()))
+
+
+class AlleleFrequenciesIntervalIterator(VariantsIntervalIterator):
+    """
+    An interval iterator for the allele frequencies of variants, which
+    are computed by the variant set
+    """
+    def _getIterator(self):
+        return self._getTranscodedRecords(
+            "getAlleleFrequencies", self._request.referenceName,
+            (self._request.callSetIds,),
+            dict(variantFilter=self._searchOptions.getVariantFilter()))
+
+
+class SearchAlleleFrequenciesResponse(object):
+    """
+    The response to a search for the allele frequencies of variants.
+    This is not part of the protocol, but is built in the same way as
+    the SearchResponses; each value is the JSON object described in
+    AbstractVariantSet._getAlleleFrequencyRecord.
+    """
+    _valueListName = "sites"
+
+    @classmethod
+    def getValueListName(cls):
+        return cls._valueListName
+
+    @classmethod
+    def validate(cls, jsonDict):
+        return (
+            isinstance(jsonDict, dict) and
+            isinstance(jsonDict.get(cls._valueListName), list))
+
+
+class TimedCache(object):
+    """
+    A size-bounded map whose entries expire the specified number of
+    seconds after they were last stored. When the map is full, the
+    least recently stored entries are evicted first.
+    """
+    def __init__(self, maxSize, timeout):
+        self._maxSize = maxSize
+        self._timeout = timeout
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def getTimeout(self):
+        """
+        Returns the number of seconds after which entries expire.
+        """
+        return self._timeout
+
+    def put(self, key, value):
+        """
+        Stores the specified value under the specified key, evicting the
+        oldest entries if the cache is full.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self._timeout, value)
+            while len(self._entries) > self._maxSize:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """
+        Returns the value cached for the specified key, or None if there
+        is no unexpired value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expiryTime, value = entry
+            if expiryTime < time.time():
+                del self._entries[key]
+                return None
+            return value
+
+    def pop(self, key):
+        """
+        Removes the entry for the specified key, and returns its value if
+        it has not expired, or None otherwise.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        expiryTime, value = entry
+        if expiryTime < time.time():
+            return None
+        return value
+
+    def remove(self, key):
+        """
+        Removes the entry for the specified key, if present.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PrefetchCache(TimedCache):
+    """
+    A cache of speculatively computed search responses, keyed by the
+    request that would retrieve them. A key can also be marked as
+    pending while a response for it is being computed, so that a
+    request for that key waits for the result instead of computing it
+    a second time.
+    """
+    def __init__(self, maxSize, timeout):
+        super(PrefetchCache, self).__init__(maxSize, timeout)
+        self._pending = {}
+
+    def reserve(self, key):
+        """
+        Marks the specified key as pending. Returns False if a value for
+        this key is already cached or pending, and True otherwise.
+        """
+        with self._lock:
+            if key in self._pending or key in self._entries:
+                return False
+            self._pending[key] = threading.Event()
+            return True
+
+    def release(self, key):
+        """
+        Clears the pending mark for the specified key, waking up any
+        requests waiting for it.
+        """
+        with self._lock:
+            event = self._pending.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def get(self, key):
+        """
+        Returns the value cached for the specified key, or None if there
+        is no unexpired value. If the key is pending, wait for it to be
+        released first.
+        """
+        with self._lock:
+            event = self._pending.get(key)
+        if event is not None:
+            event.wait(self._timeout)
+        return super(PrefetchCache, self).get(key)
+
+
+class CursorTable(TimedCache):
+    """
+    A table of live IntervalIterators that can resume a search from
+    where the previous page left off. Each iterator is stored under a
+    unique integer cursor ID that is included in the page tokens it
+    generates, and is discarded if it has not been used for the
+    specified number of seconds.
+    """
+    def __init__(self, maxSize, timeout):
+        super(CursorTable, self).__init__(maxSize, timeout)
+        self._cursorIds = itertools.count()
+
+    def newCursorId(self):
+        """
+        Returns a cursor ID that has not been used before.
+        """
+        with self._lock:
+            return next(self._cursorIds)
+
+    def save(self, intervalIterator):
+        """
+        Stores the specified IntervalIterator under its cursor ID so that
+        the next page can be read from it.
+        """
+        self.put(intervalIterator.getCursorId(), intervalIterator)
+
+    def resume(self, request, searchOptions, iteratorClass):
+        """
+        Returns the live IntervalIterator of the specified class that
+        generated the page token in the specified request, or None if the
+        token does not name a cursor, or the cursor has expired or cannot
+        resume this request.
+        The iterator is taken out of the table while it is in use, so that
+        concurrent requests with the same token cannot share it; it is
+        saved again if the search stops before the end.
+        """
+        if request.pageToken is None:
+            return None
+        _, _, cursorId = _parseIntervalPageToken(request.pageToken)
+        if cursorId is None:
+            return None
+        intervalIterator = self.pop(cursorId)
+        if intervalIterator is None:
+            return None
+        if not intervalIterator.canResume(
+                request, searchOptions, iteratorClass):
+            self.save(intervalIterator)
+            return None
+        return intervalIterator
+
+
+def _getChunkRecords(
+        container, methodName, referenceName, args, kwargs, chunk):
+    """
+    Returns the list of the (start, end, jsonString) tuples for the
+    TranscodedRecords returned by the specified method of the container
+    for the specified (start, end, minStart) chunk of a search.
+    """
+    chunkStart, chunkEnd, minStart = chunk
+    records = getattr(container, methodName)(
+        referenceName, chunkStart, chunkEnd, *args, minStart=minStart,
+        **kwargs)
+    return [
+        (record.start, record.end, record.toJsonString())
+        for record in records]
+
+
+# The backend of a search worker process, which is a copy of that of the
+# server process made when the worker was forked.
+_searchWorkerBackend = None
+
+
+def _initSearchWorker(theBackend):
+    global _searchWorkerBackend
+    theBackend.initSearchWorker()
+    _searchWorkerBackend = theBackend
+
+
+def _runSearchChunk(
+        containerMapName, containerId, methodName, referenceName, args,
+        kwargs, chunk):
+    """
+    Returns the records of the specified chunk of a search, read in a
+    search worker process, or None if reading them failed. Errors are
+    reported by reading the chunk again in the server process, as the
+    exceptions cannot always be sent back from the worker.
+    """
+    try:
+        container = getattr(_searchWorkerBackend, containerMapName)[
+            containerId]
+        return _getChunkRecords(
+            container, methodName, referenceName, args, kwargs, chunk)
+    except Exception:
+        return None
+
+
+class SearchPipeline(object):
+    """
+    A pool of worker processes that fetch, convert and serialise the
+    records of variant and read searches in parallel. The interval of a
+    search is divided into chunks, each of which holds the records
+    starting in it, and up to maxPendingChunks chunks following the one
+    being returned are read ahead by the workers. The records are
+    returned in the order of the chunks, and so in the same order as by
+    a search run in the server process.
+
+    The size of the chunks is adapted to the density of the records, so
+    that they hold about recordsPerChunk records each. The workers are
+    forked from the server process, so the pool should be created before
+    it starts serving requests.
+    """
+    initialChunkSize = 2**14
+    minChunkSize = 2**4
+
+    def __init__(self, theBackend, numWorkers, recordsPerChunk):
+        self._pool = multiprocessing.Pool(
+            numWorkers, _initSearchWorker, (theBackend,))
+        self._maxPendingChunks = 2 * numWorkers
+        self._recordsPerChunk = recordsPerChunk
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        self._pool.terminate()
+        self._pool.join()
+
+    def getRecords(
+            self, container, containerMapName, methodName, referenceName,
+            start, end, minStart, args, kwargs):
+        """
+        Returns an iterator over the TranscodedRecords returned by the
+        specified method of the container for the interval from start to
+        end, as for IntervalIterator._getTranscodedRecords. The container
+        is found in the workers by its ID in the named map of the backend.
+        """
+        if end is None:
+            end = datamodel.PysamDatamodelMixin.samMaxEnd
+        pendingChunks = collections.deque()
+        chunkStart = start
+        chunkSize = self.initialChunkSize
+        while True:
+            while (chunkStart < end and
+                    len(pendingChunks) < self._maxPendingChunks):
+                chunkEnd = min(chunkStart + chunkSize, end)
+                # The first chunk includes the records overlapping the
+                # start of the search; the others skip those that were
+                # returned with an earlier chunk.
+                chunk = (
+                    chunkStart, chunkEnd,
+                    minStart if chunkStart == start else chunkStart)
+                result = self._pool.apply_async(_runSearchChunk, (
+                    containerMapName, container.getId(), methodName,
+                    referenceName, args, kwargs, chunk))
+                pendingChunks.append((chunk, result))
+                chunkStart = chunkEnd
+            if len(pendingChunks) == 0:
+                break
+            chunk, result = pendingChunks.popleft()
+            records = result.get()
+            if records is None:
+                records = _getChunkRecords(
+                    container, methodName, referenceName, args, kwargs,
+                    chunk)
+            if len(records) == 0:
+                chunkSize *= 2
+            else:
+                chunkSize = max(
+                    self.minChunkSize,
+                    (chunk[1] - chunk[0]) * self._recordsPerChunk //
+                    len(records))
+            for recordStart, recordEnd, jsonString in records:
+                yield datamodel.TranscodedRecord(
+                    recordStart, recordEnd, jsonString)
+
+
 class AbstractBackend(object):
     """
     An abstract GA4GH backend.
     This class provides methods for all of the GA4GH protocol end points.
     """
+    beaconId = "ga4gh-server"
+
     def __init__(self):
         self._variantSetIdMap = {}
         self._variantSetIds = []
@@ -196,6 +818,11 @@ class AbstractBackend(object):
         self._responseValidation = False
         self._defaultPageSize = 100
         self._maxResponseLength = 2**20  # 1 MiB
+        self._prefetchCache = None
+        self._prefetchQueue = None
+        self._cursorTable = None
+        self._searchPipeline = None
+        self._transcodeSearchResults = False
 
     def getVariantSets(self):
         """
@@ -210,7 +837,8 @@ class AbstractBackend(object):
         return list(self._readGroupSetIdMap.values())
 
     def runSearchRequest(
-            self, requestStr, requestClass, responseClass, objectGenerator):
+            self, requestStr, requestClass, responseClass, objectGenerator,
+            options=None):
         """
         Runs the specified request. The request is a string containing
         a JSON representation of an instance of the specified requestClass.
@@ -219,32 +847,228 @@ class AbstractBackend(object):
         using the specified object generator, which must return
         (object, nextPageToken) pairs, and be able to resume iteration from
         any point using the nextPageToken attribute of the request object.
+        The options are a mapping of the search options that are not part
+        of the protocol request; see SearchOptions.
         """
         self.startProfile()
         try:
             requestDict = json.loads(requestStr)
         except ValueError:
             raise exceptions.InvalidJsonException(requestStr)
+        request = self._parseSearchRequest(requestDict, requestClass)
+        searchOptions = SearchOptions(options)
+        if self._prefetchCache is None:
+            responseString, _ = self._runSearch(
+                request, searchOptions, responseClass, objectGenerator)
+        else:
+            key = self._getPrefetchKey(
+                request, requestClass, responseClass, searchOptions)
+            cached = self._prefetchCache.get(key)
+            if cached is None:
+                cached = self._runSearch(
+                    request, searchOptions, responseClass, objectGenerator)
+            responseString, nextPageToken = cached
+            if nextPageToken is not None:
+                self._prefetchNextPage(
+                    request, searchOptions, requestClass, responseClass,
+                    objectGenerator, nextPageToken)
+        self.endProfile()
+        return responseString
+
+    def _parseSearchRequest(self, requestDict, requestClass):
+        """
+        Returns the instance of the specified requestClass for the
+        specified JSON dictionary, after validating it and filling in the
+        default page size.
+        """
         self.validateRequest(requestDict, requestClass)
-        request = requestClass.fromJsonDict(requestDict)
+        try:
+            request = requestClass.fromJsonDict(requestDict)
+        except (AttributeError, TypeError, ValueError):
+            raise exceptions.RequestValidationFailureException(
+                requestDict, requestClass)
         if request.pageSize is None:
             request.pageSize = self._defaultPageSize
         if request.pageSize <= 0:
             raise exceptions.BadPageSizeException(request.pageSize)
+        return request
+
+    def runBatchSearchRequest(
+            self, requestStr, requestClass, responseClass, objectGenerator,
+            options=None):
+        """
+        Runs the specified batch of search requests, and returns an
+        iterator over the pieces of the JSON response. The batch is a
+        JSON object holding either a list of instances of requestClass in
+        its "requests" field, or a single instance in its "request" field
+        and a list of "intervals". Each interval is a JSON object holding
+        the fields (such as referenceName, start and end) that replace
+        those of the single request to make one request of the batch.
+
+        The response is a JSON object holding a list of "responses", one
+        for each request in the same order. Each is either a page of
+        results in the form of an instance of responseClass, with its
+        own nextPageToken, or a GAException if the request failed. The
+        requests are run in the order of their positions in the data
+        files, so that the files are read sequentially.
+        """
+        self.startProfile()
+        try:
+            batchDict = json.loads(requestStr)
+        except ValueError:
+            raise exceptions.InvalidJsonException(requestStr)
+        requestDicts = None
+        if isinstance(batchDict, dict):
+            requestDicts = batchDict.get("requests")
+            intervals = batchDict.get("intervals")
+            template = batchDict.get("request")
+            if (requestDicts is None and isinstance(intervals, list) and
+                    isinstance(template, dict)):
+                requestDicts = []
+                for interval in intervals:
+                    if not isinstance(interval, dict):
+                        raise exceptions.BadBatchSearchRequestException()
+                    requestDict = dict(template)
+                    requestDict.update(interval)
+                    requestDicts.append(requestDict)
+        if not isinstance(requestDicts, list):
+            raise exceptions.BadBatchSearchRequestException()
+        requests = [
+            self._parseSearchRequest(itemDict, requestClass)
+            for itemDict in requestDicts]
+        searchOptions = SearchOptions(options)
+        return self._batchSearchResponseGenerator(
+            requests, searchOptions, responseClass, objectGenerator)
+
+    @classmethod
+    def _getSearchPositionKey(cls, request):
+        """
+        Returns a key that orders search requests by the position in the
+        data files at which they start reading.
+        """
+        return tuple(
+            getattr(request, name, None) for name in [
+                "variantSetIds", "readGroupIds", "referenceId",
+                "referenceName", "start"])
+
+    def _batchSearchResponseGenerator(
+            self, requests, searchOptions, responseClass, objectGenerator):
+        """
+        Runs the specified search requests in the order of their
+        positions and yields the pieces of the batch response, holding
+        back the responses that are run before the earlier requests in the
+        batch. Usually the requests are already sorted, so nothing is held
+        back.
+        """
+        order = sorted(
+            range(len(requests)),
+            key=lambda index: self._getSearchPositionKey(requests[index]))
+        yield '{"responses": ['
+        responseStrings = {}
+        nextIndex = 0
+        for index in order:
+            try:
+                responseString, _ = self._runSearch(
+                    requests[index], searchOptions, responseClass,
+                    objectGenerator)
+            except exceptions.RuntimeException as exception:
+                responseString = exception.toProtocolElement().toJsonString()
+            except Exception:
+                # The response has already started, so other errors are
+                # also returned as the response to the failed request.
+                logging.getLogger(__name__).exception(
+                    "A request of a batch search failed")
+                error = exceptions.ServerError()
+                responseString = error.toProtocolElement().toJsonString()
+            responseStrings[index] = responseString
+            while nextIndex in responseStrings:
+                if nextIndex > 0:
+                    yield ", "
+                yield responseStrings.pop(nextIndex)
+                nextIndex += 1
+        yield ']}'
+        self.endProfile()
+
+    def _runSearch(
+            self, request, searchOptions, responseClass, objectGenerator):
+        """
+        Fills a page of results for the specified request object and
+        returns the (responseString, nextPageToken) tuple.
+        """
         responseBuilder = protocol.SearchResponseBuilder(
-            responseClass, request.pageSize, self._maxResponseLength)
+            responseClass, request.pageSize, self._maxResponseLength,
+            searchOptions.getFieldMask())
         nextPageToken = None
-        for obj, nextPageToken in objectGenerator(request):
+        objectIterator = objectGenerator(request, searchOptions)
+        for obj, nextPageToken in objectIterator:
             responseBuilder.addValue(obj)
             if responseBuilder.isFull():
                 break
+        if (self._cursorTable is not None and nextPageToken is not None and
+                isinstance(objectIterator, IntervalIterator)):
+            self._cursorTable.save(objectIterator)
         responseBuilder.setNextPageToken(nextPageToken)
         responseString = responseBuilder.getJsonString()
-        self.validateResponse(responseString, responseClass)
-        self.endProfile()
-        return responseString
+        # Partial responses are not valid instances of the response class.
+        if searchOptions.getFieldMask() is None:
+            self.validateResponse(responseString, responseClass)
+        return responseString, nextPageToken
+
+    def _getPrefetchKey(
+            self, request, requestClass, responseClass, searchOptions):
+        """
+        Returns the key used to look up the response to the specified
+        request in the prefetch cache. The same request class is used by
+        searches returning different response classes, so both are part
+        of the key.
+        """
+        return "{}:{}:{}:{}".format(
+            requestClass.__name__, responseClass.__name__,
+            json.dumps(request.toJsonDict(), sort_keys=True),
+            searchOptions.getKey())
+
+    def _prefetchNextPage(
+            self, request, searchOptions, requestClass, responseClass,
+            objectGenerator, nextPageToken):
+        """
+        Schedules the page following the specified request to be computed
+        in the background and stored in the prefetch cache.
+        """
+        nextRequest = requestClass.fromJsonDict(request.toJsonDict())
+        nextRequest.pageToken = nextPageToken
+        key = self._getPrefetchKey(
+            nextRequest, requestClass, responseClass, searchOptions)
+        if self._prefetchCache.reserve(key):
+            try:
+                self._prefetchQueue.put_nowait(
+                    (key, nextRequest, searchOptions, responseClass,
+                     objectGenerator))
+            except Queue.Full:
+                self._prefetchCache.release(key)
+
+    def _prefetchWorker(self, prefetchCache, prefetchQueue):
+        """
+        Computes the pages scheduled by _prefetchNextPage until a None
+        item is read from the queue. Errors are logged but not cached;
+        they are reported when the client actually requests the page.
+        """
+        logger = logging.getLogger(__name__)
+        while True:
+            item = prefetchQueue.get()
+            if item is None:
+                break
+            key, request, searchOptions, responseClass, objectGenerator = \
+                item
+            try:
+                value = self._runSearch(
+                    request, searchOptions, responseClass, objectGenerator)
+                prefetchCache.put(key, value)
+            except Exception:
+                logger.exception("Prefetching a page of results failed")
+            finally:
+                prefetchCache.release(key)
 
-    def searchReadGroupSets(self, request):
+    def searchReadGroupSets(self, request, options=None):
         """
         Returns a GASearchReadGroupSetsResponse for the specified
         GASearchReadGroupSetsRequest object.
@@ -252,9 +1076,9 @@ class AbstractBackend(object):
         return self.runSearchRequest(
             request, protocol.SearchReadGroupSetsRequest,
             protocol.SearchReadGroupSetsResponse,
-            self.readGroupSetsGenerator)
+            self.readGroupSetsGenerator, options)
 
-    def searchReads(self, request):
+    def searchReads(self, request, options=None):
         """
         Returns a GASearchReadsResponse for the specified
         GASearchReadsRequest object.
@@ -262,9 +1086,9 @@ class AbstractBackend(object):
         return self.runSearchRequest(
             request, protocol.SearchReadsRequest,
             protocol.SearchReadsResponse,
-            self.readsGenerator)
+            self.readsGenerator, options)
 
-    def searchReferenceSets(self, request):
+    def searchReferenceSets(self, request, options=None):
         """
         Returns a GASearchReferenceSetsResponse for the specified
         GASearchReferenceSetsRequest object.
@@ -272,9 +1096,9 @@ class AbstractBackend(object):
         return self.runSearchRequest(
             request, protocol.SearchReferenceSetsRequest,
             protocol.SearchReferenceSetsResponse,
-            self.referenceSetsGenerator)
+            self.referenceSetsGenerator, options)
 
-    def searchReferences(self, request):
+    def searchReferences(self, request, options=None):
         """
         Returns a GASearchReferencesResponse for the specified
         GASearchReferencesRequest object.
@@ -282,9 +1106,9 @@ class AbstractBackend(object):
         return self.runSearchRequest(
             request, protocol.SearchReferencesRequest,
             protocol.SearchReferencesResponse,
-            self.referencesGenerator)
+            self.referencesGenerator, options)
 
-    def searchVariantSets(self, request):
+    def searchVariantSets(self, request, options=None):
         """
         Returns a GASearchVariantSetsResponse for the specified
         GASearchVariantSetsRequest object.
@@ -292,9 +1116,9 @@ class AbstractBackend(object):
         return self.runSearchRequest(
             request, protocol.SearchVariantSetsRequest,
             protocol.SearchVariantSetsResponse,
-            self.variantSetsGenerator)
+            self.variantSetsGenerator, options)
 
-    def searchVariants(self, request):
+    def searchVariants(self, request, options=None):
         """
         Returns a GASearchVariantsResponse for the specified
         GASearchVariantsRequest object.
@@ -302,9 +1126,20 @@ class AbstractBackend(object):
         return self.runSearchRequest(
             request, protocol.SearchVariantsRequest,
             protocol.SearchVariantsResponse,
-            self.variantsGenerator)
+            self.variantsGenerator, options)
 
-    def searchCallSets(self, request):
+    def searchAlleleFrequencies(self, request, options=None):
+        """
+        Returns the JSON representation of a page of the allele counts
+        and frequencies in the requested call sets of the variants
+        returned by the specified GASearchVariantsRequest.
+        """
+        return self.runSearchRequest(
+            request, protocol.SearchVariantsRequest,
+            SearchAlleleFrequenciesResponse,
+            self.alleleFrequenciesGenerator, options)
+
+    def searchCallSets(self, request, options=None):
         """
         Returns a GASearchCallSetsResponse for the specified
         GASearchCallSetsRequest Object.
@@ -312,81 +1147,508 @@ class AbstractBackend(object):
         return self.runSearchRequest(
             request, protocol.SearchCallSetsRequest,
             protocol.SearchCallSetsResponse,
-            self.callSetsGenerator)
+            self.callSetsGenerator, options)
+
+    def batchSearchReads(self, request, options=None):
+        """
+        Returns an iterator over the JSON representation of the list of
+        GASearchReadsResponses for the specified batch of
+        GASearchReadsRequests.
+        """
+        return self.runBatchSearchRequest(
+            request, protocol.SearchReadsRequest,
+            protocol.SearchReadsResponse,
+            self.readsGenerator, options)
+
+    def batchSearchVariants(self, request, options=None):
+        """
+        Returns an iterator over the JSON representation of the list of
+        GASearchVariantsResponses for the specified batch of
+        GASearchVariantsRequests.
+        """
+        return self.runBatchSearchRequest(
+            request, protocol.SearchVariantsRequest,
+            protocol.SearchVariantsResponse,
+            self.variantsGenerator, options)
+
+    def runCountRequest(self, requestStr, requestClass, counter, options=None):
+        """
+        Runs the specified count request, which is a string containing a
+        JSON representation of an instance of the specified search
+        requestClass. We return a JSON object holding the number of
+        results of the search in its "count" field. If the options give
+        a binSize, the object also holds the list of the non-empty bins
+        of this many bases starting at the start of the search, with the
+        number of results starting in each, in its "bins" field. The
+        counter is called with the request and the SearchOptions and
+        returns the (count, binCounts) pair; see datamodel.countPositions.
+        """
+        self.startProfile()
+        try:
+            requestDict = json.loads(requestStr)
+        except ValueError:
+            raise exceptions.InvalidJsonException(requestStr)
+        request = self._parseSearchRequest(requestDict, requestClass)
+        searchOptions = SearchOptions(options)
+        count, binCounts = counter(request, searchOptions)
+        response = {"count": count}
+        if binCounts is not None:
+            response["bins"] = [
+                {"start": binStart, "count": binCount}
+                for binStart, binCount in binCounts]
+        self.endProfile()
+        return json.dumps(response)
+
+    def countReads(self, request, options=None):
+        """
+        Returns the JSON representation of the number of reads returned
+        by the specified GASearchReadsRequest.
+        """
+        return self.runCountRequest(
+            request, protocol.SearchReadsRequest, self._countReads, options)
+
+    def countVariants(self, request, options=None):
+        """
+        Returns the JSON representation of the number of variants
+        returned by the specified GASearchVariantsRequest.
+        """
+        return self.runCountRequest(
+            request, protocol.SearchVariantsRequest, self._countVariants,
+            options)
+
+    def _countReads(self, request, searchOptions):
+        readGroup = _getReadGroup(request, self._readGroupIdMap)
+        return readGroup.getReadAlignmentCounts(
+            request.referenceId, request.start, request.end,
+            readFilter=searchOptions.getReadFilter(),
+            binSize=searchOptions.getBinSize())
+
+    def _countVariants(self, request, searchOptions):
+        variantSet = _getVariantSet(request, self._variantSetIdMap)
+        return variantSet.getVariantCounts(
+            request.referenceName, request.start, request.end,
+            request.variantName, request.callSetIds,
+            variantFilter=searchOptions.getVariantFilter(),
+            binSize=searchOptions.getBinSize())
+
+    def exportGenotypeMatrix(self, requestStr, options=None):
+        """
+        Returns an iterator over the pieces of the binary genotype matrix
+        of the variants returned by the specified GASearchVariantsRequest,
+        in the layout described by protocol.GenotypeMatrixFormat. All the
+        variants in the interval are exported, so the pageSize and
+        pageToken of the request are ignored.
+        """
+        self.startProfile()
+        try:
+            requestDict = json.loads(requestStr)
+        except ValueError:
+            raise exceptions.InvalidJsonException(requestStr)
+        request = self._parseSearchRequest(
+            requestDict, protocol.SearchVariantsRequest)
+        searchOptions = SearchOptions(options)
+        variantSet = _getVariantSet(request, self._variantSetIdMap)
+        # The first block is read before the response is started, so
+        # that errors are returned with the right status.
+        callSetIds, blocks = variantSet.getGenotypeMatrix(
+            request.referenceName, request.start, request.end,
+            request.callSetIds,
+            variantFilter=searchOptions.getVariantFilter())
+        firstBlocks = list(itertools.islice(blocks, 1))
+        return self._genotypeMatrixGenerator(
+            callSetIds, itertools.chain(firstBlocks, blocks))
+
+    def _genotypeMatrixGenerator(self, callSetIds, blocks):
+        """
+        Yields the pieces of the genotype matrix for the specified call
+        sets and iterator over blocks.
+        """
+        yield protocol.GenotypeMatrixFormat.encodeHeader(callSetIds)
+        for starts, ends, alleles, genotypeCodes in blocks:
+            yield protocol.GenotypeMatrixFormat.encodeBlock(
+                starts, ends, alleles, genotypeCodes.tostring())
+        yield protocol.GenotypeMatrixFormat.encodeEnd()
+        self.endProfile()
+
+    def runSummaryRequest(
+            self, requestStr, requestClass, summarizer, valueName,
+            options=None):
+        """
+        Runs the specified summary request, which is a string containing
+        a JSON representation of an instance of the specified search
+        requestClass. We return a JSON object holding the size of the
+        bins summarising the interval of the search in its "binSize"
+        field, and the list of the bins with non-zero values, each giving
+        its start and its value in its valueName field, in its "bins"
+        field. The summarizer is called with the request and the
+        SearchOptions, whose binSize is the requested bin size, and
+        returns the (binSize, bins) pair from the precomputed tiles; see
+        datamodel.SummaryTiles.getSummary.
+        """
+        self.startProfile()
+        try:
+            requestDict = json.loads(requestStr)
+        except ValueError:
+            raise exceptions.InvalidJsonException(requestStr)
+        request = self._parseSearchRequest(requestDict, requestClass)
+        searchOptions = SearchOptions(options)
+        binSize, bins = summarizer(request, searchOptions)
+        response = {
+            "binSize": binSize,
+            "bins": [
+                {"start": binStart, valueName: value}
+                for binStart, value in bins]}
+        self.endProfile()
+        return json.dumps(response)
+
+    def summarizeReads(self, request, options=None):
+        """
+        Returns the JSON representation of the precomputed coverage of
+        the interval of the specified GASearchReadsRequest.
+        """
+        return self.runSummaryRequest(
+            request, protocol.SearchReadsRequest, self._summarizeReads,
+            "meanDepth", options)
+
+    def summarizeVariants(self, request, options=None):
+        """
+        Returns the JSON representation of the precomputed density of
+        the variants in the interval of the specified
+        GASearchVariantsRequest.
+        """
+        return self.runSummaryRequest(
+            request, protocol.SearchVariantsRequest,
+            self._summarizeVariants, "count", options)
+
+    def _summarizeReads(self, request, searchOptions):
+        readGroup = _getReadGroup(request, self._readGroupIdMap)
+        if request.referenceId is None:
+            raise exceptions.NotImplementedException(
+                "Read summaries require a referenceId")
+        return readGroup.getCoverageSummary(
+            request.referenceId, request.start, request.end,
+            searchOptions.getBinSize())
+
+    def _summarizeVariants(self, request, searchOptions):
+        variantSet = _getVariantSet(request, self._variantSetIdMap)
+        return variantSet.getVariantDensitySummary(
+            request.referenceName, request.start, request.end,
+            searchOptions.getBinSize())
+
+    def beaconQuery(self, query):
+        """
+        Returns the JSON representation of the BeaconResponseResource
+        answering whether the allele in the specified beacon query is
+        present at its 0-based position. The query is a mapping of the
+        fields of a QueryResource to string values, for example the query
+        parameters of an HTTP request. If the query gives a dataset, the
+        VariantSet with this ID is searched; otherwise all VariantSets
+        are searched.
+        """
+        self.startProfile()
+        queryResource = protocol.QueryResource()
+        for name in ["allele", "chromosome", "position", "reference"]:
+            value = query.get(name)
+            if not value:
+                raise exceptions.BadBeaconQueryException(name, value)
+            setattr(queryResource, name, value)
+        try:
+            queryResource.position = int(queryResource.position)
+        except ValueError:
+            raise exceptions.BadBeaconQueryException(
+                "position", queryResource.position)
+        queryResource.dataset = query.get("dataset")
+        if queryResource.dataset is None:
+            variantSetIds = self._getVariantSetIdsAt(
+                queryResource.chromosome, queryResource.position)
+        elif queryResource.dataset in self._variantSetIdMap:
+            variantSetIds = [queryResource.dataset]
+        else:
+            raise exceptions.VariantSetNotFoundException(
+                queryResource.dataset)
+        allAlleleCounts = [
+            self._variantSetIdMap[variantSetId].getAlleleCounts(
+                queryResource.chromosome, queryResource.position,
+                queryResource.allele)
+            for variantSetId in variantSetIds]
+        allAlleleCounts = [
+            alleleCounts for alleleCounts in allAlleleCounts
+            if alleleCounts is not None]
+        responseResource = protocol.ResponseResource()
+        responseResource.exists = "false"
+        if len(allAlleleCounts) > 0:
+            responseResource.exists = "true"
+            alleleCount = sum(count for count, _ in allAlleleCounts)
+            alleleNumber = sum(number for _, number in allAlleleCounts)
+            responseResource.observed = alleleCount
+            if alleleNumber > 0:
+                alleleResource = protocol.AlleleResource()
+                alleleResource.allele = queryResource.allele
+                alleleResource.frequency = alleleCount / alleleNumber
+                responseResource.frequencies = [alleleResource]
+        beaconResponse = protocol.BeaconResponseResource()
+        beaconResponse.beacon = self.beaconId
+        beaconResponse.query = queryResource
+        beaconResponse.response = responseResource
+        self.endProfile()
+        return beaconResponse.toJsonString()
+
+    def _getVariantSetIdsAt(self, referenceName, position):
+        """
+        Returns the IDs of the VariantSets searched by beacon queries
+        for alleles at the specified position of the specified
+        reference that do not give a dataset.
+        """
+        return self._variantSetIds
+
+    def runGetRequest(self, objectId, objectGetter, options=None):
+        """
+        Returns the JSON representation of the object with the specified
+        ID, which is returned by the specified objectGetter. The getter
+        is called with the ID and the FieldMask of the options, and must
+        return an object with a toJsonString(fieldMask) method.
+        """
+        self.startProfile()
+        fieldMask = SearchOptions(options).getFieldMask()
+        obj = objectGetter(objectId, fieldMask)
+        jsonString = obj.toJsonString(fieldMask)
+        self.endProfile()
+        return jsonString
+
+    def runBatchGetRequest(
+            self, requestStr, valueListName, objectGetter, options=None):
+        """
+        Runs the specified batch get request, which is a string containing
+        a JSON object with a list of object IDs in its "ids" field. We
+        return a JSON object holding the list of the objects with these
+        IDs, in the same order, in its valueListName field. The objects
+        are returned by objectGetter, as for runGetRequest.
+        """
+        self.startProfile()
+        try:
+            requestDict = json.loads(requestStr)
+        except ValueError:
+            raise exceptions.InvalidJsonException(requestStr)
+        if not isinstance(requestDict, dict):
+            raise exceptions.BadIdListException()
+        objectIds = requestDict.get("ids")
+        if not isinstance(objectIds, list) or not all(
+                isinstance(objectId, basestring) for objectId in objectIds):
+            raise exceptions.BadIdListException()
+        fieldMask = SearchOptions(options).getValueFieldMask(valueListName)
+        objects = [objectGetter(objectId, fieldMask) for objectId in objectIds]
+        jsonString = '{{"{}": [{}]}}'.format(valueListName, ", ".join(
+            obj.toJsonString(fieldMask) for obj in objects))
+        self.endProfile()
+        return jsonString
+
+    def getVariant(self, variantId, options=None):
+        """
+        Returns the JSON representation of the Variant with the specified
+        ID.
+        """
+        return self.runGetRequest(variantId, self._getVariant, options)
+
+    def getReadAlignment(self, readId, options=None):
+        """
+        Returns the JSON representation of the ReadAlignment with the
+        specified ID.
+        """
+        return self.runGetRequest(readId, self._getReadAlignment, options)
+
+    def batchGetVariants(self, request, options=None):
+        """
+        Returns the JSON representation of the list of Variants with the
+        IDs in the specified batch get request.
+        """
+        return self.runBatchGetRequest(
+            request, "variants", self._getVariant, options)
+
+    def batchGetReadAlignments(self, request, options=None):
+        """
+        Returns the JSON representation of the list of ReadAlignments
+        with the IDs in the specified batch get request.
+        """
+        return self.runBatchGetRequest(
+            request, "alignments", self._getReadAlignment, options)
+
+    @classmethod
+    def _getParentObject(cls, compoundId, idMap):
+        """
+        Returns the object in idMap whose ID is the prefix of the
+        specified compound ID ending at one of its colons, or None if
+        there is no such object. The IDs of the objects contained in
+        others are formed by appending a colon and a local ID to the ID
+        of their parent, and local IDs such as read names may themselves
+        contain colons.
+        """
+        position = compoundId.find(":")
+        while position != -1:
+            parent = idMap.get(compoundId[:position])
+            if parent is not None:
+                return parent
+            position = compoundId.find(":", position + 1)
+        return None
+
+    def _getVariant(self, variantId, fieldMask=None):
+        variantSet = self._getParentObject(variantId, self._variantSetIdMap)
+        if variantSet is None:
+            raise exceptions.VariantNotFoundException(variantId)
+        if self._transcodeSearchResults:
+            return variantSet.getTranscodedVariant(variantId, fieldMask)
+        return variantSet.getVariant(variantId, fieldMask)
+
+    def _getReadAlignment(self, readId, fieldMask=None):
+        readGroup = self._getParentObject(readId, self._readGroupIdMap)
+        if readGroup is None:
+            raise exceptions.ReadAlignmentNotFoundException(readId)
+        if self._transcodeSearchResults:
+            return readGroup.getTranscodedReadAlignment(readId, fieldMask)
+        return readGroup.getReadAlignment(readId, fieldMask)
 
     # Iterators over the data hieararchy
 
-    def _topLevelObjectGenerator(self, request, idMap, idList):
+    def _topLevelObjectGenerator(
+            self, request, idMap, idList, searchOptions=None):
         """
         Generalisation of the code to iterate over the objects at the top
         of the data hierarchy.
         """
+        return self._objectListGenerator(
+            request, [idMap[objectId] for objectId in idList], searchOptions)
+
+    def _objectListGenerator(self, request, objectList, searchOptions=None):
+        """
+        Returns a generator over the (object, nextPageToken) pairs for the
+        specified list of datamodel objects, where the page token is the
+        index of the next object in the list. Unless a FieldMask is
+        specified in the search options, the cached JSON representations
+        of the objects are returned.
+        """
+        useJsonFragments = (
+            searchOptions is None or searchOptions.getFieldMask() is None)
         currentIndex = 0
         if request.pageToken is not None:
             currentIndex, = _parsePageToken(request.pageToken, 1)
-        while currentIndex < len(idList):
-            objectId = idList[currentIndex]
-            object_ = idMap[objectId]
+        while currentIndex < len(objectList):
+            object_ = objectList[currentIndex]
             currentIndex += 1
             nextPageToken = None
-            if currentIndex < len(idList):
+            if currentIndex < len(objectList):
                 nextPageToken = str(currentIndex)
-            yield object_.toProtocolElement(), nextPageToken
+            if useJsonFragments:
+                yield object_.toJsonFragment(), nextPageToken
+            else:
+                yield object_.toProtocolElement(), nextPageToken
 
-    def readGroupSetsGenerator(self, request):
+    def readGroupSetsGenerator(self, request, searchOptions=None):
         """
         Returns a generator over the (readGroupSet, nextPageToken) pairs
         defined by the specified request.
         """
         return self._topLevelObjectGenerator(
-            request, self._readGroupSetIdMap, self._readGroupSetIds)
+            request, self._readGroupSetIdMap, self._readGroupSetIds,
+            searchOptions)
 
-    def referenceSetsGenerator(self, request):
+    def referenceSetsGenerator(self, request, searchOptions=None):
         """
         Returns a generator over the (referenceSet, nextPageToken) pairs
         defined by the specified request.
         """
         return self._topLevelObjectGenerator(
-            request, self._referenceSetIdMap, self._referenceSetIds)
+            request, self._referenceSetIdMap, self._referenceSetIds,
+            searchOptions)
 
-    def variantSetsGenerator(self, request):
+    def variantSetsGenerator(self, request, searchOptions=None):
         """
         Returns a generator over the (variantSet, nextPageToken) pairs defined
         by the specified request.
         """
         return self._topLevelObjectGenerator(
-            request, self._variantSetIdMap, self._variantSetIds)
+            request, self._variantSetIdMap, self._variantSetIds,
+            searchOptions)
 
-    def readsGenerator(self, request):
+    def readsGenerator(self, request, searchOptions=None):
         """
         Returns a generator over the (read, nextPageToken) pairs defined
         by the specified request
         """
-        intervalIterator = ReadsIntervalIterator(
-            request, self._readGroupIdMap)
+        iteratorClass = ReadsIntervalIterator
+        if self._transcodeSearchResults:
+            iteratorClass = TranscodedReadsIntervalIterator
+        intervalIterator = self._resumeCursor(
+            request, searchOptions, iteratorClass)
+        if intervalIterator is None:
+            intervalIterator = iteratorClass(
+                request, self._readGroupIdMap, searchOptions,
+                self._cursorTable, self._searchPipeline)
         return intervalIterator
 
-    def variantsGenerator(self, request):
+    def variantsGenerator(self, request, searchOptions=None):
         """
         Returns a generator over the (variant, nextPageToken) pairs defined
         by the specified request.
         """
-        intervalIterator = VariantsIntervalIterator(
-            request, self._variantSetIdMap)
+        iteratorClass = VariantsIntervalIterator
+        if self._transcodeSearchResults:
+            iteratorClass = TranscodedVariantsIntervalIterator
+        intervalIterator = self._resumeCursor(
+            request, searchOptions, iteratorClass)
+        if intervalIterator is None:
+            intervalIterator = iteratorClass(
+                request, self._variantSetIdMap, searchOptions,
+                self._cursorTable, self._searchPipeline)
         return intervalIterator
 
-    def callSetsGenerator(self, request):
+    def _resumeCursor(self, request, searchOptions, iteratorClass):
+        """
+        Returns the live IntervalIterator of the specified class that can
+        continue the search for the specified request, or None if there is
+        no such cursor and the search must be restarted from the page
+        token.
+        """
+        if self._cursorTable is None:
+            return None
+        if searchOptions is None:
+            searchOptions = SearchOptions()
+        return self._cursorTable.resume(
+            request, searchOptions, iteratorClass)
+
+    def callSetsGenerator(self, request, searchOptions=None):
         """
         Returns a generator over the (callSet, nextPageToken) pairs defined
-        by the specified request.
+        by the specified request. If a name is specified, only the call
+        sets with this name are returned; if the namePrefix search option
+        is given, only the call sets with names starting with it are.
         """
-        if request.name is not None:
-            raise exceptions.NotImplementedException(
-                "Searching over names is not supported")
         variantSet = _getVariantSet(request, self._variantSetIdMap)
-        return self._topLevelObjectGenerator(
-            request, variantSet.getCallSetIdMap(),
-            variantSet.getCallSetIds())
+        namePrefix = None
+        if searchOptions is not None:
+            namePrefix = searchOptions.getNamePrefix()
+        if request.name is not None:
+            callSets = variantSet.getCallSetsByName(request.name)
+            if namePrefix is not None:
+                callSets = [
+                    callSet for callSet in callSets
+                    if callSet.getSampleName().startswith(namePrefix)]
+        elif namePrefix is not None:
+            callSets = variantSet.getCallSetsByNamePrefix(namePrefix)
+        else:
+            callSets = variantSet.getCallSets()
+        return self._objectListGenerator(request, callSets, searchOptions)
+
+    def alleleFrequenciesGenerator(self, request, searchOptions=None):
+        """
+        Returns a generator over the (alleleFrequencies, nextPageToken)
+        pairs defined by the specified request.
+        """
+        intervalIterator = self._resumeCursor(
+            request, searchOptions, AlleleFrequenciesIntervalIterator)
+        if intervalIterator is None:
+            intervalIterator = AlleleFrequenciesIntervalIterator(
+                request, self._variantSetIdMap, searchOptions,
+                self._cursorTable, self._searchPipeline)
+        return intervalIterator
 
     def startProfile(self):
         """
@@ -447,6 +1709,65 @@ class AbstractBackend(object):
         """
         self._maxResponseLength = maxResponseLength
 
+    def setTranscodeSearchResults(self, transcodeSearchResults):
+        """
+        Enables or disables transcoding the records read by variant and
+        read searches directly into JSON, rather than converting them into
+        ProtocolElements that are then serialised.
+        """
+        self._transcodeSearchResults = transcodeSearchResults
+
+    def setSearchCursors(self, searchCursors, tableSize, timeout):
+        """
+        Enables or disables server-side cursors for interval searches.
+        When enabled, up to tableSize live iterators are kept so that the
+        next page of a search can be read without seeking again. Cursors
+        that have not been used for timeout seconds are discarded.
+        """
+        self._cursorTable = None
+        if searchCursors:
+            self._cursorTable = CursorTable(tableSize, timeout)
+        datamodel.PysamDatamodelMixin.setSearchCursors(searchCursors)
+
+    def setPrefetchNextPage(self, prefetchNextPage, cacheSize, cacheTimeout):
+        """
+        Enables or disables speculative computation of the next page of
+        search results. When enabled, up to cacheSize pages are kept for
+        cacheTimeout seconds after they have been computed.
+        """
+        if self._prefetchQueue is not None:
+            self._prefetchQueue.put(None)
+        self._prefetchCache = None
+        self._prefetchQueue = None
+        if prefetchNextPage:
+            self._prefetchCache = PrefetchCache(cacheSize, cacheTimeout)
+            self._prefetchQueue = Queue.Queue(cacheSize)
+            worker = threading.Thread(
+                target=self._prefetchWorker,
+                args=(self._prefetchCache, self._prefetchQueue))
+            worker.daemon = True
+            worker.start()
+
+    def setPipelinedSearch(self, numWorkers, recordsPerChunk):
+        """
+        Enables running the variant, read and allele frequency searches
+        that transcode their results in a SearchPipeline of numWorkers
+        worker processes, reading chunks of about recordsPerChunk records
+        each, or disables it if numWorkers is 0.
+        """
+        if self._searchPipeline is not None:
+            self._searchPipeline.close()
+        self._searchPipeline = None
+        if numWorkers > 0:
+            self._searchPipeline = SearchPipeline(
+                self, numWorkers, recordsPerChunk)
+
+    def initSearchWorker(self):
+        """
+        Prepares this backend for use in a search worker process, forked
+        from the server process when the SearchPipeline was created.
+        """
+
 
 class EmptyBackend(AbstractBackend):
     """
@@ -484,9 +1805,11 @@ class SimulatedBackend(AbstractBackend):
 
 class FileSystemBackend(AbstractBackend):
     """
-    A GA4GH backend backed by data on the file system
+    A GA4GH backend backed by data on the file system. VariantSets whose
+    variant files take at most inMemoryVariantSetSize bytes are read into
+    memory.
     """
-    def __init__(self, dataDir):
+    def __init__(self, dataDir, inMemoryVariantSetSize=0):
         super(FileSystemBackend, self).__init__()
         self._dataDir = dataDir
         # TODO this code is very ugly and should be regarded as a temporary
@@ -496,8 +1819,9 @@ class FileSystemBackend(AbstractBackend):
         for variantSetId in os.listdir(variantSetDir):
             relativePath = os.path.join(variantSetDir, variantSetId)
             if os.path.isdir(relativePath):
-                self._variantSetIdMap[variantSetId] = \
-                    variants.HtslibVariantSet(variantSetId, relativePath)
+                variantSet = variants.openVariantSet(
+                    variantSetId, relativePath, inMemoryVariantSetSize)
+                self._variantSetIdMap[variantSetId] = variantSet
         self._variantSetIds = sorted(self._variantSetIdMap.keys())
 
         # References
@@ -522,3 +1846,124 @@ class FileSystemBackend(AbstractBackend):
                     self._readGroupIdMap[readGroup.getId()] = readGroup
         self._readGroupSetIds = sorted(self._readGroupSetIdMap.keys())
         self._readGroupIds = sorted(self._readGroupIdMap.keys())
+
+
+class SqliteBackend(AbstractBackend):
+    """
+    A GA4GH backend backed by a SqliteRepository. Listing and search
+    queries for the objects in the repository are answered from its
+    database, and the data files of VariantSets, ReferenceSets,
+    ReadGroupSets and ReadGroups are only opened when their records are
+    requested. VariantSets whose variant files take at most
+    inMemoryVariantSetSize bytes are read into memory.
+    """
+    def __init__(self, repositoryFileName, inMemoryVariantSetSize=0):
+        super(SqliteBackend, self).__init__()
+        self._repository = repository.SqliteRepository(repositoryFileName)
+        self._variantSetIdMap = repository.LazyObjectMap(
+            self._repository, "variantSets",
+            lambda row: self._repository.loadVariantSet(
+                row, inMemoryVariantSetSize))
+        self._variantSetIds = self._repository.getIds("variantSets")
+        self._referenceSetIdMap = repository.LazyObjectMap(
+            self._repository, "referenceSets",
+            self._repository.loadReferenceSet)
+        self._referenceSetIds = self._repository.getIds("referenceSets")
+        self._readGroupSetIdMap = repository.LazyObjectMap(
+            self._repository, "readGroupSets",
+            self._repository.loadReadGroupSet)
+        self._readGroupSetIds = self._repository.getIds("readGroupSets")
+        self._readGroupIdMap = repository.LazyObjectMap(
+            self._repository, "readGroups", self._repository.loadReadGroup)
+        self._readGroupIds = self._repository.getIds("readGroups")
+
+    def initSearchWorker(self):
+        self._repository.reopen()
+
+    def _repositoryListGenerator(
+            self, request, search, protocolClass, searchOptions=None):
+        """
+        Returns a generator over the (object, nextPageToken) pairs for the
+        JSON representations of the protocol elements of the specified
+        class returned by the specified repository search function, which
+        is called with the offset of the first object and the maximum
+        number of objects. As in _objectListGenerator, the page token is
+        the offset of the next object, and the JSON representations are
+        returned as they are unless a FieldMask is specified.
+        """
+        useJsonFragments = (
+            searchOptions is None or searchOptions.getFieldMask() is None)
+        offset = 0
+        if request.pageToken is not None:
+            offset, = _parsePageToken(request.pageToken, 1)
+        # We read one object more than fits in the page to tell whether
+        # there is a next page.
+        jsonStrings = search(offset, request.pageSize + 1)
+        for index, jsonString in enumerate(jsonStrings[:request.pageSize]):
+            nextPageToken = None
+            if index + 1 < len(jsonStrings):
+                nextPageToken = str(offset + index + 1)
+            if useJsonFragments:
+                yield datamodel.JsonFragment(jsonString), nextPageToken
+            else:
+                yield protocolClass.fromJsonString(jsonString), nextPageToken
+
+    def readGroupSetsGenerator(self, request, searchOptions=None):
+        return self._repositoryListGenerator(
+            request,
+            lambda offset, limit: self._repository.searchReadGroupSets(
+                request.datasetIds, request.name, offset, limit),
+            protocol.ReadGroupSet, searchOptions)
+
+    def referenceSetsGenerator(self, request, searchOptions=None):
+        return self._repositoryListGenerator(
+            request,
+            lambda offset, limit: self._repository.searchReferenceSets(
+                request.accessions, request.md5checksums, request.assemblyId,
+                offset, limit),
+            protocol.ReferenceSet, searchOptions)
+
+    def referencesGenerator(self, request, searchOptions=None):
+        """
+        Returns a generator over the (reference, nextPageToken) pairs
+        defined by the specified request.
+        """
+        return self._repositoryListGenerator(
+            request,
+            lambda offset, limit: self._repository.searchReferences(
+                request.referenceSetId, request.accessions,
+                request.md5checksums, offset, limit),
+            protocol.Reference, searchOptions)
+
+    def variantSetsGenerator(self, request, searchOptions=None):
+        return self._repositoryListGenerator(
+            request,
+            lambda offset, limit: self._repository.searchVariantSets(
+                request.datasetIds, offset, limit),
+            protocol.VariantSet, searchOptions)
+
+    def callSetsGenerator(self, request, searchOptions=None):
+        variantSetId = _getVariantSetId(request, self._variantSetIdMap)
+        namePrefix = None
+        if searchOptions is not None:
+            namePrefix = searchOptions.getNamePrefix()
+        return self._repositoryListGenerator(
+            request,
+            lambda offset, limit: self._repository.searchCallSets(
+                variantSetId, request.name, namePrefix, offset, limit),
+            protocol.CallSet, searchOptions)
+
+    def _summarizeVariants(self, request, searchOptions):
+        # The summaries in the repository are used in preference to the
+        # variant density tiles, so that the VariantSet is not opened.
+        variantSetId = _getVariantSetId(request, self._variantSetIdMap)
+        summary = self._repository.getDensitySummary(
+            variantSetId, request.referenceName, request.start, request.end,
+            searchOptions.getBinSize())
+        if summary is None:
+            summary = super(SqliteBackend, self)._summarizeVariants(
+                request, searchOptions)
+        return summary
+
+    def _getVariantSetIdsAt(self, referenceName, position):
+        return self._repository.getVariantSetIdsAt(referenceName, position)
@@ -7,6 +7,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import os
+import glob
 import time
 import argparse
 import sys
@@ -15,6 +17,9 @@ import ga4gh.client as client
 import ga4gh.protocol as protocol
 import ga4gh.converters as converters
 import ga4gh.frontend as frontend
+import ga4gh.datamodel.reads as reads
+import ga4gh.datamodel.variants as variants
+import ga4gh.datamodel.repository as repository
 
 
 # the maximum value of a long type in avro = 2**63 - 1
@@ -253,6 +258,9 @@ def addGlobalOptions(parser):
     parser.add_argument(
         "--dont-use-reloader", default=False, action="store_true",
         help="Don't use the flask reloader")
+    parser.add_argument(
+        "--frontend", default="flask", choices=["flask", "twisted"],
+        help="The frontend used to serve requests (default: %(default)s)")
 
 
 def server_main(parser=None):
@@ -262,9 +270,177 @@ def server_main(parser=None):
     addGlobalOptions(parser)
     args = parser.parse_args()
     frontend.configure(args.config_file, args.config)
-    frontend.app.run(
-        host="0.0.0.0", port=args.port,
-        use_reloader=not args.dont_use_reloader)
+    if args.frontend == "twisted":
+        # Twisted is only imported by the server that uses it.
+        import ga4gh.twistedfrontend as twistedfrontend
+        twistedfrontend.run(frontend.app, "0.0.0.0", args.port)
+    else:
+        frontend.app.run(
+            host="0.0.0.0", port=args.port,
+            use_reloader=not args.dont_use_reloader)
+
+
+##############################################################################
+# Indexing
+##############################################################################
+
+
+def index_variants_main(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(
+            description="Builds the indexes used to search for variants "
+            "by name")
+    parser.add_argument(
+        "paths", nargs="+",
+        help="The VCF/BCF files to index, or VariantSet directories "
+        "containing them")
+    args = parser.parse_args()
+    index_variants_run(args)
+
+
+def index_variants_run(args):
+    for path in args.paths:
+        variantFileNames = [path]
+        if os.path.isdir(path):
+            variantFileNames = sorted(
+                glob.glob(os.path.join(path, "*.vcf.gz")) +
+                glob.glob(os.path.join(path, "*.bcf")))
+        for variantFileName in variantFileNames:
+            numNames = variants.VariantNameIndex.build(variantFileName)
+            print("{}: indexed {} names".format(variantFileName, numNames))
+
+
+def index_reads_main(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(
+            description="Builds the indexes used to get reads by ID")
+    parser.add_argument(
+        "paths", nargs="+",
+        help="The BAM files to index, or ReadGroupSet directories "
+        "containing them")
+    args = parser.parse_args()
+    index_reads_run(args)
+
+
+def index_reads_run(args):
+    for path in args.paths:
+        samFileNames = [path]
+        if os.path.isdir(path):
+            samFileNames = sorted(glob.glob(os.path.join(path, "*.bam")))
+        for samFileName in samFileNames:
+            numReads = reads.ReadNameIndex.build(samFileName)
+            print("{}: indexed {} reads".format(samFileName, numReads))
+
+
+def index_alleles_main(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(
+            description="Builds the indexes used to answer beacon queries")
+    parser.add_argument(
+        "paths", nargs="+",
+        help="The VCF/BCF files to index, or VariantSet directories "
+        "containing them")
+    parser.add_argument(
+        "--bloomFilterBits", type=int,
+        default=variants.VariantAlleleIndex.defaultBloomFilterBits,
+        help="The number of bits of the Bloom filter for each allele, "
+        "or 0 for no Bloom filter")
+    args = parser.parse_args()
+    index_alleles_run(args)
+
+
+def index_alleles_run(args):
+    for path in args.paths:
+        variantFileNames = [path]
+        if os.path.isdir(path):
+            variantFileNames = sorted(
+                glob.glob(os.path.join(path, "*.vcf.gz")) +
+                glob.glob(os.path.join(path, "*.bcf")))
+        for variantFileName in variantFileNames:
+            numAlleles = variants.VariantAlleleIndex.build(
+                variantFileName, bloomFilterBits=args.bloomFilterBits)
+            print("{}: indexed {} alleles".format(
+                variantFileName, numAlleles))
+
+
+def build_tiles_main(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(
+            description="Builds the precomputed coverage and variant "
+            "density summaries used for zoomed out views")
+    parser.add_argument(
+        "paths", nargs="+",
+        help="The BAM and VCF/BCF files to summarise, or ReadGroupSet and "
+        "VariantSet directories containing them")
+    parser.add_argument(
+        "--binSizes", type=int, nargs="+",
+        default=reads.ReadCoverageTiles.defaultBinSizes,
+        help="The sizes of the bins at each zoom level. These must be "
+        "multiples of the smallest bin size.")
+    args = parser.parse_args()
+    build_tiles_run(args)
+
+
+def build_tiles_run(args):
+    for path in args.paths:
+        fileNames = [path]
+        if os.path.isdir(path):
+            fileNames = sorted(
+                glob.glob(os.path.join(path, "*.bam")) +
+                glob.glob(os.path.join(path, "*.vcf.gz")) +
+                glob.glob(os.path.join(path, "*.bcf")))
+        for fileName in fileNames:
+            if fileName.endswith(".bam"):
+                numReads = reads.ReadCoverageTiles.build(
+                    fileName, binSizes=args.binSizes)
+                print("{}: summarised {} reads".format(fileName, numReads))
+            else:
+                numRecords = variants.VariantDensityTiles.build(
+                    fileName, binSizes=args.binSizes)
+                print("{}: summarised {} variants".format(
+                    fileName, numRecords))
+
+
+def ingest_variants_main(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(
+            description="Ingests the VCF/BCF files of VariantSets into the "
+            "columnar stores that the server uses instead of the files")
+    parser.add_argument(
+        "variantSetDirs", nargs="+",
+        help="The VariantSet directories to ingest")
+    args = parser.parse_args()
+    ingest_variants_run(args)
+
+
+def ingest_variants_run(args):
+    for variantSetDir in args.variantSetDirs:
+        numVariants = variants.ColumnarVariantSet.ingest(variantSetDir)
+        print("{}: ingested {} variants".format(variantSetDir, numVariants))
+
+
+def build_repository_main(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(
+            description="Builds the SQLite repository of the datasets in "
+            "data directories, which the server uses when its DATA_SOURCE "
+            "is the repository file")
+    parser.add_argument(
+        "repositoryFile", help="The repository file to write")
+    parser.add_argument(
+        "dataDirs", nargs="+",
+        help="The data directories to add to the repository, each of "
+        "which is a dataset")
+    args = parser.parse_args()
+    build_repository_run(args)
+
+
+def build_repository_run(args):
+    numRows = repository.SqliteRepository.build(
+        args.repositoryFile, args.dataDirs)
+    print("{}: {}".format(args.repositoryFile, ", ".join(
+        "{} {}".format(count, tableName)
+        for tableName, count in sorted(numRows.items()))))
 
 
 ##############################################################################
@@ -512,6 +688,28 @@ class GetReferenceRunner(AbstractGetRunner):
         self._run(self._httpClient.getReference)
 
 
+class GetVariantRunner(AbstractGetRunner):
+    """
+    Runner class for the variants/{id} method
+    """
+    def __init__(self, args):
+        super(GetVariantRunner, self).__init__(args)
+
+    def run(self):
+        self._run(self._httpClient.getVariant)
+
+
+class GetReadAlignmentRunner(AbstractGetRunner):
+    """
+    Runner class for the reads/{id} method
+    """
+    def __init__(self, args):
+        super(GetReadAlignmentRunner, self).__init__(args)
+
+    def run(self):
+        self._run(self._httpClient.getReadAlignment)
+
+
 class BenchmarkRunner(SearchVariantsRunner):
     """
     Runner class for the client side benchmarking. This is intended to give
@@ -780,6 +978,24 @@ def addReferencesGetParser(subparsers):
     addGetArguments(parser)
 
 
+def addVariantsGetParser(subparsers):
+    parser = subparsers.add_parser(
+        "variants-get",
+        description="Get a variant",
+        help="Get a variant")
+    parser.set_defaults(runner=GetVariantRunner)
+    addGetArguments(parser)
+
+
+def addReadsGetParser(subparsers):
+    parser = subparsers.add_parser(
+        "reads-get",
+        description="Get a read alignment",
+        help="Get a read alignment")
+    parser.set_defaults(runner=GetReadAlignmentRunner)
+    addGetArguments(parser)
+
+
 def addReferencesBasesListParser(subparsers):
     parser = subparsers.add_parser(
         "references-list-bases",
@@ -808,6 +1024,8 @@ def client_main(parser=None):
     addReadsSearchParser(subparsers)
     addReferenceSetsGetParser(subparsers)
     addReferencesGetParser(subparsers)
+    addVariantsGetParser(subparsers)
+    addReadsGetParser(subparsers)
     addReferencesBasesListParser(subparsers)
 
     args = parser.parse_args()
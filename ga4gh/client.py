@@ -9,10 +9,18 @@ import json
 import requests
 import posixpath
 import logging
+import collections
+
+import numpy
 
 import ga4gh.protocol as protocol
 
 
+GenotypeMatrix = collections.namedtuple(
+    "GenotypeMatrix",
+    ["callSetIds", "starts", "ends", "alleles", "genotypes"])
+
+
 class HttpClient(object):
     """
     GA4GH Http Client
@@ -115,10 +123,10 @@ class HttpClient(object):
             notDone = False
         return notDone
 
-    def _doRequest(self, httpMethod, url, protocolResponseClass,
-                   httpParams={}, httpData=None):
+    def _sendRequest(self, httpMethod, url, httpParams={}, httpData=None,
+                     stream=False):
         """
-        Performs a request to the server and returns the response
+        Sends a request to the server and returns the HTTP response
         """
         headers = {}
         params = self._getAuth()
@@ -127,9 +135,20 @@ class HttpClient(object):
         if httpData is not None:
             headers.update({"Content-type": "application/json"})
             self._debugRequest(httpData)
+        # Responses are only streamed for binary data
+        streamParams = {"stream": True} if stream else {}
         response = requests.request(
-            httpMethod, url, params=params, data=httpData, headers=headers)
+            httpMethod, url, params=params, data=httpData, headers=headers,
+            **streamParams)
         self._checkStatus(response)
+        return response
+
+    def _doRequest(self, httpMethod, url, protocolResponseClass,
+                   httpParams={}, httpData=None):
+        """
+        Performs a request to the server and returns the response
+        """
+        response = self._sendRequest(httpMethod, url, httpParams, httpData)
         return self._deserializeResponse(response, protocolResponseClass)
 
     def runSearchRequest(self, protocolRequest, objectName,
@@ -193,6 +212,18 @@ class HttpClient(object):
         return self.runGetRequest(
             "references", protocol.Reference, id_)
 
+    def getVariant(self, id_):
+        """
+        Returns a variant from the server
+        """
+        return self.runGetRequest("variants", protocol.Variant, id_)
+
+    def getReadAlignment(self, id_):
+        """
+        Returns a read alignment from the server
+        """
+        return self.runGetRequest("reads", protocol.ReadAlignment, id_)
+
     def listReferenceBases(self, protocolRequest, id_):
         """
         Returns an iterator over the bases from the server
@@ -252,3 +283,81 @@ class HttpClient(object):
         """
         return self.runSearchRequest(
             protocolRequest, "reads", protocol.SearchReadsResponse)
+
+    def exportGenotypeMatrix(self, protocolRequest):
+        """
+        Returns the GenotypeMatrix of the Variants from the server for
+        the specified SearchVariantsRequest. The genotypes are an int8
+        NumPy array of sites by call sets, holding the codes described
+        in protocol.GenotypeMatrixFormat.
+        """
+        fullUrl = posixpath.join(self._urlPrefix, "variants/genotypes")
+        response = self._sendRequest(
+            'POST', fullUrl, httpData=protocolRequest.toJsonString(),
+            stream=True)
+        response.raw.decode_content = True
+        return self.readGenotypeMatrix(response.raw)
+
+    def readGenotypeMatrix(self, stream):
+        """
+        Reads the GenotypeMatrix from the specified binary stream. The
+        coordinates and genotype codes are read directly into the
+        memory of the arrays returned, which grow as the blocks arrive.
+        """
+        formatClass = protocol.GenotypeMatrixFormat
+        magic, numCallSets, callSetIdsLength = formatClass.headerStruct.unpack(
+            self._readBytes(stream, formatClass.headerStruct.size))
+        if magic != formatClass.magic:
+            raise Exception("Not a genotype matrix")
+        callSetIdsString = self._readBytes(
+            stream, callSetIdsLength).decode("utf-8")
+        callSetIds = []
+        if numCallSets > 0:
+            callSetIds = callSetIdsString.split("\n")
+        numSites = 0
+        starts = numpy.empty(0, dtype="<i8")
+        ends = numpy.empty(0, dtype="<i8")
+        genotypes = numpy.empty((0, numCallSets), dtype=numpy.int8)
+        alleles = []
+        while True:
+            numBlockSites, allelesLength = formatClass.blockStruct.unpack(
+                self._readBytes(stream, formatClass.blockStruct.size))
+            if numBlockSites == 0:
+                break
+            end = numSites + numBlockSites
+            if end > len(starts):
+                capacity = max(end, 2 * len(starts))
+                for array in [starts, ends]:
+                    array.resize((capacity,), refcheck=False)
+                genotypes.resize((capacity, numCallSets), refcheck=False)
+            self._readInto(stream, starts[numSites:end])
+            self._readInto(stream, ends[numSites:end])
+            allelesString = self._readBytes(
+                stream, allelesLength).decode("utf-8")
+            for siteAlleles in allelesString.split("\n"):
+                siteAlleles = siteAlleles.split(",")
+                alleles.append((siteAlleles[0], siteAlleles[1:]))
+            self._readInto(stream, genotypes[numSites:end])
+            numSites = end
+        return GenotypeMatrix(
+            callSetIds, starts[:numSites], ends[:numSites], alleles,
+            genotypes[:numSites])
+
+    def _readBytes(self, stream, length):
+        data = numpy.empty(length, dtype=numpy.uint8)
+        self._readInto(stream, data)
+        return data.tostring()
+
+    def _readInto(self, stream, array):
+        """
+        Fills the memory of the specified contiguous array from the
+        specified stream.
+        """
+        buf = memoryview(array.reshape(-1).view(numpy.uint8))
+        position = 0
+        while position < len(buf):
+            numBytes = stream.readinto(buf[position:])
+            if not numBytes:
+                raise Exception("Truncated genotype matrix")
+            position += numBytes
+        self._bytesRead += position
@@ -6,12 +6,19 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import collections
 import glob
 import os
 import json
 import tempfile
 import shutil
 import atexit
+import hashlib
+import mmap
+import struct
+import threading
+
+import numpy
 
 import ga4gh.exceptions as exceptions
 
@@ -26,14 +33,468 @@ def _cleanupHtslibsMess(indexDir):
         shutil.rmtree(indexDir)
 
 
+def countPositions(positions, startPosition=None, binSize=None):
+    """
+    Returns the (count, binCounts) pair for the specified iterator over
+    record start positions. If binSize is None, binCounts is None;
+    otherwise it is the sorted list of (binStart, count) pairs for the
+    non-empty bins of binSize bases starting at startPosition. Records
+    starting before startPosition are counted in the first bin.
+    """
+    if binSize is None:
+        return sum(1 for _ in positions), None
+    if startPosition is None:
+        startPosition = 0
+    binCounts = collections.Counter(
+        (max(position, startPosition) - startPosition) // binSize
+        for position in positions)
+    return sum(binCounts.values()), [
+        (startPosition + binIndex * binSize, count)
+        for binIndex, count in sorted(binCounts.items())]
+
+
+def chooseBinSize(binSizes, start, end, binSize=None, maxNumBins=1000):
+    """
+    Returns the bin size, from the specified sorted list of the bin sizes
+    of summaries, used to summarise the interval from start to end. This
+    is the largest bin size that is not larger than the requested
+    binSize, or, if no binSize is requested, the smallest that gives at
+    most maxNumBins bins over the interval.
+    """
+    if binSize is not None:
+        smaller = [size for size in binSizes if size <= binSize]
+        if len(smaller) == 0:
+            return binSizes[0]
+        return smaller[-1]
+    for size in binSizes:
+        if (end - start) // size < maxNumBins:
+            return size
+    return binSizes[-1]
+
+
+class IntervalIndex(object):
+    """
+    An in-memory index of a list of half-open intervals answering overlap
+    queries in O(log n + k) time. The intervals are sorted by start, and
+    the running maximum of their ends is kept alongside, so that the
+    intervals overlapping a query are found by binary search of both
+    arrays, as in the ColumnarVariantSet.
+    """
+    def __init__(self, starts, ends):
+        starts = numpy.asarray(starts, dtype=numpy.int64)
+        ends = numpy.asarray(ends, dtype=numpy.int64)
+        # A stable sort keeps intervals with the same start in the order
+        # they were given.
+        self._order = numpy.argsort(starts, kind="mergesort")
+        self._starts = starts[self._order]
+        self._ends = ends[self._order]
+        self._maxEnds = self._ends.copy()
+        if len(self._maxEnds) > 0:
+            self._maxEnds = numpy.maximum.accumulate(self._ends)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def getOverlapping(self, start, end, minStart=None):
+        """
+        Returns the numpy array of the positions, in the list the index
+        was built from, of the intervals overlapping the interval from
+        start to end, in order of their start. If minStart is specified,
+        only the intervals starting at or after it are returned.
+        """
+        # The intervals overlapping the query are those after the first
+        # whose running maximum end is after the start, that start before
+        # the end, and that end after the start.
+        first = int(numpy.searchsorted(self._maxEnds, start, "right"))
+        if minStart is not None:
+            first = max(first, int(numpy.searchsorted(
+                self._starts, minStart, "left")))
+        last = max(first, int(numpy.searchsorted(self._starts, end, "left")))
+        rows = numpy.arange(first, last)[self._ends[first:last] > start]
+        return self._order[rows]
+
+
+class JsonFragment(object):
+    """
+    The serialised JSON representation of a GA4GH protocol element,
+    which is written into search responses as it is.
+    """
+    __slots__ = ['_jsonString']
+
+    def __init__(self, jsonString):
+        self._jsonString = jsonString
+
+    def toJsonString(self, fieldMask=None):
+        """
+        Returns the JSON representation of this fragment. Any FieldMask
+        has already been applied when the fragment was serialised, so the
+        fieldMask argument is accepted for compatibility with
+        ProtocolElement and otherwise ignored.
+        """
+        return self._jsonString
+
+
+class TranscodedRecord(JsonFragment):
+    """
+    A search result that has been transcoded directly from a record in
+    the underlying file into the JSON representation of its GA4GH
+    protocol element, without constructing the element. The start and
+    end are the coordinates of the record on the reference, which are
+    needed to page through the results.
+    """
+    __slots__ = ['start', 'end']
+
+    def __init__(self, start, end, jsonString):
+        super(TranscodedRecord, self).__init__(jsonString)
+        self.start = start
+        self.end = end
+
+
+class NameIndex(object):
+    """
+    An on-disk index from the names of the records in a data file to
+    their locations in the file. The index file holds a header giving
+    the size of the data file and the length of any extra data stored
+    by subclasses, followed by the extra data and a sorted array of
+    entries. Each entry starts with a 64 bit hash of a name. The array
+    is memory mapped and searched in O(log n) time. Since different names
+    may have the same hash, the records at the locations returned must be
+    checked for the name.
+    """
+    fileSuffix = ".names"
+    _magic = None
+    _entryStruct = None
+    _invalidIndexException = exceptions.InvalidNameIndexException
+    _headerStruct = struct.Struct(str("<8sQQI"))
+
+    def __init__(self, fileName):
+        self._fileName = fileName
+        with open(fileName, "rb") as indexFile:
+            try:
+                self._data = mmap.mmap(
+                    indexFile.fileno(), 0, access=mmap.ACCESS_READ)
+                (magic, self._dataFileSize, self._numEntries,
+                 extraDataLength) = self._headerStruct.unpack_from(
+                    self._data)
+            except (ValueError, struct.error):
+                raise self._invalidIndexException(fileName)
+        self._extraDataStart = self._headerStruct.size
+        self._entriesStart = self._extraDataStart + extraDataLength
+        expectedSize = (
+            self._entriesStart + self._numEntries * self._entryStruct.size)
+        if magic != self._magic or len(self._data) != expectedSize:
+            raise self._invalidIndexException(fileName)
+
+    def getDataFileSize(self):
+        """
+        Returns the size in bytes of the data file when it was indexed.
+        """
+        return self._dataFileSize
+
+    def checkDataFile(self, dataFileName):
+        """
+        Raises an exception if this index was not built for the current
+        version of the specified data file.
+        """
+        if self._dataFileSize != os.path.getsize(dataFileName):
+            raise self._invalidIndexException(self._fileName)
+
+    @classmethod
+    def getIndexFileName(cls, dataFileName):
+        """
+        Returns the name of the index file for the specified data file.
+        """
+        return dataFileName + cls.fileSuffix
+
+    @classmethod
+    def getNameHash(cls, name):
+        """
+        Returns the 64 bit hash of the specified name.
+        """
+        digest = hashlib.md5(name.encode("utf-8")).digest()
+        return struct.unpack(str("<Q"), digest[:8])[0]
+
+    @classmethod
+    def _write(cls, indexFileName, dataFileName, entries, extraData=b""):
+        """
+        Writes an index file for the specified data file holding the
+        specified entries, which are tuples of the fields of _entryStruct
+        starting with the name hash, and the specified extra data.
+        """
+        entries.sort()
+        with open(indexFileName, "wb") as indexFile:
+            indexFile.write(cls._headerStruct.pack(
+                cls._magic, os.path.getsize(dataFileName), len(entries),
+                len(extraData)))
+            indexFile.write(extraData)
+            for entry in entries:
+                indexFile.write(cls._entryStruct.pack(*entry))
+
+    def _getExtraData(self):
+        """
+        Returns a copy of the extra data stored in the index file.
+        """
+        return self._data[self._extraDataStart:self._entriesStart]
+
+    def _getHash(self, entryIndex):
+        return struct.unpack_from(
+            str("<Q"), self._data,
+            self._entriesStart + entryIndex * self._entryStruct.size)[0]
+
+    def _getEntries(self, name):
+        """
+        Returns the list of entries that may be for the specified name,
+        in the order of their fields.
+        """
+        return self._getEntriesForHash(self.getNameHash(name))
+
+    def _getEntriesForHash(self, nameHash):
+        """
+        Returns the list of entries with the specified name hash, in the
+        order of their fields.
+        """
+        low, high = 0, self._numEntries
+        while low < high:
+            middle = (low + high) // 2
+            if self._getHash(middle) < nameHash:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self._numEntries and self._getHash(low) == nameHash:
+            entries.append(self._entryStruct.unpack_from(
+                self._data,
+                self._entriesStart + low * self._entryStruct.size))
+            low += 1
+        return entries
+
+
+class SummaryTiles(object):
+    """
+    A file of precomputed summaries of the records in a data file, used
+    to answer zoomed out queries without reading the records. For each
+    reference, the file holds an array of values for consecutive bins
+    at each of several bin sizes (zoom levels). The file starts with a
+    header giving the size of the data file, the number of bin sizes and
+    references and the length of the reference names, followed by the
+    bin sizes, the reference names, the number of bins for each
+    reference and bin size, and the arrays of 32 bit values. The file is
+    memory mapped, so only the bins that are asked for are read.
+    """
+    fileSuffix = ".tiles"
+    defaultBinSizes = [1000, 10000, 100000, 1000000]
+    defaultMaxNumBins = 1000
+    maxValue = 2**32 - 1
+    _magic = None
+    _invalidTilesException = exceptions.InvalidSummaryTilesException
+    _headerStruct = struct.Struct(str("<8sQIII"))
+    _valueStruct = struct.Struct(str("<I"))
+
+    def __init__(self, fileName):
+        self._fileName = fileName
+        with open(fileName, "rb") as tilesFile:
+            try:
+                self._data = mmap.mmap(
+                    tilesFile.fileno(), 0, access=mmap.ACCESS_READ)
+                (magic, self._dataFileSize, numBinSizes, numReferences,
+                 namesLength) = self._headerStruct.unpack_from(self._data)
+                offset = self._headerStruct.size
+                self._binSizes = self._unpackValues(offset, numBinSizes)
+                offset += numBinSizes * self._valueStruct.size
+                names = self._data[offset:offset + namesLength]
+                offset += namesLength
+                numBinsList = self._unpackValues(
+                    offset, numReferences * numBinSizes)
+                offset += len(numBinsList) * self._valueStruct.size
+            except (ValueError, struct.error):
+                raise self._invalidTilesException(fileName)
+        referenceNames = []
+        if numReferences > 0:
+            referenceNames = names.decode("utf-8").split("\n")
+        if magic != self._magic or len(referenceNames) != numReferences:
+            raise self._invalidTilesException(fileName)
+        # Maps (referenceName, binSize) to the (offset, numBins) pair of
+        # the array of values.
+        self._tiles = {}
+        numBinsIter = iter(numBinsList)
+        for referenceName in referenceNames:
+            for binSize in self._binSizes:
+                numBins = next(numBinsIter)
+                self._tiles[referenceName, binSize] = offset, numBins
+                offset += numBins * self._valueStruct.size
+        if len(self._data) != offset:
+            raise self._invalidTilesException(fileName)
+
+    def _unpackValues(self, offset, numValues):
+        return list(struct.unpack_from(
+            str("<{}I").format(numValues), self._data, offset))
+
+    def getDataFileSize(self):
+        """
+        Returns the size in bytes of the data file when it was summarised.
+        """
+        return self._dataFileSize
+
+    def checkDataFile(self, dataFileName):
+        """
+        Raises an exception if these tiles were not built for the current
+        version of the specified data file.
+        """
+        if self._dataFileSize != os.path.getsize(dataFileName):
+            raise self._invalidTilesException(self._fileName)
+
+    def getBinSizes(self):
+        """
+        Returns the sorted list of the bin sizes of the zoom levels.
+        """
+        return self._binSizes
+
+    @classmethod
+    def getTilesFileName(cls, dataFileName):
+        """
+        Returns the name of the tiles file for the specified data file.
+        """
+        return dataFileName + cls.fileSuffix
+
+    def chooseBinSize(self, start, end, binSize=None):
+        """
+        Returns the bin size of these tiles used to summarise the
+        interval from start to end; see chooseBinSize.
+        """
+        return chooseBinSize(
+            self._binSizes, start, end, binSize, self.defaultMaxNumBins)
+
+    def getSummary(self, referenceName, start=None, end=None, binSize=None):
+        """
+        Returns the (binSize, bins) pair summarising the specified
+        interval of the specified reference, where bins is the list of
+        (binStart, value) pairs for the bins with non-zero values that
+        overlap the interval, in order. The binSize is chosen by
+        chooseBinSize.
+        """
+        if start is None:
+            start = 0
+        if end is None:
+            end = 2**31 - 1
+        binSize = self.chooseBinSize(start, end, binSize)
+        if (referenceName, binSize) not in self._tiles:
+            return binSize, []
+        offset, numBins = self._tiles[referenceName, binSize]
+        firstBin = min(start // binSize, numBins)
+        lastBin = min((end + binSize - 1) // binSize, numBins)
+        values = self._unpackValues(
+            offset + firstBin * self._valueStruct.size, lastBin - firstBin)
+        return binSize, [
+            ((firstBin + i) * binSize, value)
+            for i, value in enumerate(values) if value != 0]
+
+    @classmethod
+    def _addValue(cls, values, binIndex, value):
+        """
+        Adds the specified value to the bin with the specified index in
+        the list of bin values, extending the list as needed.
+        """
+        if binIndex >= len(values):
+            values.extend([0] * (binIndex + 1 - len(values)))
+        values[binIndex] += value
+
+    @classmethod
+    def _write(cls, tilesFileName, dataFileName, binSizes, tiles):
+        """
+        Writes a tiles file for the specified data file. The tiles map
+        reference names to the lists of the values of the bins of the
+        smallest of the specified bin sizes; the other bin sizes must be
+        multiples of this, and their values are the sums of these.
+        """
+        binSizes = sorted(set(binSizes))
+        if any(binSize % binSizes[0] != 0 for binSize in binSizes):
+            raise ValueError(
+                "Bin sizes must be multiples of the smallest bin size")
+        referenceNames = sorted(tiles.keys())
+        arrays = []
+        for referenceName in referenceNames:
+            values = tiles[referenceName]
+            for binSize in binSizes:
+                factor = binSize // binSizes[0]
+                arrays.append([
+                    min(sum(values[i:i + factor]), cls.maxValue)
+                    for i in range(0, len(values), factor)])
+        names = "\n".join(referenceNames).encode("utf-8")
+        with open(tilesFileName, "wb") as tilesFile:
+            tilesFile.write(cls._headerStruct.pack(
+                cls._magic, os.path.getsize(dataFileName), len(binSizes),
+                len(referenceNames), len(names)))
+            tilesFile.write(cls._packValues(binSizes))
+            tilesFile.write(names)
+            tilesFile.write(cls._packValues([len(array) for array in arrays]))
+            for array in arrays:
+                tilesFile.write(cls._packValues(array))
+
+    @classmethod
+    def _packValues(cls, values):
+        return struct.pack(str("<{}I").format(len(values)), *values)
+
+
 class DatamodelObject(object):
     """
     Superclass of all datamodel types
     """
+    _jsonFragment = None
+
     def __init__(self):
         # TODO move common functionality into this class from subclasses
         pass
 
+    def toJsonFragment(self):
+        """
+        Returns the JsonFragment for the protocol element of this object.
+        Objects do not change after they have been loaded from the data
+        source, so this is serialised only once; reloading the data
+        source creates new objects.
+        """
+        if self._jsonFragment is None:
+            self._jsonFragment = JsonFragment(
+                self.toProtocolElement().toJsonString())
+        return self._jsonFragment
+
+
+class HtslibFilePool(object):
+    """
+    The pysam files opened by a DatamodelObject to run searches. Each
+    thread, and each process forked from the one that made the pool, has
+    its own files, so that concurrent searches never share a file
+    handle. At most maxSize files are kept for each thread, and the least
+    recently used file is dropped first; if maxSize is None, all the
+    files are kept.
+    """
+    def __init__(self, maxSize=None):
+        self._maxSize = maxSize
+        self._local = threading.local()
+
+    def _getFiles(self):
+        processId = os.getpid()
+        if getattr(self._local, "processId", None) != processId:
+            self._local.processId = processId
+            self._local.files = collections.OrderedDict()
+        return self._local.files
+
+    def get(self, key, openFile):
+        """
+        Returns the file of the calling thread for the specified key,
+        calling openFile to open it if there is none.
+        """
+        files = self._getFiles()
+        pysamFile = files.pop(key, None)
+        if pysamFile is None:
+            pysamFile = openFile()
+            while self._maxSize is not None and len(files) >= self._maxSize:
+                files.popitem(last=False)
+        files[key] = pysamFile
+        return pysamFile
+
+    def __len__(self):
+        return len(self._getFiles())
+
 
 class PysamDatamodelMixin(object):
     """
@@ -50,6 +511,19 @@ class PysamDatamodelMixin(object):
 
     maxStringLength = 2**10  # arbitrary
 
+    # Whether search iterators may be kept open between pages as search
+    # cursors, and interleaved with other searches.
+    searchCursors = False
+
+    @classmethod
+    def setSearchCursors(cls, searchCursors):
+        """
+        Sets whether the iterators returned by searches may be kept open
+        as search cursors. These need their own file handles, which are
+        only opened for each search when this is True.
+        """
+        PysamDatamodelMixin.searchCursors = searchCursors
+
     @classmethod
     def sanitizeVariantFileFetch(cls, contig=None, start=None, stop=None):
         if contig is not None:
@@ -7,7 +7,11 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import datetime
+import heapq
+import itertools
+import json
 import os
+import struct
 
 import pysam
 
@@ -16,6 +20,33 @@ import ga4gh.datamodel as datamodel
 import ga4gh.exceptions as exceptions
 
 
+def getReferenceEnd(read):
+    """
+    Returns the end on the reference of the specified pysam alignment,
+    which is computed by htslib from its CIGAR. Reads without a reference
+    span, such as unmapped reads, cover the base at their start.
+    """
+    if read.reference_end is None:
+        return read.reference_start + 1
+    return read.reference_end
+
+
+def getReadAlignmentEnd(readAlignment):
+    """
+    Returns the end on the reference of the specified ReadAlignment, from
+    the lengths of the operations of its CIGAR that consume the
+    reference. Alignments without a CIGAR, such as those whose CIGAR is
+    not selected by a FieldMask, are taken to span their sequence.
+    """
+    position = readAlignment.alignment.position.position
+    if not readAlignment.alignment.cigar:
+        return position + max(len(readAlignment.alignedSequence or ""), 1)
+    return position + sum(
+        cigarUnit.operationLength
+        for cigarUnit in readAlignment.alignment.cigar
+        if cigarUnit.operation in SamCigar.referenceOperations)
+
+
 class SamCigar(object):
     """
     Utility class for working with SAM CIGAR strings
@@ -33,6 +64,14 @@ class SamCigar(object):
         protocol.CigarOperation.SEQUENCE_MATCH,
         protocol.CigarOperation.SEQUENCE_MISMATCH,
     ]
+    # The operations that consume bases of the reference.
+    referenceOperations = frozenset([
+        protocol.CigarOperation.ALIGNMENT_MATCH,
+        protocol.CigarOperation.DELETE,
+        protocol.CigarOperation.SKIP,
+        protocol.CigarOperation.SEQUENCE_MATCH,
+        protocol.CigarOperation.SEQUENCE_MISMATCH,
+    ])
 
     @classmethod
     def ga2int(cls, value):
@@ -51,6 +90,7 @@ class SamFlags(object):
     """
     NUMBER_READS = 0x1
     PROPER_PLACEMENT = 0x2
+    UNMAPPED = 0x4
     READ_NUMBER_ONE = 0x40
     READ_NUMBER_TWO = 0x80
     SECONDARY_ALIGNMENT = 0x100
@@ -66,6 +106,265 @@ class SamFlags(object):
     def setFlag(flagAttr, flag):
         flagAttr |= flag
 
+    @classmethod
+    def decode(cls, flagAttr):
+        """
+        Returns the (duplicateFragment, failedVendorQualityChecks,
+        properPlacement, secondaryAlignment, supplementaryAlignment,
+        numberReads, readNumber) tuple of GA4GH ReadAlignment values
+        for the specified SAM flag.
+        """
+        return cls._decodeTable[flagAttr & 0xfff]
+
+    @classmethod
+    def _decodeFlag(cls, flagAttr):
+        # TODO Is this the correct mapping between numberReads and
+        # sam flag 0x1? What about the mapping between numberReads
+        # and 0x40 and 0x80?
+        numberReads = None
+        readNumber = None
+        if cls.isFlagSet(flagAttr, cls.NUMBER_READS):
+            numberReads = 2
+            if cls.isFlagSet(flagAttr, cls.READ_NUMBER_ONE):
+                readNumber = 0
+            elif cls.isFlagSet(flagAttr, cls.READ_NUMBER_TWO):
+                readNumber = 1
+        return (
+            cls.isFlagSet(flagAttr, cls.DUPLICATE_FRAGMENT),
+            cls.isFlagSet(flagAttr, cls.FAILED_VENDOR_QUALITY_CHECKS),
+            cls.isFlagSet(flagAttr, cls.PROPER_PLACEMENT),
+            cls.isFlagSet(flagAttr, cls.SECONDARY_ALIGNMENT),
+            cls.isFlagSet(flagAttr, cls.SUPPLEMENTARY_ALIGNMENT),
+            numberReads, readNumber)
+
+
+# Decoding the flags of every read is a significant part of the cost of
+# converting reads, so we decode all of the 12 bit flag values up front.
+SamFlags._decodeTable = [SamFlags._decodeFlag(flag) for flag in range(4096)]
+
+
+class ReadFilter(object):
+    """
+    A set of predicates on the flags and fields of pysam alignments,
+    evaluated before the alignments are converted into GA4GH objects.
+    If maxDepth is specified, the reads are also downsampled so that at
+    most maxDepth reads starting in each window of windowSize bases are
+    returned. Downsampling is deterministic: the reads kept in a window
+    are those with the smallest hashes of their query names and the
+    seed, so they do not depend on the search or the order of the file,
+    and both reads of a pair starting in the same window are usually
+    kept or dropped together.
+    """
+    def __init__(
+            self, excludeDuplicates=False, excludeSecondary=False,
+            excludeFailedQualityChecks=False, minMappingQuality=None,
+            mappedOnly=False, maxDepth=None, windowSize=50, seed=0):
+        self._excludedFlags = 0
+        if excludeDuplicates:
+            self._excludedFlags |= SamFlags.DUPLICATE_FRAGMENT
+        if excludeSecondary:
+            self._excludedFlags |= SamFlags.SECONDARY_ALIGNMENT
+        if excludeFailedQualityChecks:
+            self._excludedFlags |= SamFlags.FAILED_VENDOR_QUALITY_CHECKS
+        if mappedOnly:
+            self._excludedFlags |= SamFlags.UNMAPPED
+        self._minMappingQuality = minMappingQuality
+        self._maxDepth = maxDepth
+        self._windowSize = windowSize
+        self._seed = seed
+
+    def accepts(self, read):
+        """
+        Returns True if the specified pysam alignment passes the flag and
+        field predicates of this filter.
+        """
+        if read.flag & self._excludedFlags != 0:
+            return False
+        if (self._minMappingQuality is not None and
+                read.mapping_quality < self._minMappingQuality):
+            return False
+        return True
+
+    def getFetchStart(self, start):
+        """
+        Returns the position from which reads must be fetched to return
+        the reads overlapping the specified start position. When
+        downsampling, this is the start of the window, so that all the
+        reads competing for the window are read; the reads starting in
+        earlier windows are handled by fetchReads.
+        """
+        if self._maxDepth is None or start is None:
+            return start
+        return start - start % self._windowSize
+
+    def getFetchEnd(self, end):
+        """
+        Returns the position up to which reads must be fetched to return
+        the reads starting before the specified end position. When
+        downsampling, this is the end of the window.
+        """
+        if self._maxDepth is None or end is None:
+            return end
+        return end + (-end) % self._windowSize
+
+    def getSamplingKey(self, read):
+        """
+        Returns the key ordering the specified pysam alignment among the
+        reads of its window, the smallest keys being kept.
+        """
+        return datamodel.NameIndex.getNameHash(
+            "{}:{}".format(self._seed, read.query_name))
+
+    def fetchReads(self, fetch, start=None, end=None):
+        """
+        Returns an iterator over the reads that pass this filter, overlap
+        the specified start position and start before the specified end
+        position. The reads are read with fetch(fetchStart, fetchEnd),
+        which returns an iterator over the reads overlapping an interval,
+        sorted by position. When downsampling, every window with a read
+        overlapping start is read in full, so that the reads kept do not
+        depend on the interval.
+        """
+        fetchStart = self.getFetchStart(start)
+        reads = fetch(fetchStart, self.getFetchEnd(end))
+        if self._maxDepth is not None and fetchStart is not None:
+            # The reads overlapping fetchStart that start in earlier
+            # windows are fetched without the reads of their windows that
+            # end before it, so the reads are fetched again from the start
+            # of the window of the first one.
+            firstRead = next(reads, None)
+            if firstRead is None:
+                return iter([])
+            firstWindowStart = self.getFetchStart(firstRead.reference_start)
+            if firstWindowStart < fetchStart:
+                reads = fetch(firstWindowStart, self.getFetchEnd(end))
+            else:
+                reads = itertools.chain([firstRead], reads)
+        return self.filterReads(reads, start, end)
+
+    def filterReads(self, reads, start=None, end=None):
+        """
+        Returns an iterator over the reads in the specified iterator that
+        pass this filter, and that overlap the specified start position
+        and start before the specified end position. The reads must be
+        sorted by position.
+        """
+        reads = itertools.ifilter(self.accepts, reads)
+        if self._maxDepth is not None:
+            reads = self._downsample(reads)
+            if start is not None:
+                reads = itertools.ifilter(
+                    lambda read: getReferenceEnd(read) > start, reads)
+            if end is not None:
+                reads = itertools.ifilter(
+                    lambda read: read.reference_start < end, reads)
+        return reads
+
+    def _downsample(self, reads):
+        windows = itertools.groupby(
+            reads, lambda read: read.reference_start // self._windowSize)
+        for _, windowReads in windows:
+            windowReads = list(windowReads)
+            if len(windowReads) > self._maxDepth:
+                # The position in the file breaks ties between the reads
+                # of a pair.
+                keys = [
+                    (self.getSamplingKey(read), index)
+                    for index, read in enumerate(windowReads)]
+                keptIndexes = set(
+                    index for _, index in heapq.nsmallest(
+                        self._maxDepth, keys))
+                windowReads = [
+                    read for index, read in enumerate(windowReads)
+                    if index in keptIndexes]
+            for read in windowReads:
+                yield read
+
+
+class ReadNameIndex(datamodel.NameIndex):
+    """
+    An on-disk index from the query names of the alignments in a BAM file
+    to their BGZF virtual offsets in the file. The entries are (nameHash,
+    virtualOffset) pairs, so the alignments with a given name are read by
+    seeking directly to them.
+    """
+    _magic = b"GA4GHRNI"
+    _entryStruct = struct.Struct(str("<QQ"))
+    _invalidIndexException = exceptions.InvalidReadNameIndexException
+
+    @classmethod
+    def build(cls, samFileName, indexFileName=None):
+        """
+        Writes the index of the query names of the alignments in the
+        specified BAM file to indexFileName, or to the default index file
+        name for the BAM file if this is not specified. Returns the number
+        of alignments indexed.
+        """
+        if indexFileName is None:
+            indexFileName = cls.getIndexFileName(samFileName)
+        samFile = pysam.AlignmentFile(samFileName)
+        entries = []
+        while True:
+            virtualOffset = samFile.tell()
+            try:
+                read = next(samFile)
+            except StopIteration:
+                break
+            entries.append((cls.getNameHash(read.query_name), virtualOffset))
+        cls._write(indexFileName, samFileName, entries)
+        return len(entries)
+
+    def getVirtualOffsets(self, name):
+        """
+        Returns the list of virtual offsets of the alignments that may
+        have the specified query name, in the order of the file.
+        """
+        return [virtualOffset for _, virtualOffset in self._getEntries(name)]
+
+
+class ReadCoverageTiles(datamodel.SummaryTiles):
+    """
+    Precomputed coverage of the reference by the alignments in a BAM
+    file. The value of each bin is the number of aligned bases in the
+    bin. As in samtools depth, unmapped, secondary and duplicate
+    alignments and those failing quality checks are not counted.
+    """
+    _magic = b"GA4GHRCT"
+    _excludedFlags = (
+        SamFlags.UNMAPPED | SamFlags.SECONDARY_ALIGNMENT |
+        SamFlags.FAILED_VENDOR_QUALITY_CHECKS | SamFlags.DUPLICATE_FRAGMENT)
+
+    @classmethod
+    def build(cls, samFileName, tilesFileName=None, binSizes=None):
+        """
+        Writes the coverage tiles for the specified BAM file to
+        tilesFileName, or to the default tiles file name for the BAM file
+        if this is not specified, at the specified bin sizes. Returns the
+        number of alignments counted.
+        """
+        if tilesFileName is None:
+            tilesFileName = cls.getTilesFileName(samFileName)
+        if binSizes is None:
+            binSizes = cls.defaultBinSizes
+        binSize = min(binSizes)
+        samFile = pysam.AlignmentFile(samFileName)
+        referenceNames = samFile.references
+        tiles = {}
+        numReads = 0
+        for read in samFile:
+            if read.flag & cls._excludedFlags != 0:
+                continue
+            numReads += 1
+            values = tiles.setdefault(referenceNames[read.reference_id], [])
+            for blockStart, blockEnd in read.get_blocks():
+                while blockStart < blockEnd:
+                    binIndex = blockStart // binSize
+                    binEnd = min((binIndex + 1) * binSize, blockEnd)
+                    cls._addValue(values, binIndex, binEnd - blockStart)
+                    blockStart = binEnd
+        cls._write(tilesFileName, samFileName, binSizes, tiles)
+        return numReads
+
 
 class AbstractReadGroupSet(datamodel.DatamodelObject):
     """
@@ -128,7 +427,7 @@ class HtslibReadGroupSet(datamodel.PysamDatamodelMixin, AbstractReadGroupSet):
         self._readGroups.append(readGroup)
 
 
-class AbstractReadGroup(object):
+class AbstractReadGroup(datamodel.DatamodelObject):
     """
     Class representing a ReadGroup. A ReadGroup is all the data that's
     processed the same way by the sequencer.  There are typically 1-10
@@ -167,6 +466,70 @@ class AbstractReadGroup(object):
         readGroup.sampleId = None
         return readGroup
 
+    def getReadAlignmentCounts(
+            self, referenceId=None, start=None, end=None, readFilter=None,
+            binSize=None):
+        """
+        Returns the (count, binCounts) pair for the reads that
+        getReadAlignments returns for the same parameters; see
+        datamodel.countPositions.
+        """
+        readAlignments = self.getReadAlignments(
+            referenceId, start, end, readFilter=readFilter)
+        return datamodel.countPositions(
+            (readAlignment.alignment.position.position
+             for readAlignment in readAlignments), start, binSize)
+
+    def getCoverageSummary(
+            self, referenceId, start=None, end=None, binSize=None):
+        """
+        Returns the (binSize, bins) pair summarising the coverage of the
+        specified interval of the reference with the specified ID, where
+        bins is the list of (binStart, meanDepth) pairs for the covered
+        bins, from the precomputed ReadCoverageTiles. See
+        SummaryTiles.getSummary.
+        """
+        raise exceptions.SummaryTilesNotFoundException(self.getId())
+
+    def getTranscodedReadAlignments(
+            self, referenceId=None, start=None, end=None, fieldMask=None,
+            readFilter=None, minStart=None):
+        """
+        Returns an iterator over the specified reads as TranscodedRecords
+        holding their JSON representations. The parameters are the same
+        as those of getReadAlignments.
+        """
+        for readAlignment in self.getReadAlignments(
+                referenceId, start, end, fieldMask, readFilter, minStart):
+            yield datamodel.TranscodedRecord(
+                readAlignment.alignment.position.position,
+                getReadAlignmentEnd(readAlignment),
+                readAlignment.toJsonString(fieldMask))
+
+    def getReadAlignment(self, readId, fieldMask=None):
+        """
+        Returns the ReadAlignment with the specified ID. If several reads
+        have the ID, because they are alignments of the same fragment,
+        the first one is returned. The fieldMask is the same as that of
+        getReadAlignments.
+        """
+        for readAlignment in self.getReadAlignments(fieldMask=fieldMask):
+            if readAlignment.id == readId:
+                return readAlignment
+        raise exceptions.ReadAlignmentNotFoundException(readId)
+
+    def getTranscodedReadAlignment(self, readId, fieldMask=None):
+        """
+        Returns the ReadAlignment with the specified ID as a
+        TranscodedRecord. The parameters are the same as those of
+        getReadAlignment.
+        """
+        readAlignment = self.getReadAlignment(readId, fieldMask)
+        return datamodel.TranscodedRecord(
+            readAlignment.alignment.position.position,
+            getReadAlignmentEnd(readAlignment),
+            readAlignment.toJsonString(fieldMask))
+
 
 class SimulatedReadGroup(AbstractReadGroup):
     """
@@ -175,7 +538,12 @@ class SimulatedReadGroup(AbstractReadGroup):
     def __init__(self, id_):
         super(SimulatedReadGroup, self).__init__(id_)
 
-    def getReadAlignments(self, referenceId=None, start=None, end=None):
+    def getReadAlignments(
+            self, referenceId=None, start=None, end=None, fieldMask=None,
+            readFilter=None, minStart=None):
+        if readFilter is not None:
+            raise exceptions.NotImplementedException(
+                "Read filters are not supported for simulated data")
         for i in range(2):
             alignment = self._createReadAlignment(i)
             yield alignment
@@ -213,6 +581,11 @@ class HtslibReadGroup(datamodel.PysamDatamodelMixin, AbstractReadGroup):
     """
     A readgroup based on htslib's reading of a given file
     """
+    # CigarUnits are shared between all the reads with the same
+    # (operation, length) pair, up to this number of distinct pairs.
+    maxCigarUnitCacheSize = 2**12
+    _cigarUnitCache = {}
+
     def __init__(self, id_, dataFile):
         super(HtslibReadGroup, self).__init__(id_)
         self._samFilePath = dataFile
@@ -220,6 +593,53 @@ class HtslibReadGroup(datamodel.PysamDatamodelMixin, AbstractReadGroup):
             self._samFile = pysam.AlignmentFile(dataFile)
         except ValueError:
             raise exceptions.FileOpenFailedException(dataFile)
+        self._searchFiles = datamodel.HtslibFilePool()
+        self._referenceNames = self._samFile.references
+        self._readNameIndex = None
+        indexFileName = ReadNameIndex.getIndexFileName(dataFile)
+        if os.path.exists(indexFileName):
+            self._readNameIndex = ReadNameIndex(indexFileName)
+            self._readNameIndex.checkDataFile(dataFile)
+        self._coverageTiles = None
+        tilesFileName = ReadCoverageTiles.getTilesFileName(dataFile)
+        if os.path.exists(tilesFileName):
+            self._coverageTiles = ReadCoverageTiles(tilesFileName)
+            self._coverageTiles.checkDataFile(dataFile)
+
+    def _getReferenceName(self, referenceId):
+        """
+        Returns the name of the reference with the specified ID in the
+        sam file.
+        """
+        if 0 <= referenceId < len(self._referenceNames):
+            return self._referenceNames[referenceId]
+        # Let pysam raise the appropriate error.
+        return self._samFile.getrname(referenceId)
+
+    @classmethod
+    def _getCigarUnit(cls, operation, length):
+        """
+        Returns a CigarUnit for the specified pysam CIGAR operation and
+        length. CigarUnits are shared, and must not be modified.
+        """
+        key = operation, length
+        cigarUnit = cls._cigarUnitCache.get(key)
+        if cigarUnit is None:
+            cigarUnit = protocol.CigarUnit()
+            cigarUnit.operation = SamCigar.int2ga(operation)
+            cigarUnit.operationLength = length
+            cigarUnit.referenceSequence = None  # TODO fix this!
+            if len(cls._cigarUnitCache) < cls.maxCigarUnitCacheSize:
+                cls._cigarUnitCache[key] = cigarUnit
+        return cigarUnit
+
+    def _getSearchFile(self):
+        """
+        Returns the calling thread's AlignmentFile for the sam file.
+        """
+        return self._searchFiles.get(
+            self._samFilePath,
+            lambda: pysam.AlignmentFile(self._samFilePath))
 
     def getSamFilePath(self):
         """
@@ -227,78 +647,235 @@ class HtslibReadGroup(datamodel.PysamDatamodelMixin, AbstractReadGroup):
         """
         return self._samFilePath
 
-    def getReadAlignments(self, referenceId=None, start=None, end=None):
+    def _getReads(self, referenceId, start, end, readFilter, minStart=None):
         """
-        Returns an iterator over the specified reads
+        Returns an iterator over the pysam alignments for the specified
+        search that are accepted by the ReadFilter and start at or after
+        minStart if it is not None.
         """
         # TODO If referenceId is None, return against all references,
         # including unmapped reads.
         referenceName = ""
         if referenceId is not None:
-            referenceName = self._samFile.getrname(referenceId)
+            referenceName = self._getReferenceName(referenceId)
         referenceName, start, end = self.sanitizeAlignmentFileFetch(
             referenceName, start, end)
         # TODO deal with errors from htslib
-        readAlignments = self._samFile.fetch(referenceName, start, end)
-        for readAlignment in readAlignments:
-            yield self.convertReadAlignment(readAlignment)
 
-    def convertReadAlignment(self, read):
+        def fetch(fetchStart, fetchEnd):
+            if fetchEnd is not None:
+                fetchEnd = min(fetchEnd, self.samMaxEnd)
+            # An iterator kept open as a search cursor is interleaved with
+            # other searches, so it needs its own file handle.
+            return self._getSearchFile().fetch(
+                referenceName, fetchStart, fetchEnd,
+                multiple_iterators=self.searchCursors)
+        if readFilter is None:
+            reads = fetch(start, end)
+        else:
+            reads = readFilter.fetchReads(fetch, start, end)
+        if minStart is not None:
+            # This follows the downsampling, which depends on the other
+            # reads in the window of minStart.
+            reads = itertools.ifilter(
+                lambda read: read.reference_start >= minStart, reads)
+        return reads
+
+    def getReadAlignments(
+            self, referenceId=None, start=None, end=None, fieldMask=None,
+            readFilter=None, minStart=None):
+        """
+        Returns an iterator over the specified reads. If a FieldMask is
+        specified, the fields of the reads that it does not select may be
+        left unset. If a ReadFilter is specified, only the reads that it
+        accepts are returned. If minStart is specified, the reads starting
+        before it are skipped without being converted; this is used to
+        resume a search at a page boundary.
         """
-        Convert a pysam ReadAlignment to a GA4GH ReadAlignment
+        for read in self._getReads(
+                referenceId, start, end, readFilter, minStart):
+            yield self.convertReadAlignment(read, fieldMask)
+
+    def getReadAlignmentCounts(
+            self, referenceId=None, start=None, end=None, readFilter=None,
+            binSize=None):
+        if (referenceId is None and not start and
+                (end is None or end >= self.samMaxEnd) and
+                readFilter is None and binSize is None):
+            # The index records the number of reads placed on each
+            # reference, which are the reads returned for the whole file.
+            return self._samFile.mapped + self._samFile.unmapped, None
+        reads = self._getReads(referenceId, start, end, readFilter)
+        return datamodel.countPositions(
+            (read.reference_start for read in reads), start, binSize)
+
+    def getCoverageSummary(
+            self, referenceId, start=None, end=None, binSize=None):
+        if self._coverageTiles is None:
+            raise exceptions.SummaryTilesNotFoundException(self.getId())
+        binSize, bins = self._coverageTiles.getSummary(
+            self._getReferenceName(referenceId), start, end, binSize)
+        return binSize, [
+            (binStart, numBases / binSize) for binStart, numBases in bins]
+
+    def getTranscodedReadAlignments(
+            self, referenceId=None, start=None, end=None, fieldMask=None,
+            readFilter=None, minStart=None):
+        """
+        Returns an iterator over the specified reads as TranscodedRecords,
+        writing the pysam alignments directly as JSON. The parameters are
+        the same as those of getReadAlignments.
+        """
+        for read in self._getReads(
+                referenceId, start, end, readFilter, minStart):
+            yield datamodel.TranscodedRecord(
+                read.reference_start, getReferenceEnd(read),
+                self.transcodeReadAlignment(read, fieldMask))
+
+    def _getReadById(self, readId):
+        """
+        Returns the first pysam alignment with the specified read ID,
+        reading it directly from the virtual offsets in the read name
+        index.
+        """
+        prefix = "{}:".format(self._id)
+        if not readId.startswith(prefix):
+            raise exceptions.ReadAlignmentNotFoundException(readId)
+        if self._readNameIndex is None:
+            raise exceptions.NotImplementedException(
+                "Getting reads by ID requires a read name index")
+        queryName = readId[len(prefix):]
+        samFile = self._getSearchFile()
+        for virtualOffset in self._readNameIndex.getVirtualOffsets(
+                queryName):
+            samFile.seek(virtualOffset)
+            read = next(samFile)
+            if read.query_name == queryName:
+                return read
+        raise exceptions.ReadAlignmentNotFoundException(readId)
+
+    def getReadAlignment(self, readId, fieldMask=None):
+        read = self._getReadById(readId)
+        return self.convertReadAlignment(read, fieldMask)
+
+    def getTranscodedReadAlignment(self, readId, fieldMask=None):
+        read = self._getReadById(readId)
+        return datamodel.TranscodedRecord(
+            read.reference_start, getReferenceEnd(read),
+            self.transcodeReadAlignment(read, fieldMask))
+
+    def convertReadAlignment(self, read, fieldMask=None):
+        """
+        Convert a pysam ReadAlignment to a GA4GH ReadAlignment. If a
+        FieldMask is specified, the expensive fields that it does not
+        select are left unset.
         """
         # TODO fill out remaining fields
         # TODO refine in tandem with code in converters module
+        alignmentFieldMask = None
+        if fieldMask is not None:
+            alignmentFieldMask = fieldMask.getSubMask("alignment")
         ret = protocol.ReadAlignment()
-        ret.alignedQuality = list(read.query_qualities)
+        ret.alignedQuality = []
+        if ((fieldMask is None or fieldMask.includes("alignedQuality")) and
+                read.query_qualities is not None):
+            ret.alignedQuality = read.query_qualities.tolist()
         ret.alignedSequence = read.query_sequence
         ret.alignment = protocol.LinearAlignment()
         ret.alignment.mappingQuality = read.mapping_quality
         ret.alignment.position = protocol.Position()
-        ret.alignment.position.referenceName = self._samFile.getrname(
+        ret.alignment.position.referenceName = self._getReferenceName(
             read.reference_id)
         ret.alignment.position.position = read.reference_start
         ret.alignment.position.strand = \
             protocol.Strand.POS_STRAND  # TODO fix this!
         ret.alignment.cigar = []
-        for operation, length in read.cigar:
-            gaCigarUnit = protocol.CigarUnit()
-            gaCigarUnit.operation = SamCigar.int2ga(operation)
-            gaCigarUnit.operationLength = length
-            gaCigarUnit.referenceSequence = None  # TODO fix this!
-            ret.alignment.cigar.append(gaCigarUnit)
-        ret.duplicateFragment = SamFlags.isFlagSet(
-            read.flag, SamFlags.DUPLICATE_FRAGMENT)
-        ret.failedVendorQualityChecks = SamFlags.isFlagSet(
-            read.flag, SamFlags.FAILED_VENDOR_QUALITY_CHECKS)
+        if alignmentFieldMask is None or alignmentFieldMask.includes("cigar"):
+            # Reads without a CIGAR, such as unmapped reads placed at the
+            # position of their mates, have no cigartuples.
+            getCigarUnit = self._getCigarUnit
+            ret.alignment.cigar = [
+                getCigarUnit(operation, length)
+                for operation, length in read.cigartuples or []]
+        (ret.duplicateFragment, ret.failedVendorQualityChecks,
+         ret.properPlacement, ret.secondaryAlignment,
+         ret.supplementaryAlignment, ret.numberReads,
+         ret.readNumber) = SamFlags.decode(read.flag)
         ret.fragmentLength = read.template_length
         ret.fragmentName = read.query_name
         ret.id = "{}:{}".format(self._id, read.query_name)
-        ret.info = {key: [str(value)] for key, value in read.tags}
+        if fieldMask is None or fieldMask.includes("info"):
+            ret.info = {key: [str(value)] for key, value in read.tags}
         ret.nextMatePosition = None
         if read.next_reference_id != -1:
             ret.nextMatePosition = protocol.Position()
-            ret.nextMatePosition.referenceName = self._samFile.getrname(
+            ret.nextMatePosition.referenceName = self._getReferenceName(
                 read.next_reference_id)
             ret.nextMatePosition.position = read.next_reference_start
             ret.nextMatePosition.strand = \
                 protocol.Strand.POS_STRAND  # TODO fix this!
-        # TODO Is this the correct mapping between numberReads and
-        # sam flag 0x1? What about the mapping between numberReads
-        # and 0x40 and 0x80?
-        ret.numberReads = None
-        ret.readNumber = None
-        if SamFlags.isFlagSet(read.flag, SamFlags.NUMBER_READS):
-            ret.numberReads = 2
-            if SamFlags.isFlagSet(read.flag, SamFlags.READ_NUMBER_ONE):
-                ret.readNumber = 0
-            elif SamFlags.isFlagSet(read.flag, SamFlags.READ_NUMBER_TWO):
-                ret.readNumber = 1
-        ret.properPlacement = SamFlags.isFlagSet(
-            read.flag, SamFlags.PROPER_PLACEMENT)
         ret.readGroupId = self._id
-        ret.secondaryAlignment = SamFlags.isFlagSet(
-            read.flag, SamFlags.SECONDARY_ALIGNMENT)
-        ret.supplementaryAlignment = SamFlags.isFlagSet(
-            read.flag, SamFlags.SUPPLEMENTARY_ALIGNMENT)
         return ret
+
+    def _transcodePosition(self, referenceId, position):
+        return {
+            "referenceName": self._getReferenceName(referenceId),
+            "position": position,
+            "strand": protocol.Strand.POS_STRAND}  # TODO fix this!
+
+    def transcodeReadAlignment(self, read, fieldMask=None):
+        """
+        Returns the JSON representation of the GA4GH ReadAlignment for the
+        specified pysam alignment without constructing the ReadAlignment.
+        The result is equivalent to that of
+        convertReadAlignment(read).toJsonString(fieldMask).
+        """
+        alignmentFieldMask = None
+        if fieldMask is not None:
+            alignmentFieldMask = fieldMask.getSubMask("alignment")
+        alignedQuality = []
+        if ((fieldMask is None or fieldMask.includes("alignedQuality")) and
+                read.query_qualities is not None):
+            alignedQuality = read.query_qualities.tolist()
+        cigar = []
+        if alignmentFieldMask is None or alignmentFieldMask.includes("cigar"):
+            cigar = [{
+                "operation": SamCigar.int2ga(operation),
+                "operationLength": length,
+                "referenceSequence": None}  # TODO fix this!
+                for operation, length in read.cigartuples or []]
+        info = {}
+        if fieldMask is None or fieldMask.includes("info"):
+            info = {key: [str(value)] for key, value in read.tags}
+        nextMatePosition = None
+        if read.next_reference_id != -1:
+            nextMatePosition = self._transcodePosition(
+                read.next_reference_id, read.next_reference_start)
+        (duplicateFragment, failedVendorQualityChecks, properPlacement,
+         secondaryAlignment, supplementaryAlignment, numberReads,
+         readNumber) = SamFlags.decode(read.flag)
+        jsonDict = {
+            "id": "{}:{}".format(self._id, read.query_name),
+            "readGroupId": self._id,
+            "fragmentName": read.query_name,
+            "properPlacement": properPlacement,
+            "duplicateFragment": duplicateFragment,
+            "numberReads": numberReads,
+            "fragmentLength": read.template_length,
+            "readNumber": readNumber,
+            "failedVendorQualityChecks": failedVendorQualityChecks,
+            "alignment": {
+                "position": self._transcodePosition(
+                    read.reference_id, read.reference_start),
+                "mappingQuality": read.mapping_quality,
+                "cigar": cigar},
+            "secondaryAlignment": secondaryAlignment,
+            "supplementaryAlignment": supplementaryAlignment,
+            "alignedSequence": read.query_sequence,
+            "alignedQuality": alignedQuality,
+            "nextMatePosition": nextMatePosition,
+            "info": info}
+        if fieldMask is not None:
+            jsonDict = protocol.ReadAlignment.maskJsonDict(
+                jsonDict, fieldMask)
+        return json.dumps(jsonDict)
@@ -12,9 +12,10 @@ import glob
 import pysam
 
 import ga4gh.protocol as protocol
+import ga4gh.datamodel as datamodel
 
 
-class ReferenceSet(object):
+class ReferenceSet(datamodel.DatamodelObject):
     """
     Class representing ReferenceSets. A ReferenceSet is a set of
     References which typically comprise a reference assembly, such as
@@ -34,6 +35,12 @@ class ReferenceSet(object):
             self._referenceIdMap[referenceId] = reference
         self._referenceIds = sorted(self._referenceIdMap.keys())
 
+    def getId(self):
+        """
+        Returns the ID of this ReferenceSet.
+        """
+        return self._id
+
     def getReferences(self):
         """
         Returns the References in this ReferenceSet.
@@ -55,7 +62,7 @@ class ReferenceSet(object):
         return ret
 
 
-class Reference(object):
+class Reference(datamodel.DatamodelObject):
     """
     Class representing References. A Reference is a canonical
     assembled contig, intended to act as a reference coordinate space
@@ -64,8 +71,21 @@ class Reference(object):
     """
     def __init__(self, id_, dataFile):
         self._id = id_
+        self._fastaFilePath = dataFile
         self._fastaFile = pysam.FastaFile(dataFile)
 
+    def getId(self):
+        """
+        Returns the ID of this Reference.
+        """
+        return self._id
+
+    def getFastaFilePath(self):
+        """
+        Returns the path of the FASTA file of this Reference.
+        """
+        return self._fastaFilePath
+
     def toProtocolElement(self):
         """
         Returns the GA4GH protocol representation of this Reference.
@@ -0,0 +1,662 @@
+"""
+A repository of the metadata of the GA4GH data in a set of data
+directories, held in a SQLite database.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import glob
+import sqlite3
+import threading
+import collections
+
+import pysam
+
+import ga4gh.exceptions as exceptions
+import ga4gh.datamodel as datamodel
+import ga4gh.datamodel.reads as reads
+import ga4gh.datamodel.references as references
+import ga4gh.datamodel.variants as variants
+
+
+class LazyObjectMap(collections.Mapping):
+    """
+    A read-only mapping from the IDs of the objects in a table of a
+    SqliteRepository to the datamodel objects. The objects, and so their
+    data files, are only opened when they are first looked up, using the
+    loader function, which is called with the row of the object.
+    """
+    def __init__(self, repository, tableName, loader):
+        self._repository = repository
+        self._tableName = tableName
+        self._loader = loader
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, objectId):
+        with self._lock:
+            object_ = self._objects.get(objectId)
+            if object_ is None:
+                row = self._repository.getRow(self._tableName, objectId)
+                if row is None:
+                    raise KeyError(objectId)
+                object_ = self._loader(row)
+                self._objects[objectId] = object_
+        return object_
+
+    def __contains__(self, objectId):
+        return (
+            objectId in self._objects or
+            self._repository.getRow(self._tableName, objectId) is not None)
+
+    def __iter__(self):
+        return iter(self._repository.getIds(self._tableName))
+
+    def __len__(self):
+        return self._repository.getNumRows(self._tableName)
+
+    def getNumLoaded(self):
+        """
+        Returns the number of objects that have been opened.
+        """
+        return len(self._objects)
+
+
+class SqliteRepository(object):
+    """
+    A repository of the datasets, VariantSets, CallSets, ReferenceSets,
+    References, ReadGroupSets and ReadGroups in a set of data
+    directories, and of summaries of their data files, held in a SQLite
+    database written by ga4gh_build_repository. Each data directory has
+    the layout read by the FileSystemBackend, and is a dataset whose ID
+    is the name of the directory. The database holds the JSON
+    representations of the objects, so that listing and search queries
+    are answered without opening the data files, and indexes on the
+    fields that they are searched by.
+
+    For each data file, the database holds the number of records, the
+    smallest start and the largest end on each reference, and the number
+    of records starting in each bin of binSize bases. The variant density
+    summaries at the coarser summaryBinSizes are added up from these
+    bins. Remote data files listed in urls.json are not summarised.
+    """
+    formatVersion = 1
+    binSize = datamodel.SummaryTiles.defaultBinSizes[0]
+    summaryBinSizes = datamodel.SummaryTiles.defaultBinSizes
+    _variantFilePatterns = ["*.bcf", "*.vcf.gz"]
+    _schema = [
+        """CREATE TABLE properties (
+            name TEXT PRIMARY KEY, value TEXT NOT NULL)""",
+        """CREATE TABLE datasets (
+            id TEXT PRIMARY KEY, dataDir TEXT NOT NULL)""",
+        """CREATE TABLE variantSets (
+            id TEXT PRIMARY KEY, datasetId TEXT NOT NULL,
+            dataDir TEXT NOT NULL, columnar INTEGER NOT NULL,
+            jsonString TEXT NOT NULL)""",
+        """CREATE INDEX variantSetsByDataset ON variantSets (datasetId, id)""",
+        """CREATE TABLE callSets (
+            id TEXT PRIMARY KEY, variantSetId TEXT NOT NULL,
+            position INTEGER NOT NULL, sampleName TEXT NOT NULL,
+            jsonString TEXT NOT NULL)""",
+        """CREATE INDEX callSetsByVariantSet ON callSets (
+            variantSetId, position)""",
+        """CREATE INDEX callSetsBySampleName ON callSets (
+            variantSetId, sampleName, position)""",
+        """CREATE INDEX callSetsBySample ON callSets (sampleName)""",
+        """CREATE TABLE referenceSets (
+            id TEXT PRIMARY KEY, datasetId TEXT NOT NULL,
+            dataDir TEXT NOT NULL, assemblyId TEXT, md5checksum TEXT,
+            jsonString TEXT NOT NULL)""",
+        """CREATE INDEX referenceSetsByMd5 ON referenceSets (md5checksum)""",
+        """CREATE INDEX referenceSetsByAssembly ON referenceSets (
+            assemblyId)""",
+        """CREATE TABLE referenceSequences (
+            id TEXT PRIMARY KEY, referenceSetId TEXT NOT NULL,
+            name TEXT NOT NULL, dataFile TEXT NOT NULL, md5checksum TEXT,
+            jsonString TEXT NOT NULL)""",
+        """CREATE INDEX referencesByReferenceSet ON referenceSequences (
+            referenceSetId, id)""",
+        """CREATE INDEX referencesByName ON referenceSequences (name)""",
+        """CREATE INDEX referencesByMd5 ON referenceSequences (
+            md5checksum)""",
+        """CREATE TABLE accessions (
+            objectId TEXT NOT NULL, accession TEXT NOT NULL)""",
+        """CREATE INDEX accessionsByAccession ON accessions (
+            accession, objectId)""",
+        """CREATE TABLE readGroupSets (
+            id TEXT PRIMARY KEY, datasetId TEXT NOT NULL,
+            dataDir TEXT NOT NULL, name TEXT, jsonString TEXT NOT NULL)""",
+        """CREATE INDEX readGroupSetsByDataset ON readGroupSets (
+            datasetId, id)""",
+        """CREATE INDEX readGroupSetsByName ON readGroupSets (name)""",
+        """CREATE TABLE readGroups (
+            id TEXT PRIMARY KEY, readGroupSetId TEXT NOT NULL,
+            dataFile TEXT NOT NULL, sampleId TEXT,
+            jsonString TEXT NOT NULL)""",
+        """CREATE INDEX readGroupsByReadGroupSet ON readGroups (
+            readGroupSetId)""",
+        """CREATE INDEX readGroupsBySample ON readGroups (sampleId)""",
+        """CREATE TABLE dataFiles (
+            id INTEGER PRIMARY KEY, objectId TEXT NOT NULL,
+            path TEXT NOT NULL, size INTEGER)""",
+        """CREATE INDEX dataFilesByObject ON dataFiles (objectId)""",
+        """CREATE TABLE contigs (
+            dataFileId INTEGER NOT NULL, referenceName TEXT NOT NULL,
+            numRecords INTEGER NOT NULL, startPosition INTEGER NOT NULL,
+            endPosition INTEGER NOT NULL,
+            PRIMARY KEY (dataFileId, referenceName))""",
+        """CREATE INDEX contigsByReference ON contigs (
+            referenceName, startPosition)""",
+        """CREATE TABLE bins (
+            dataFileId INTEGER NOT NULL, referenceName TEXT NOT NULL,
+            binStart INTEGER NOT NULL, count INTEGER NOT NULL,
+            PRIMARY KEY (dataFileId, referenceName, binStart))""",
+    ]
+
+    def __init__(self, fileName):
+        self._fileName = fileName
+        if not os.path.isfile(fileName):
+            raise exceptions.InvalidRepositoryException(fileName)
+        # The connection is shared by the request threads and the
+        # prefetch threads, so queries are serialised.
+        self._connection = sqlite3.connect(
+            fileName, check_same_thread=False)
+        self._lock = threading.Lock()
+        try:
+            rows = self._query(
+                "SELECT value FROM properties WHERE name = ?",
+                ("formatVersion",))
+        except sqlite3.DatabaseError:
+            raise exceptions.InvalidRepositoryException(fileName)
+        if len(rows) == 0 or int(rows[0][0]) != self.formatVersion:
+            raise exceptions.InvalidRepositoryException(fileName)
+
+    def getFileName(self):
+        """
+        Returns the name of the database file of this repository.
+        """
+        return self._fileName
+
+    def reopen(self):
+        """
+        Opens a new connection to the database, for use in a process
+        forked from the one that opened the repository. SQLite
+        connections must not be used by more than one process.
+        """
+        self._connection = sqlite3.connect(
+            self._fileName, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def _query(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def getIds(self, tableName):
+        """
+        Returns the sorted list of the IDs of the objects in the specified
+        table.
+        """
+        return [row[0] for row in self._query(
+            "SELECT id FROM {} ORDER BY id".format(tableName))]
+
+    def getNumRows(self, tableName):
+        """
+        Returns the number of objects in the specified table.
+        """
+        return self._query("SELECT COUNT(*) FROM {}".format(tableName))[0][0]
+
+    def getRow(self, tableName, objectId):
+        """
+        Returns the row of the object with the specified ID in the
+        specified table as a mapping of column names to values, or None
+        if there is no such object.
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT * FROM {} WHERE id = ?".format(tableName),
+                (objectId,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip(
+            [description[0] for description in cursor.description], row))
+
+    def _search(
+            self, tableName, conditions, parameters, offset, limit,
+            orderBy="id"):
+        """
+        Returns the list of the JSON representations of the objects in
+        the specified table matching all the specified SQL conditions,
+        from the specified offset in the order given by orderBy.
+        """
+        sql = "SELECT jsonString FROM {}".format(tableName)
+        if len(conditions) > 0:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY {} LIMIT ? OFFSET ?".format(orderBy)
+        rows = self._query(sql, tuple(parameters) + (limit, offset))
+        return [row[0] for row in rows]
+
+    @classmethod
+    def _addInCondition(cls, conditions, parameters, column, values):
+        conditions.append("{} IN ({})".format(
+            column, ", ".join("?" * len(values))))
+        parameters.extend(values)
+
+    @classmethod
+    def _addAccessionsCondition(cls, conditions, parameters, accessions):
+        conditions.append(
+            "id IN (SELECT objectId FROM accessions WHERE accession IN "
+            "({}))".format(", ".join("?" * len(accessions))))
+        parameters.extend(accessions)
+
+    def searchVariantSets(self, datasetIds, offset, limit):
+        """
+        Returns the list of the JSON representations of the VariantSets
+        in the specified datasets, or all VariantSets if no datasets are
+        specified, from the specified offset in the order of their IDs.
+        """
+        conditions, parameters = [], []
+        if len(datasetIds) > 0:
+            self._addInCondition(
+                conditions, parameters, "datasetId", datasetIds)
+        return self._search(
+            "variantSets", conditions, parameters, offset, limit)
+
+    def searchCallSets(self, variantSetId, name, namePrefix, offset, limit):
+        """
+        Returns the list of the JSON representations of the CallSets in
+        the specified VariantSet, from the specified offset. If name and
+        namePrefix are None, all CallSets are returned in the order of the
+        samples in the variant files; otherwise only the CallSets with this
+        sample name and with sample names starting with namePrefix, where
+        these are given, are returned sorted by sample name.
+        """
+        conditions, parameters = ["variantSetId = ?"], [variantSetId]
+        orderBy = "position"
+        if name is not None:
+            orderBy = "sampleName, position"
+            conditions.append("sampleName = ?")
+            parameters.append(name)
+        if namePrefix is not None:
+            orderBy = "sampleName, position"
+            if namePrefix != "":
+                # The smallest string greater than all strings with prefix.
+                upperBound = namePrefix[:-1] + unichr(ord(namePrefix[-1]) + 1)
+                conditions.append("sampleName >= ? AND sampleName < ?")
+                parameters.extend([namePrefix, upperBound])
+        return self._search(
+            "callSets", conditions, parameters, offset, limit, orderBy)
+
+    def searchReferenceSets(
+            self, accessions, md5checksums, assemblyId, offset, limit):
+        """
+        Returns the list of the JSON representations of the ReferenceSets
+        with any of the specified source accessions and MD5 checksums and
+        the specified assembly ID, where these are given, from the
+        specified offset in the order of their IDs.
+        """
+        conditions, parameters = [], []
+        if len(accessions) > 0:
+            self._addAccessionsCondition(conditions, parameters, accessions)
+        if len(md5checksums) > 0:
+            self._addInCondition(
+                conditions, parameters, "md5checksum", md5checksums)
+        if assemblyId is not None:
+            conditions.append("assemblyId = ?")
+            parameters.append(assemblyId)
+        return self._search(
+            "referenceSets", conditions, parameters, offset, limit)
+
+    def searchReferences(
+            self, referenceSetId, accessions, md5checksums, offset, limit):
+        """
+        Returns the list of the JSON representations of the References in
+        the specified ReferenceSet, or in all ReferenceSets if this is
+        None, with any of the specified source accessions and MD5
+        checksums where these are given, from the specified offset in the
+        order of their IDs.
+        """
+        conditions, parameters = [], []
+        if referenceSetId is not None:
+            conditions.append("referenceSetId = ?")
+            parameters.append(referenceSetId)
+        if len(accessions) > 0:
+            self._addAccessionsCondition(conditions, parameters, accessions)
+        if len(md5checksums) > 0:
+            self._addInCondition(
+                conditions, parameters, "md5checksum", md5checksums)
+        return self._search(
+            "referenceSequences", conditions, parameters, offset, limit)
+
+    def searchReadGroupSets(self, datasetIds, name, offset, limit):
+        """
+        Returns the list of the JSON representations of the ReadGroupSets
+        in the specified datasets, or in all datasets if none are
+        specified, with the specified name if this is not None, from the
+        specified offset in the order of their IDs.
+        """
+        conditions, parameters = [], []
+        if len(datasetIds) > 0:
+            self._addInCondition(
+                conditions, parameters, "datasetId", datasetIds)
+        if name is not None:
+            conditions.append("name = ?")
+            parameters.append(name)
+        return self._search(
+            "readGroupSets", conditions, parameters, offset, limit)
+
+    def getVariantSetIdsAt(self, referenceName, position):
+        """
+        Returns the sorted list of the IDs of the VariantSets that may
+        have variants starting at the specified position of the specified
+        reference. These are the VariantSets with a data file whose
+        records on the reference span the position, and the VariantSets
+        with no summarised data files.
+        """
+        return [row[0] for row in self._query(
+            """SELECT id FROM variantSets WHERE id IN (
+                SELECT dataFiles.objectId FROM contigs JOIN dataFiles
+                ON dataFiles.id = contigs.dataFileId
+                WHERE contigs.referenceName = ?
+                AND contigs.startPosition <= ?
+                AND contigs.endPosition > ?)
+            OR id NOT IN (
+                SELECT objectId FROM dataFiles WHERE size IS NOT NULL)
+            ORDER BY id""", (referenceName, position, position))]
+
+    def getDensitySummary(
+            self, objectId, referenceName, start=None, end=None,
+            binSize=None):
+        """
+        Returns the (binSize, bins) pair summarising the number of records
+        of the data files of the specified object starting in the
+        specified interval of the specified reference, in the form
+        returned by SummaryTiles.getSummary, or None if the object has
+        no summarised data files. The binSize is chosen from the
+        summaryBinSizes by datamodel.chooseBinSize.
+        """
+        numDataFiles = self._query(
+            """SELECT COUNT(*) FROM dataFiles
+            WHERE objectId = ? AND size IS NOT NULL""", (objectId,))[0][0]
+        if numDataFiles == 0:
+            return None
+        if start is None:
+            start = 0
+        if end is None:
+            end = 2**31 - 1
+        binSize = datamodel.chooseBinSize(
+            self.summaryBinSizes, start, end, binSize,
+            datamodel.SummaryTiles.defaultMaxNumBins)
+        rows = self._query(
+            """SELECT bins.binStart / ? AS binIndex, SUM(bins.count)
+            FROM dataFiles JOIN bins ON bins.dataFileId = dataFiles.id
+            WHERE dataFiles.objectId = ? AND bins.referenceName = ?
+            AND bins.binStart >= ? AND bins.binStart < ?
+            GROUP BY binIndex ORDER BY binIndex""",
+            (binSize, objectId, referenceName, (start // binSize) * binSize,
+             ((end + binSize - 1) // binSize) * binSize))
+        return binSize, [
+            (binIndex * binSize, count) for binIndex, count in rows]
+
+    def checkDataFiles(self, objectIds):
+        """
+        Raises an InvalidRepositoryException if any of the local data
+        files of the objects with the specified IDs has changed since the
+        repository was built.
+        """
+        for objectId in objectIds:
+            for path, size in self._query(
+                    """SELECT path, size FROM dataFiles
+                    WHERE objectId = ? AND size IS NOT NULL""", (objectId,)):
+                if (not os.path.exists(path) or
+                        os.path.getsize(path) != size):
+                    raise exceptions.InvalidRepositoryException(
+                        self._fileName)
+
+    def _getChildIds(self, tableName, parentColumn, parentId):
+        return [row[0] for row in self._query(
+            "SELECT id FROM {} WHERE {} = ?".format(tableName, parentColumn),
+            (parentId,))]
+
+    def loadVariantSet(self, row, maxInMemorySize=0):
+        """
+        Returns the VariantSet for the specified row of the variantSets
+        table, opening its data files. See variants.openVariantSet for
+        maxInMemorySize.
+        """
+        self.checkDataFiles([row["id"]])
+        if row["columnar"]:
+            return variants.ColumnarVariantSet(row["id"], row["dataDir"])
+        return variants.openVariantSet(
+            row["id"], row["dataDir"], maxInMemorySize)
+
+    def loadReferenceSet(self, row):
+        """
+        Returns the ReferenceSet for the specified row of the
+        referenceSets table, opening its data files.
+        """
+        self.checkDataFiles(self._getChildIds(
+            "referenceSequences", "referenceSetId", row["id"]))
+        return references.ReferenceSet(row["id"], row["dataDir"])
+
+    def loadReadGroupSet(self, row):
+        """
+        Returns the ReadGroupSet for the specified row of the
+        readGroupSets table, opening its data files.
+        """
+        self.checkDataFiles(self._getChildIds(
+            "readGroups", "readGroupSetId", row["id"]))
+        return reads.HtslibReadGroupSet(row["id"], row["dataDir"])
+
+    def loadReadGroup(self, row):
+        """
+        Returns the ReadGroup for the specified row of the readGroups
+        table, opening only its own data file.
+        """
+        self.checkDataFiles([row["id"]])
+        return reads.HtslibReadGroup(row["id"], row["dataFile"])
+
+    @classmethod
+    def build(cls, fileName, dataDirs):
+        """
+        Writes the repository of the specified data directories to the
+        specified database file, replacing any existing file. Returns
+        the mapping of table names to the number of rows written into
+        them.
+        """
+        tempFileName = fileName + ".tmp"
+        if os.path.exists(tempFileName):
+            os.unlink(tempFileName)
+        connection = sqlite3.connect(tempFileName)
+        try:
+            for statement in cls._schema:
+                connection.execute(statement)
+            connection.execute(
+                "INSERT INTO properties VALUES (?, ?)",
+                ("formatVersion", str(cls.formatVersion)))
+            connection.execute(
+                "INSERT INTO properties VALUES (?, ?)",
+                ("binSize", str(cls.binSize)))
+            for dataDir in dataDirs:
+                cls._addDataset(connection, dataDir)
+            numRows = dict(
+                (tableName, connection.execute(
+                    "SELECT COUNT(*) FROM {}".format(tableName)).fetchone()[0])
+                for tableName in [
+                    "datasets", "variantSets", "callSets", "referenceSets",
+                    "referenceSequences", "readGroupSets", "readGroups",
+                    "dataFiles"])
+            connection.commit()
+        finally:
+            connection.close()
+        os.rename(tempFileName, fileName)
+        return numRows
+
+    @classmethod
+    def _insert(cls, connection, tableName, values):
+        """
+        Inserts a row into the specified table, raising a
+        DuplicateRepositoryIdException if the first value is an ID that
+        is already in the table.
+        """
+        try:
+            return connection.execute(
+                "INSERT INTO {} VALUES ({})".format(
+                    tableName, ", ".join("?" * len(values))),
+                values).lastrowid
+        except sqlite3.IntegrityError:
+            raise exceptions.DuplicateRepositoryIdException(values[0])
+
+    @classmethod
+    def _getSubdirectories(cls, dataDir, kind):
+        """
+        Returns the sorted list of the (objectId, path) pairs of the
+        directories in the subdirectory of the specified data directory
+        holding the objects of the specified kind.
+        """
+        kindDir = os.path.join(dataDir, kind)
+        if not os.path.isdir(kindDir):
+            return []
+        return [
+            (objectId, os.path.join(kindDir, objectId))
+            for objectId in sorted(os.listdir(kindDir))
+            if os.path.isdir(os.path.join(kindDir, objectId))]
+
+    @classmethod
+    def _addDataset(cls, connection, dataDir):
+        datasetId = os.path.basename(os.path.normpath(dataDir))
+        cls._insert(connection, "datasets", (datasetId, dataDir))
+        for variantSetId, path in cls._getSubdirectories(
+                dataDir, "variants"):
+            cls._addVariantSet(connection, datasetId, variantSetId, path)
+        for referenceSetId, path in cls._getSubdirectories(
+                dataDir, "references"):
+            cls._addReferenceSet(connection, datasetId, referenceSetId, path)
+        for readGroupSetId, path in cls._getSubdirectories(dataDir, "reads"):
+            cls._addReadGroupSet(connection, datasetId, readGroupSetId, path)
+
+    @classmethod
+    def _addVariantSet(cls, connection, datasetId, variantSetId, dataDir):
+        columnar = variants.ColumnarVariantSet.hasStore(dataDir)
+        variantSet = variants.openVariantSet(variantSetId, dataDir)
+        cls._insert(connection, "variantSets", (
+            variantSetId, datasetId, dataDir, columnar,
+            variantSet.toJsonFragment().toJsonString()))
+        for position, callSet in enumerate(variantSet.getCallSets()):
+            cls._insert(connection, "callSets", (
+                callSet.getId(), variantSetId, position,
+                callSet.getSampleName(),
+                callSet.toJsonFragment().toJsonString()))
+        # The variant files of a columnar store may have been removed.
+        fileNames = []
+        for pattern in cls._variantFilePatterns:
+            fileNames.extend(glob.glob(os.path.join(dataDir, pattern)))
+        for fileName in sorted(fileNames):
+            dataFileId = cls._addDataFile(connection, variantSetId, fileName)
+            variantFile = pysam.VariantFile(fileName)
+            variantFile.subset_samples([])
+            cls._addSummaries(
+                connection, dataFileId,
+                ((record.contig, record.start, record.stop)
+                 for record in variantFile))
+
+    @classmethod
+    def _addReferenceSet(
+            cls, connection, datasetId, referenceSetId, dataDir):
+        referenceSet = references.ReferenceSet(referenceSetId, dataDir)
+        protocolElement = referenceSet.toProtocolElement()
+        cls._insert(connection, "referenceSets", (
+            referenceSetId, datasetId, dataDir, protocolElement.assemblyId,
+            protocolElement.md5checksum, protocolElement.toJsonString()))
+        cls._addAccessions(
+            connection, referenceSetId, protocolElement.sourceAccessions)
+        for reference in sorted(
+                referenceSet.getReferences(),
+                key=lambda reference: reference.getId()):
+            protocolElement = reference.toProtocolElement()
+            referenceId = reference.getId()
+            fileName = reference.getFastaFilePath()
+            name = os.path.basename(fileName).split(".")[0]
+            cls._insert(connection, "referenceSequences", (
+                referenceId, referenceSetId, name, fileName,
+                protocolElement.md5checksum, protocolElement.toJsonString()))
+            cls._addAccessions(
+                connection, referenceId, protocolElement.sourceAccessions)
+            cls._addDataFile(connection, referenceId, fileName)
+
+    @classmethod
+    def _addReadGroupSet(
+            cls, connection, datasetId, readGroupSetId, dataDir):
+        readGroupSet = reads.HtslibReadGroupSet(readGroupSetId, dataDir)
+        protocolElement = readGroupSet.toProtocolElement()
+        cls._insert(connection, "readGroupSets", (
+            readGroupSetId, datasetId, dataDir, protocolElement.name,
+            protocolElement.toJsonString()))
+        for readGroup, gaReadGroup in zip(
+                readGroupSet.getReadGroups(), protocolElement.readGroups):
+            fileName = readGroup.getSamFilePath()
+            cls._insert(connection, "readGroups", (
+                readGroup.getId(), readGroupSetId, fileName,
+                gaReadGroup.sampleId, gaReadGroup.toJsonString()))
+            dataFileId = cls._addDataFile(
+                connection, readGroup.getId(), fileName)
+            if dataFileId is not None:
+                samFile = pysam.AlignmentFile(fileName)
+                cls._addSummaries(
+                    connection, dataFileId,
+                    ((samFile.getrname(read.reference_id),
+                      read.reference_start,
+                      max(read.reference_end, read.reference_start + 1))
+                     for read in samFile.fetch(until_eof=True)
+                     if read.reference_id >= 0))
+
+    @classmethod
+    def _addAccessions(cls, connection, objectId, accessions):
+        # The source accessions of References are not filled in yet.
+        if accessions is None:
+            return
+        for accession in accessions:
+            connection.execute(
+                "INSERT INTO accessions VALUES (?, ?)", (objectId, accession))
+
+    @classmethod
+    def _addDataFile(cls, connection, objectId, path):
+        """
+        Adds the data file with the specified path to the object with the
+        specified ID, and returns the ID of its row, or None if it is a
+        remote file that is not summarised.
+        """
+        if not os.path.isfile(path):
+            cls._insert(connection, "dataFiles", (None, objectId, path, None))
+            return None
+        return cls._insert(connection, "dataFiles", (
+            None, objectId, os.path.abspath(path), os.path.getsize(path)))
+
+    @classmethod
+    def _addSummaries(cls, connection, dataFileId, intervals):
+        """
+        Adds the contig and bin summaries of the data file with the
+        specified ID, for the specified iterator over the
+        (referenceName, start, end) intervals of its records.
+        """
+        contigs = collections.OrderedDict()
+        bins = collections.Counter()
+        for referenceName, start, end in intervals:
+            contig = contigs.get(referenceName)
+            if contig is None:
+                contigs[referenceName] = [1, start, end]
+            else:
+                contig[0] += 1
+                contig[1] = min(contig[1], start)
+                contig[2] = max(contig[2], end)
+            bins[referenceName, start // cls.binSize] += 1
+        connection.executemany(
+            "INSERT INTO contigs VALUES (?, ?, ?, ?, ?)",
+            [(dataFileId, referenceName, numRecords, start, end)
+             for referenceName, (numRecords, start, end) in contigs.items()])
+        connection.executemany(
+            "INSERT INTO bins VALUES (?, ?, ?, ?)",
+            [(dataFileId, referenceName, binIndex * cls.binSize, count)
+             for (referenceName, binIndex), count in sorted(bins.items())])
@@ -6,9 +6,19 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import array
+import bisect
+import collections
 import datetime
+import glob
+import itertools
+import json
+import os
 import random
+import shutil
+import struct
 
+import numpy
 import pysam
 
 import ga4gh.protocol as protocol
@@ -47,7 +57,331 @@ def convertVCFGenotype(vcfGenotype, vcfPhaseset):
     return genotype, phaseset
 
 
-class CallSet(object):
+class VariantFilter(object):
+    """
+    A set of predicates on the sites and genotypes of variants. Filters
+    are evaluated on the pysam records, so that variants that are
+    rejected are never converted into GA4GH objects. The genotype
+    predicates consider only the samples decoded in the record, which
+    are the requested call sets.
+    """
+    def __init__(
+            self, minQuality=None, passOnly=False, nonReference=False,
+            minAlleleCount=None, maxAlleleCount=None):
+        self._minQuality = minQuality
+        self._passOnly = passOnly
+        self._nonReference = nonReference
+        self._minAlleleCount = minAlleleCount
+        self._maxAlleleCount = maxAlleleCount
+
+    def usesGenotypes(self):
+        """
+        Returns True if this filter needs the genotypes of the samples.
+        """
+        return (
+            self._nonReference or self._minAlleleCount is not None or
+            self._maxAlleleCount is not None)
+
+    def accepts(self, record):
+        """
+        Returns True if the specified pysam variant record passes this
+        filter.
+        """
+        if self._minQuality is not None:
+            if record.qual is None or record.qual < self._minQuality:
+                return False
+        if self._passOnly and list(record.filter.keys()) != ["PASS"]:
+            return False
+        if self.usesGenotypes():
+            alleleCount = self._getAlleleCount(record)
+            if self._nonReference and alleleCount == 0:
+                return False
+            if (self._minAlleleCount is not None and
+                    alleleCount < self._minAlleleCount):
+                return False
+            if (self._maxAlleleCount is not None and
+                    alleleCount > self._maxAlleleCount):
+                return False
+        return True
+
+    def acceptsColumns(self, quals, passed, alleleCounts=None):
+        """
+        Returns a boolean numpy array telling which of the variants with
+        the specified column arrays pass this filter. The quals are NaN
+        for variants without a quality, passed tells whether PASS is the
+        only filter of each variant, and alleleCounts holds the number of
+        non-reference alleles called in the requested samples; it is
+        only needed if the filter uses genotypes.
+        """
+        accepted = numpy.ones(len(quals), dtype=bool)
+        if self._minQuality is not None:
+            with numpy.errstate(invalid="ignore"):
+                accepted &= quals >= self._minQuality
+        if self._passOnly:
+            accepted &= passed
+        if self._nonReference:
+            accepted &= alleleCounts > 0
+        if self._minAlleleCount is not None:
+            accepted &= alleleCounts >= self._minAlleleCount
+        if self._maxAlleleCount is not None:
+            accepted &= alleleCounts <= self._maxAlleleCount
+        return accepted
+
+    def _getAlleleCount(self, record):
+        """
+        Returns the number of non-reference alleles called in the samples
+        of the specified record.
+        """
+        ref = record.ref
+        alleleCount = 0
+        for sample in record.samples.itervalues():
+            genotype = sample["GT"]
+            if genotype is not None:
+                for allele in genotype:
+                    if allele is not None and allele != ref:
+                        alleleCount += 1
+        return alleleCount
+
+
+class VariantNameIndex(datamodel.NameIndex):
+    """
+    An on-disk index from the names (the VCF ID values) of the records in
+    a variant file to their positions. The names of the contigs are stored
+    as the extra data of the index, and the entries are (nameHash,
+    contigIndex, position) tuples.
+    """
+    _magic = b"GA4GHVNI"
+    _entryStruct = struct.Struct(str("<QIi"))
+    _invalidIndexException = exceptions.InvalidVariantNameIndexException
+
+    def __init__(self, fileName):
+        super(VariantNameIndex, self).__init__(fileName)
+        self._contigNames = self._getExtraData().decode("utf-8").split(
+            "\n")
+
+    @classmethod
+    def build(cls, variantFileName, indexFileName=None):
+        """
+        Writes the index of the names of the records in the specified
+        variant file to indexFileName, or to the default index file name
+        for the variant file if this is not specified. Returns the number
+        of names indexed.
+        """
+        if indexFileName is None:
+            indexFileName = cls.getIndexFileName(variantFileName)
+        variantFile = pysam.VariantFile(variantFileName)
+        # We only need the IDs, so there is no need to decode the samples.
+        variantFile.subset_samples([])
+        contigNames = []
+        contigIndexes = {}
+        entries = []
+        for record in variantFile:
+            if record.id is None:
+                continue
+            if record.contig not in contigIndexes:
+                contigIndexes[record.contig] = len(contigNames)
+                contigNames.append(record.contig)
+            contigIndex = contigIndexes[record.contig]
+            for name in record.id.split(';'):
+                entries.append(
+                    (cls.getNameHash(name), contigIndex, record.start))
+        cls._write(
+            indexFileName, variantFileName, entries,
+            "\n".join(contigNames).encode("utf-8"))
+        return len(entries)
+
+    def getPositions(self, name):
+        """
+        Returns the list of (contigName, position) pairs for the records
+        that may have the specified name, in the order of the file.
+        """
+        return [
+            (self._contigNames[contigIndex], position)
+            for _, contigIndex, position in self._getEntries(name)]
+
+
+class VariantAlleleIndex(datamodel.NameIndex):
+    """
+    An on-disk index of the alternate alleles of the records in a
+    variant file, used to answer beacon queries. The entries are
+    (keyHash, alleleCount, alleleNumber) tuples, where keyHash is the
+    hash of the contig, position and allele, and alleleCount and
+    alleleNumber are the number of called copies of the allele and of
+    all the alleles at the site, summed over the records with the same
+    key. The extra data of the index is a Bloom filter of the key
+    hashes, which rejects most of the alleles that are not present
+    without searching the entries. The records are not checked, so
+    there is a chance of about 2**-64 of a false positive for each
+    allele in the file.
+    """
+    fileSuffix = ".alleles"
+    defaultBloomFilterBits = 10
+    maxCount = 2**32 - 1
+    _magic = b"GA4GHVAI"
+    _entryStruct = struct.Struct(str("<QII"))
+    _invalidIndexException = exceptions.InvalidVariantAlleleIndexException
+    _numBloomFilterProbes = 7
+
+    def __init__(self, fileName):
+        super(VariantAlleleIndex, self).__init__(fileName)
+        self._numBloomFilterBits = 8 * (
+            self._entriesStart - self._extraDataStart)
+
+    @classmethod
+    def getAlleleKey(cls, contig, position, allele):
+        """
+        Returns the string identifying the specified allele at the
+        specified position, whose hash is the key of the index.
+        """
+        return "{}\t{}\t{}".format(contig, position, allele.upper())
+
+    @classmethod
+    def getRecordAlleleCounts(cls, record, useInfo):
+        """
+        Returns the (alleleCounts, alleleNumber) pair for the specified
+        pysam record, where alleleCounts is the list of the numbers of
+        called copies of each of the alternate alleles, and alleleNumber
+        is the total number of called alleles. If useInfo is True, these
+        are the AC and AN values of the record; otherwise they are
+        counted from the genotypes of the samples.
+        """
+        if useInfo:
+            alleleCounts = record.info.get("AC")
+            if not isinstance(alleleCounts, tuple):
+                alleleCounts = (alleleCounts,)
+            alleleCounts = [count or 0 for count in alleleCounts]
+            return alleleCounts, record.info.get("AN") or 0
+        alleleIndexes = {
+            allele: index for index, allele in enumerate(record.alts)}
+        alleleCounts = [0] * len(record.alts)
+        alleleNumber = 0
+        for sample in record.samples.itervalues():
+            for allele in sample["GT"] or ():
+                if allele is not None:
+                    alleleNumber += 1
+                    if allele in alleleIndexes:
+                        alleleCounts[alleleIndexes[allele]] += 1
+        return alleleCounts, alleleNumber
+
+    @classmethod
+    def usesInfo(cls, variantFile):
+        """
+        Returns True if the allele counts of the records in the specified
+        variant file are taken from their AC and AN values.
+        """
+        return "AC" in variantFile.header.info and (
+            "AN" in variantFile.header.info)
+
+    @classmethod
+    def build(
+            cls, variantFileName, indexFileName=None, bloomFilterBits=None):
+        """
+        Writes the index of the alternate alleles of the records in the
+        specified variant file to indexFileName, or to the default index
+        file name for the variant file if this is not specified. The
+        Bloom filter has bloomFilterBits bits for each allele; if this
+        is 0, there is no Bloom filter. Returns the number of alleles
+        indexed.
+        """
+        if indexFileName is None:
+            indexFileName = cls.getIndexFileName(variantFileName)
+        if bloomFilterBits is None:
+            bloomFilterBits = cls.defaultBloomFilterBits
+        variantFile = pysam.VariantFile(variantFileName)
+        useInfo = cls.usesInfo(variantFile)
+        if useInfo:
+            variantFile.subset_samples([])
+        counts = collections.defaultdict(lambda: [0, 0])
+        for record in variantFile:
+            if record.alts is None:
+                continue
+            alleleCounts, alleleNumber = cls.getRecordAlleleCounts(
+                record, useInfo)
+            for allele, alleleCount in zip(record.alts, alleleCounts):
+                keyHash = cls.getNameHash(cls.getAlleleKey(
+                    record.contig, record.start, allele))
+                counts[keyHash][0] += alleleCount
+                counts[keyHash][1] += alleleNumber
+        entries = [
+            (key, min(count, cls.maxCount), min(number, cls.maxCount))
+            for key, (count, number) in counts.items()]
+        numBloomFilterBits = 0
+        if bloomFilterBits > 0:
+            numBloomFilterBits = 8 * max(
+                1, (len(entries) * bloomFilterBits + 7) // 8)
+        bloomFilter = bytearray(numBloomFilterBits // 8)
+        for entry in entries:
+            for bit in cls._getBloomFilterBits(entry[0], numBloomFilterBits):
+                bloomFilter[bit >> 3] |= 1 << (bit & 7)
+        cls._write(
+            indexFileName, variantFileName, entries, bytes(bloomFilter))
+        return len(entries)
+
+    @classmethod
+    def _getBloomFilterBits(cls, keyHash, numBloomFilterBits):
+        if numBloomFilterBits == 0:
+            return []
+        # Double hashing with the two halves of the key hash.
+        first = keyHash & 0xffffffff
+        second = (keyHash >> 32) | 1
+        return [
+            (first + i * second) % numBloomFilterBits
+            for i in range(cls._numBloomFilterProbes)]
+
+    def getAlleleCounts(self, contig, position, allele):
+        """
+        Returns the (alleleCount, alleleNumber) pair for the specified
+        allele at the specified position, or None if the allele is not
+        present.
+        """
+        keyHash = self.getNameHash(self.getAlleleKey(
+            contig, position, allele))
+        for bit in self._getBloomFilterBits(
+                keyHash, self._numBloomFilterBits):
+            byte = ord(self._data[self._extraDataStart + (bit >> 3)])
+            if not byte & (1 << (bit & 7)):
+                return None
+        entries = self._getEntriesForHash(keyHash)
+        if len(entries) == 0:
+            return None
+        _, alleleCount, alleleNumber = entries[0]
+        return alleleCount, alleleNumber
+
+
+class VariantDensityTiles(datamodel.SummaryTiles):
+    """
+    Precomputed density of the variants in a VCF/BCF file. The value of
+    each bin is the number of records starting in the bin.
+    """
+    _magic = b"GA4GHVDT"
+
+    @classmethod
+    def build(cls, variantFileName, tilesFileName=None, binSizes=None):
+        """
+        Writes the variant density tiles for the specified variant file
+        to tilesFileName, or to the default tiles file name for the
+        variant file if this is not specified, at the specified bin
+        sizes. Returns the number of records counted.
+        """
+        if tilesFileName is None:
+            tilesFileName = cls.getTilesFileName(variantFileName)
+        if binSizes is None:
+            binSizes = cls.defaultBinSizes
+        binSize = min(binSizes)
+        variantFile = pysam.VariantFile(variantFileName)
+        variantFile.subset_samples([])
+        tiles = {}
+        numRecords = 0
+        for record in variantFile:
+            numRecords += 1
+            cls._addValue(
+                tiles.setdefault(record.contig, []), record.start // binSize,
+                1)
+        cls._write(tilesFileName, variantFileName, binSizes, tiles)
+        return numRecords
+
+
+class CallSet(datamodel.DatamodelObject):
     """
     Class representing a CallSet. A CallSet basically represents the
     metadata associated with a single VCF sample column.
@@ -87,6 +421,8 @@ class AbstractVariantSet(datamodel.DatamodelObject):
         self._id = id_
         self._callSetIdMap = {}
         self._callSetIds = []
+        self._callSets = []
+        self._callSetNameIndex = None
         self._creationTime = None
         self._updatedTime = None
         self._referenceSetId = ""
@@ -118,6 +454,8 @@ class AbstractVariantSet(datamodel.DatamodelObject):
         callSet = CallSet(self, callSetId, sampleName)
         self._callSetIdMap[callSetId] = callSet
         self._callSetIds.append(callSetId)
+        self._callSets.append(callSet)
+        self._callSetNameIndex = None
 
     def getCallSetIdMap(self):
         """
@@ -134,9 +472,46 @@ class AbstractVariantSet(datamodel.DatamodelObject):
 
     def getCallSets(self):
         """
-        Returns an iterator over the CallSets for this VariantSet.
+        Returns the list of CallSets for this VariantSet, in the order of
+        their callSetIds.
+        """
+        return self._callSets
+
+    def _getCallSetNameIndex(self):
+        """
+        Returns the (sampleNames, callSets) pair of lists for the CallSets
+        in this VariantSet, sorted by sample name.
+        """
+        if self._callSetNameIndex is None:
+            callSets = sorted(
+                self._callSets, key=lambda callSet: callSet.getSampleName())
+            sampleNames = [callSet.getSampleName() for callSet in callSets]
+            self._callSetNameIndex = sampleNames, callSets
+        return self._callSetNameIndex
+
+    def getCallSetsByName(self, name):
+        """
+        Returns the list of CallSets in this VariantSet with the specified
+        sample name.
+        """
+        sampleNames, callSets = self._getCallSetNameIndex()
+        start = bisect.bisect_left(sampleNames, name)
+        end = bisect.bisect_right(sampleNames, name)
+        return callSets[start:end]
+
+    def getCallSetsByNamePrefix(self, prefix):
+        """
+        Returns the list of CallSets in this VariantSet whose sample names
+        start with the specified prefix, sorted by sample name.
         """
-        return self._callSetIdMap.values()
+        sampleNames, callSets = self._getCallSetNameIndex()
+        start = bisect.bisect_left(sampleNames, prefix)
+        end = len(sampleNames)
+        if prefix != "":
+            # The smallest string greater than all strings with prefix.
+            upperBound = prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+            end = bisect.bisect_left(sampleNames, upperBound)
+        return callSets[start:end]
 
     def toProtocolElement(self):
         """
@@ -164,6 +539,220 @@ class AbstractVariantSet(datamodel.DatamodelObject):
         """
         raise NotImplementedError()
 
+    def getVariantCounts(
+            self, referenceName, startPosition, endPosition,
+            variantName=None, callSetIds=None, variantFilter=None,
+            binSize=None):
+        """
+        Returns the (count, binCounts) pair for the variants that
+        getVariants returns for the same parameters; see
+        datamodel.countPositions.
+        """
+        variants = self.getVariants(
+            referenceName, startPosition, endPosition, variantName,
+            callSetIds, variantFilter=variantFilter)
+        return datamodel.countPositions(
+            (variant.start for variant in variants), startPosition,
+            binSize)
+
+    def getAlleleFrequencies(
+            self, referenceName, startPosition, endPosition,
+            callSetIds=None, variantFilter=None, minStart=None):
+        """
+        Returns an iterator over TranscodedRecords holding the JSON
+        representations of the allele counts and frequencies in the
+        specified call sets of the specified variants; see
+        _getAlleleFrequencyRecord. The parameters are the same as those
+        of getVariants.
+        """
+        for variant in self.getVariants(
+                referenceName, startPosition, endPosition, None, callSetIds,
+                variantFilter=variantFilter, minStart=minStart):
+            alleleCounts = [0] * (len(variant.alternateBases) + 1)
+            for call in variant.calls:
+                for allele in call.genotype:
+                    if 0 <= allele < len(alleleCounts):
+                        alleleCounts[allele] += 1
+            yield self._getAlleleFrequencyRecord(
+                variant.id, variant.referenceName, variant.start,
+                variant.end, variant.referenceBases, variant.alternateBases,
+                alleleCounts)
+
+    @classmethod
+    def _getAlleleFrequencyRecord(
+            cls, variantId, referenceName, start, end, referenceBases,
+            alternateBases, alleleCounts):
+        """
+        Returns the TranscodedRecord for the allele frequencies of the
+        specified variant, given the numbers of called copies of its
+        reference and alternate alleles. The JSON object holds the
+        position and alleles of the variant, the alleleNumber (the total
+        number of called alleles), the alleleCounts of the alternate
+        alleles, and their frequencies as AlleleResources if any alleles
+        were called.
+        """
+        alleleNumber = sum(alleleCounts)
+        frequencies = []
+        if alleleNumber > 0:
+            frequencies = [
+                {"allele": allele, "frequency": count / alleleNumber}
+                for allele, count in zip(alternateBases, alleleCounts[1:])]
+        jsonDict = {
+            "variantId": variantId,
+            "referenceName": referenceName,
+            "start": start,
+            "end": end,
+            "referenceBases": referenceBases,
+            "alternateBases": list(alternateBases),
+            "alleleNumber": alleleNumber,
+            "alleleCounts": list(alleleCounts[1:]),
+            "frequencies": frequencies}
+        return datamodel.TranscodedRecord(start, end, json.dumps(jsonDict))
+
+    genotypeBlockSize = 256
+
+    def getGenotypeMatrix(
+            self, referenceName, startPosition, endPosition,
+            callSetIds=None, variantFilter=None):
+        """
+        Returns the (callSetIds, blocks) pair for the genotypes of the
+        specified call sets in the specified variants, where callSetIds
+        is the list of the call sets of the columns of the matrix, and
+        blocks is an iterator over the (starts, ends, alleles,
+        genotypeCodes) tuples for blocks of at most genotypeBlockSize
+        variants. The alleles are (referenceBases, alternateBases) pairs,
+        and genotypeCodes is an int8 numpy array of variants by call sets
+        holding the codes described in protocol.GenotypeMatrixFormat. The
+        other parameters are the same as those of getVariants.
+        """
+        if not callSetIds:
+            callSetIds = self.getCallSetIds()
+        callSetIds = list(callSetIds)
+        for callSetId in callSetIds:
+            if callSetId not in self._callSetIdMap:
+                raise exceptions.CallSetNotInVariantSetException(
+                    callSetId, self.getId())
+        variants = self.getVariants(
+            referenceName, startPosition, endPosition, None, callSetIds,
+            variantFilter=variantFilter)
+        return callSetIds, self._getGenotypeMatrixBlocks(callSetIds, variants)
+
+    def _getGenotypeMatrixBlocks(self, callSetIds, variants):
+        columns = dict(
+            (callSetId, column) for column, callSetId in enumerate(callSetIds))
+        for block in _getBlocks(variants, self.genotypeBlockSize):
+            genotypeCodes = numpy.empty(
+                (len(block), len(callSetIds)), dtype=numpy.int8)
+            genotypeCodes.fill(protocol.GenotypeMatrixFormat.missingCode)
+            for row, variant in enumerate(block):
+                for call in variant.calls:
+                    column = columns.get(call.callSetId)
+                    if (column is not None and len(call.genotype) > 0 and
+                            min(call.genotype) >= 0):
+                        genotypeCodes[row, column] = sum(
+                            1 for allele in call.genotype if allele > 0)
+            yield (
+                [variant.start for variant in block],
+                [variant.end for variant in block],
+                [(variant.referenceBases, variant.alternateBases)
+                 for variant in block],
+                genotypeCodes)
+
+    def getAlleleCounts(self, referenceName, position, allele):
+        """
+        Returns the (alleleCount, alleleNumber) pair for the specified
+        alternate allele of the variants starting at the specified
+        position, where alleleCount is the number of called copies of
+        the allele and alleleNumber is the total number of called
+        alleles at the site, or None if there is no such variant.
+        """
+        found = False
+        alleleCount = alleleNumber = 0
+        for variant in self.getVariants(
+                referenceName, position, position + 1):
+            if variant.start != position:
+                continue
+            for index, alternateBases in enumerate(variant.alternateBases):
+                if alternateBases.upper() == allele.upper():
+                    found = True
+                    for call in variant.calls:
+                        alleleCount += call.genotype.count(index + 1)
+                        alleleNumber += sum(
+                            genotypeAllele >= 0
+                            for genotypeAllele in call.genotype)
+        if not found:
+            return None
+        return alleleCount, alleleNumber
+
+    def getVariantDensitySummary(
+            self, referenceName, startPosition=None, endPosition=None,
+            binSize=None):
+        """
+        Returns the (binSize, bins) pair summarising the density of the
+        variants in the specified interval, where bins is the list of
+        (binStart, numVariants) pairs for the bins holding variants, from
+        the precomputed VariantDensityTiles. See SummaryTiles.getSummary.
+        """
+        raise exceptions.SummaryTilesNotFoundException(self.getId())
+
+    def getTranscodedVariants(
+            self, referenceName, startPosition, endPosition,
+            variantName=None, callSetIds=None, fieldMask=None,
+            variantFilter=None, minStart=None):
+        """
+        Returns an iterator over the specified variants as
+        TranscodedRecords holding their JSON representations. The
+        parameters are the same as those of getVariants.
+        """
+        for variant in self.getVariants(
+                referenceName, startPosition, endPosition, variantName,
+                callSetIds, fieldMask, variantFilter, minStart):
+            yield datamodel.TranscodedRecord(
+                variant.start, variant.end, variant.toJsonString(fieldMask))
+
+    def _parseVariantId(self, variantId):
+        """
+        Returns the (referenceName, position) pair encoded in the
+        specified variant ID, which has the form
+        "{variantSetId}:{referenceName}:{position}". Raises a
+        VariantNotFoundException if the ID is not a variant ID for this
+        VariantSet.
+        """
+        prefix = "{}:".format(self._id)
+        referenceName, _, position = variantId[len(prefix):].rpartition(":")
+        if not variantId.startswith(prefix) or referenceName == "":
+            raise exceptions.VariantNotFoundException(variantId)
+        try:
+            return referenceName, int(position)
+        except ValueError:
+            raise exceptions.VariantNotFoundException(variantId)
+
+    def getVariant(self, variantId, fieldMask=None):
+        """
+        Returns the Variant with the specified ID. If a FieldMask is
+        specified, the fields of the variant that it does not select may
+        be left unset. If several variants have the ID, because they
+        start at the same position, the first one is returned.
+        """
+        referenceName, position = self._parseVariantId(variantId)
+        # Subclasses differ in whether the position in the ID is 0 or
+        # 1-based, so we look at both and compare IDs.
+        for variant in self.getVariants(
+                referenceName, position - 1, position + 1,
+                fieldMask=fieldMask):
+            if variant.id == variantId:
+                return variant
+        raise exceptions.VariantNotFoundException(variantId)
+
+    def getTranscodedVariant(self, variantId, fieldMask=None):
+        """
+        Returns the Variant with the specified ID as a TranscodedRecord.
+        The parameters are the same as those of getVariant.
+        """
+        variant = self.getVariant(variantId, fieldMask)
+        return datamodel.TranscodedRecord(
+            variant.start, variant.end, variant.toJsonString(fieldMask))
+
     def _createGaVariant(self):
         """
         Convenience method to set the common fields in a GA Variant
@@ -200,9 +789,15 @@ class SimulatedVariantSet(AbstractVariantSet):
         return ret
 
     def getVariants(self, referenceName, startPosition, endPosition,
-                    variantName=None, callSetIds=None):
+                    variantName=None, callSetIds=None, fieldMask=None,
+                    variantFilter=None, minStart=None):
+        if variantFilter is not None:
+            raise exceptions.NotImplementedException(
+                "Variant filters are not supported for simulated data")
         randomNumberGenerator = random.Random()
         i = startPosition
+        if minStart is not None:
+            i = max(i, minStart)
         while i < endPosition:
             randomNumberGenerator.seed(self._randomSeed + i)
             if randomNumberGenerator.random() < self._variantDensity:
@@ -249,6 +844,19 @@ class SimulatedVariantSet(AbstractVariantSet):
         return variant
 
 
+def _getBlocks(iterator, blockSize):
+    """
+    Returns an iterator over the lists of at most blockSize consecutive
+    items of the specified iterator.
+    """
+    iterator = iter(iterator)
+    while True:
+        block = list(itertools.islice(iterator, blockSize))
+        if len(block) == 0:
+            break
+        yield block
+
+
 def _encodeValue(value):
     if isinstance(value, (list, tuple)):
         return [str(v) for v in value]
@@ -269,11 +877,22 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
     Class representing a single variant set backed by a directory of indexed
     VCF or BCF files.
     """
+    # The maximum number of variant files opened to decode a subset of
+    # the samples that we keep for reuse.
+    sampleSubsetPoolSize = 16
+
     def __init__(self, id_, dataDir):
         super(HtslibVariantSet, self).__init__(id_)
         self._dataDir = dataDir
         self._setAccessTimes(dataDir)
         self._chromFileMap = {}
+        self._searchFiles = datamodel.HtslibFilePool()
+        self._sampleSubsetFiles = datamodel.HtslibFilePool(
+            self.sampleSubsetPoolSize)
+        self._variantNameIndexes = {}
+        self._variantDensityTiles = {}
+        self._variantAlleleIndexes = {}
+        self._numVariants = None
         self._metadata = None
         self._scanDataFiles(dataDir, ['*.bcf', '*.vcf.gz'])
 
@@ -293,10 +912,15 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
 
     def getNumVariants(self):
         """
-        Returns the total number of variants in this VariantSet.
+        Returns the total number of variants in this VariantSet. Tabix
+        indexes do not record the number of records, so the records are
+        counted once, without decoding their samples.
         """
-        # TODO How do we get the number of records in a VariantFile?
-        return 0
+        if self._numVariants is None:
+            self._numVariants = sum(
+                self.getVariantCounts(referenceName, 0, self.vcfMax)[0]
+                for referenceName in self._chromFileMap)
+        return self._numVariants
 
     def getCallSet(self, sampleName):
         """
@@ -326,6 +950,21 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
         varFile = pysam.VariantFile(filename)
         if varFile.index is None:
             raise exceptions.NotIndexedException(filename)
+        variantNameIndex = None
+        indexFileName = VariantNameIndex.getIndexFileName(filename)
+        if os.path.exists(indexFileName):
+            variantNameIndex = VariantNameIndex(indexFileName)
+            variantNameIndex.checkDataFile(filename)
+        variantDensityTiles = None
+        tilesFileName = VariantDensityTiles.getTilesFileName(filename)
+        if os.path.exists(tilesFileName):
+            variantDensityTiles = VariantDensityTiles(tilesFileName)
+            variantDensityTiles.checkDataFile(filename)
+        variantAlleleIndex = None
+        indexFileName = VariantAlleleIndex.getIndexFileName(filename)
+        if os.path.exists(indexFileName):
+            variantAlleleIndex = VariantAlleleIndex(indexFileName)
+            variantAlleleIndex.checkDataFile(filename)
         for chrom in varFile.index:
             # Unlike Tabix indices, CSI indices include all contigs defined
             # in the BCF header.  Thus we must test each one to see if
@@ -338,8 +977,57 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
                 self._updateMetadata(varFile)
                 self._updateCallSetIds(varFile)
                 self._chromFileMap[chrom] = varFile
+                if variantNameIndex is not None:
+                    self._variantNameIndexes[chrom] = variantNameIndex
+                if variantDensityTiles is not None:
+                    self._variantDensityTiles[chrom] = variantDensityTiles
+                if variantAlleleIndex is not None:
+                    self._variantAlleleIndexes[chrom] = variantAlleleIndex
+
+    def _getSampleSubsetFile(self, varFile, callSetIds):
+        """
+        Returns the calling thread's variant file for the same data as
+        the specified VariantFile that only decodes the samples for the
+        specified call set IDs. Files are kept in a small pool keyed by
+        the sample subset so that repeated searches for the same call
+        sets can reuse them.
+        """
+        fileName = varFile.filename
+        if len(callSetIds) == len(self._callSetIds):
+            return self._searchFiles.get(
+                fileName, lambda: pysam.VariantFile(fileName))
+        sampleNames = frozenset(
+            self._callSetIdMap[callSetId].getSampleName()
+            for callSetId in callSetIds)
+
+        def openSubsetFile():
+            subsetFile = pysam.VariantFile(fileName)
+            subsetFile.subset_samples(
+                [sample for sample in varFile.header.samples
+                 if sample in sampleNames])
+            return subsetFile
 
-    def _convertGaCall(self, recordId, name, pysamCall, genotypeData):
+        return self._sampleSubsetFiles.get(
+            (fileName, sampleNames), openSubsetFile)
+
+    def _getCallValues(self, pysamCall, fieldMask=None):
+        """
+        Returns the (genotypeLikelihood, info) pair for the specified
+        pysam call. Only the values selected by the FieldMask are read.
+        """
+        genotypeLikelihood = []
+        info = {}
+        includeInfo = fieldMask is None or fieldMask.includes("info")
+        if includeInfo or fieldMask.includes("genotypeLikelihood"):
+            for key, value in pysamCall.iteritems():
+                if key == 'GL' and value is not None:
+                    genotypeLikelihood = list(value)
+                elif key != 'GT' and includeInfo:
+                    info[key] = _encodeValue(value)
+        return genotypeLikelihood, info
+
+    def _convertGaCall(
+            self, recordId, name, pysamCall, genotypeData, fieldMask=None):
         callSet = self.getCallSet(name)
         call = protocol.Call()
         call.callSetId = callSet.getId()
@@ -349,8 +1037,9 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
         # NOTE: THE FOLLOWING TWO LINES IS NOT THE INTENED IMPLEMENTATION,
         ###########################################
         call.phaseset = None
-        call.genotype, call.phaseset = convertVCFGenotype(
-            genotypeData, call.phaseset)
+        if genotypeData is not None:
+            call.genotype, call.phaseset = convertVCFGenotype(
+                genotypeData, call.phaseset)
         ###########################################
 
         # THEY SHOULD BE REPLACED BY THE FOLLOWING, ONCE NEW PYSAM
@@ -362,19 +1051,49 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
         # call.phaseset = pysamCall.phaseset
         ###########################################
 
-        call.genotypeLikelihood = []
-        for key, value in pysamCall.iteritems():
-            if key == 'GL' and value is not None:
-                call.genotypeLikelihood = list(value)
-            elif key != 'GT':
-                call.info[key] = _encodeValue(value)
+        call.genotypeLikelihood, call.info = self._getCallValues(
+            pysamCall, fieldMask)
         return call
 
-    def convertVariant(self, record, callSetIds):
+    def _getVariantInfo(self, record):
+        info = {}
+        for key, value in record.info.iteritems():
+            if value is not None:
+                info[key] = _encodeValue(value)
+        return info
+
+    def _getSampleCalls(self, record, callSetIds, fieldMask=None):
+        """
+        Returns an iterator over the (sampleName, pysamCall, genotypeData)
+        tuples for the samples in the specified record that belong to the
+        specified call sets. The genotypeData is None if the FieldMask for
+        the calls selects neither the genotype nor the phaseset.
+        """
+        includeGenotype = (
+            fieldMask is None or fieldMask.includes("genotype") or
+            fieldMask.includes("phaseset"))
+
+        # NOTE: THE LABELED LINES SHOULD BE REMOVED ONCE PYSAM SUPPORTS
+        # phaseset
+
+        if includeGenotype:
+            sampleData = record.__str__().split()[9:]  # REMOVAL
+        genotypeData = None
+        sampleIterator = 0  # REMOVAL
+        for name, call in record.samples.iteritems():
+            if self.getCallSetId(name) in callSetIds:
+                if includeGenotype:
+                    genotypeData = sampleData[sampleIterator].split(
+                        ":")[0]  # REMOVAL
+                yield name, call, genotypeData
+            sampleIterator += 1  # REMOVAL
+
+    def convertVariant(self, record, callSetIds, fieldMask=None):
         """
         Converts the specified pysam variant record into a GA4GH Variant
         object. Only calls for the specified list of callSetIds will
-        be included.
+        be included. If a FieldMask is specified, the fields that it does
+        not select may be left unset.
         """
         variant = self._createGaVariant()
         # N.B. record.pos is 1-based
@@ -392,34 +1111,84 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
             variant.alternateBases = list(record.alts)
         # record.filter and record.qual are also available, when supported
         # by GAVariant.
-        for key, value in record.info.iteritems():
-            if value is not None:
-                variant.info[key] = _encodeValue(value)
-
-        # NOTE: THE LABELED LINES SHOULD BE REMOVED ONCE PYSAM SUPPORTS
-        # phaseset
-
-        sampleData = record.__str__().split()[9:]  # REMOVAL
+        if fieldMask is None or fieldMask.includes("info"):
+            variant.info = self._getVariantInfo(record)
         variant.calls = []
-        sampleIterator = 0  # REMOVAL
-        for name, call in record.samples.iteritems():
-            if self.getCallSetId(name) in callSetIds:
-                genotypeData = sampleData[sampleIterator].split(
-                    ":")[0]  # REMOVAL
-                variant.calls.append(self._convertGaCall(
-                    record.id, name, call, genotypeData))  # REPLACE
-            sampleIterator += 1  # REMOVAL
+        if fieldMask is not None and not fieldMask.includes("calls"):
+            return variant
+        callFieldMask = None
+        if fieldMask is not None:
+            callFieldMask = fieldMask.getSubMask("calls")
+        for name, call, genotypeData in self._getSampleCalls(
+                record, callSetIds, callFieldMask):
+            variant.calls.append(self._convertGaCall(
+                record.id, name, call, genotypeData,
+                callFieldMask))  # REPLACE
         return variant
 
-    def getVariants(self, referenceName, startPosition, endPosition,
-                    variantName=None, callSetIds=None):
+    def transcodeVariant(self, record, callSetIds, fieldMask=None):
         """
-        Returns an iterator over the specified variants. The parameters
-        correspond to the attributes of a GASearchVariantsRequest object.
+        Returns the JSON representation of the GA4GH Variant for the
+        specified pysam variant record without constructing the Variant.
+        The result is equivalent to that of
+        convertVariant(record, callSetIds).toJsonString(fieldMask).
+        """
+        info = {}
+        if fieldMask is None or fieldMask.includes("info"):
+            info = self._getVariantInfo(record)
+        calls = []
+        if fieldMask is None or fieldMask.includes("calls"):
+            callFieldMask = None
+            if fieldMask is not None:
+                callFieldMask = fieldMask.getSubMask("calls")
+            for name, call, genotypeData in self._getSampleCalls(
+                    record, callSetIds, callFieldMask):
+                callSet = self.getCallSet(name)
+                genotype, phaseset = [], None
+                if genotypeData is not None:
+                    genotype, phaseset = convertVCFGenotype(
+                        genotypeData, phaseset)
+                genotypeLikelihood, callInfo = self._getCallValues(
+                    call, callFieldMask)
+                calls.append({
+                    "callSetId": callSet.getId(),
+                    "callSetName": callSet.getSampleName(),
+                    "genotype": genotype,
+                    "phaseset": phaseset,
+                    "genotypeLikelihood": genotypeLikelihood,
+                    "info": callInfo})
+        names = []
+        if record.id is not None:
+            names = record.id.split(';')
+        alternateBases = []
+        if record.alts is not None:
+            alternateBases = list(record.alts)
+        jsonDict = {
+            "id": "{0}:{1}:{2}".format(self._id, record.contig, record.pos),
+            "variantSetId": self._id,
+            "names": names,
+            "created": self._creationTime,
+            "updated": self._updatedTime,
+            "referenceName": record.contig,
+            "start": record.start,
+            "end": record.stop,
+            "referenceBases": record.ref,
+            "alternateBases": alternateBases,
+            "info": info,
+            "calls": calls}
+        if fieldMask is not None:
+            jsonDict = protocol.Variant.maskJsonDict(jsonDict, fieldMask)
+        return json.dumps(jsonDict)
+
+    def _getRecords(
+            self, referenceName, startPosition, endPosition, variantName,
+            callSetIds, fieldMask, variantFilter, minStart=None):
+        """
+        Returns the (callSetIds, records) pair for the specified search,
+        where records is an iterator over the pysam records for the
+        variants accepted by the VariantFilter, and callSetIds is the set
+        of call set IDs whose calls are returned.
         """
-        if variantName is not None:
-            raise exceptions.NotImplementedException(
-                "Searching by variantName is not supported")
         # For v0.5.1, callSetIds=[] actually means return all callSets.
         # In v0.6+, callSetIds=[] means return no call sets, and
         # callSetIds=None means return all call sets. For forward
@@ -436,15 +1205,324 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
                         callSetId, self.getId())
         if len(callSetIds) == 0:
             callSetIds = self._callSetIds
-        if referenceName in self._chromFileMap:
-            varFile = self._chromFileMap[referenceName]
-            referenceName, startPosition, endPosition = \
-                self.sanitizeVariantFileFetch(
-                    referenceName, startPosition, endPosition)
-            cursor = varFile.fetch(
+        callSetIds = set(callSetIds)
+        decodedCallSetIds = callSetIds
+        if (fieldMask is not None and not fieldMask.includes("calls") and
+                (variantFilter is None or not variantFilter.usesGenotypes())):
+            decodedCallSetIds = set()
+        if referenceName not in self._chromFileMap:
+            return callSetIds, []
+        # Restricting the samples decoded by htslib means that the
+        # cost of reading a record depends on the number of call sets
+        # requested rather than the number of samples in the file.
+        varFile = self._getSampleSubsetFile(
+            self._chromFileMap[referenceName], decodedCallSetIds)
+        referenceName, startPosition, endPosition = \
+            self.sanitizeVariantFileFetch(
                 referenceName, startPosition, endPosition)
-            for record in cursor:
-                yield self.convertVariant(record, callSetIds)
+        if variantName is not None:
+            records = self._getNamedRecords(
+                varFile, referenceName, startPosition, endPosition,
+                variantName)
+        else:
+            # An iterator kept open as a search cursor is interleaved with
+            # other searches, so it needs its own handle.
+            records = varFile.fetch(
+                referenceName, startPosition, endPosition,
+                reopen=self.searchCursors)
+        if minStart is not None:
+            # The start of a record is read without decoding its samples.
+            records = itertools.ifilter(
+                lambda record: record.start >= minStart, records)
+        if variantFilter is not None:
+            records = itertools.ifilter(variantFilter.accepts, records)
+        return callSetIds, records
+
+    def getReferenceNames(self):
+        """
+        Returns the sorted list of the names of the references that have
+        variants in this VariantSet.
+        """
+        return sorted(self._chromFileMap)
+
+    def getRecords(self, referenceName):
+        """
+        Returns an iterator over the pysam records of all the variants on
+        the specified reference, with the samples of all the call sets
+        decoded.
+        """
+        _, records = self._getRecords(
+            referenceName, 0, self.vcfMax, None, None, None, None)
+        return records
+
+    def _getNamedRecords(
+            self, varFile, referenceName, startPosition, endPosition,
+            variantName):
+        """
+        Returns the list of records in the specified variant file with
+        the specified name that overlap the specified interval, using the
+        variant name index of the file.
+        """
+        variantNameIndex = self._variantNameIndexes.get(referenceName)
+        if variantNameIndex is None:
+            raise exceptions.NotImplementedException(
+                "Searching by variantName requires a variant name index")
+        records = []
+        for contig, position in variantNameIndex.getPositions(variantName):
+            if contig != referenceName or position >= endPosition:
+                continue
+            for record in varFile.fetch(
+                    referenceName, position, position + 1):
+                if (record.start == position and
+                        record.stop > startPosition and
+                        record.id is not None and
+                        variantName in record.id.split(';')):
+                    records.append(record)
+        return records
+
+    def getVariants(self, referenceName, startPosition, endPosition,
+                    variantName=None, callSetIds=None, fieldMask=None,
+                    variantFilter=None, minStart=None):
+        """
+        Returns an iterator over the specified variants. The parameters
+        correspond to the attributes of a GASearchVariantsRequest object.
+        If a FieldMask is specified, the fields of the variants that it
+        does not select may be left unset. If a VariantFilter is
+        specified, only the variants that it accepts are returned. If
+        minStart is specified, the variants starting before it are
+        skipped without being converted; this is used to resume a search
+        at a page boundary.
+        """
+        callSetIds, records = self._getRecords(
+            referenceName, startPosition, endPosition, variantName,
+            callSetIds, fieldMask, variantFilter, minStart)
+        for record in records:
+            yield self.convertVariant(record, callSetIds, fieldMask)
+
+    def getTranscodedVariants(
+            self, referenceName, startPosition, endPosition,
+            variantName=None, callSetIds=None, fieldMask=None,
+            variantFilter=None, minStart=None):
+        """
+        Returns an iterator over the specified variants as
+        TranscodedRecords, writing the pysam records directly as JSON.
+        The parameters are the same as those of getVariants.
+        """
+        callSetIds, records = self._getRecords(
+            referenceName, startPosition, endPosition, variantName,
+            callSetIds, fieldMask, variantFilter, minStart)
+        for record in records:
+            yield datamodel.TranscodedRecord(
+                record.start, record.stop,
+                self.transcodeVariant(record, callSetIds, fieldMask))
+
+    def getVariantCounts(
+            self, referenceName, startPosition, endPosition,
+            variantName=None, callSetIds=None, variantFilter=None,
+            binSize=None):
+        # Counting does not need the calls, so the samples are only
+        # decoded if the filter uses genotypes.
+        _, records = self._getRecords(
+            referenceName, startPosition, endPosition, variantName,
+            callSetIds, protocol.FieldMask(), variantFilter)
+        return datamodel.countPositions(
+            (record.start for record in records), startPosition, binSize)
+
+    def getAlleleFrequencies(
+            self, referenceName, startPosition, endPosition,
+            callSetIds=None, variantFilter=None, minStart=None):
+        # Only the requested samples are decoded, and their genotypes are
+        # read into an integer array for a block of records at a time,
+        # which is reduced with numpy.
+        callSetIds, records = self._getRecords(
+            referenceName, startPosition, endPosition, None, callSetIds,
+            None, variantFilter, minStart)
+        for block in _getBlocks(records, self.genotypeBlockSize):
+            for alleleFrequencyRecord in self._getBlockAlleleFrequencies(
+                    block):
+                yield alleleFrequencyRecord
+
+    def _getRecordGenotypes(self, record, numCalls):
+        """
+        Returns the list of the allele index tuples of the GT values of the
+        numCalls decoded samples of the specified pysam record, with -1 for
+        the alleles that are not called. Calls without a GT value,
+        including all those of records whose FORMAT has no GT key, are
+        returned as (-1,).
+        """
+        formatKeys = list(record.format.keys())
+        if formatKeys[:1] == ["GT"]:
+            genotypes = [
+                sample.allele_indices
+                for sample in record.samples.itervalues()]
+        elif "GT" in formatKeys:
+            # pysam reads the GT values wrongly when GT is not the first
+            # FORMAT key, so these rare records are read from their text.
+            gtIndex = formatKeys.index("GT")
+            genotypes = []
+            for sample in str(record).rstrip("\n").split("\t")[9:]:
+                values = sample.split(":")
+                genotype = "."
+                if gtIndex < len(values):
+                    genotype = values[gtIndex] or "."
+                genotypes.append(tuple(
+                    -1 if allele == "." else int(allele)
+                    for allele in genotype.replace("|", "/").split("/")))
+        else:
+            genotypes = []
+        genotypes = genotypes[:numCalls]
+        return genotypes + [(-1,)] * (numCalls - len(genotypes))
+
+    def _getBlockGenotypes(self, records):
+        """
+        Returns the (alleles, callIndexes, numCalls) tuple for the
+        genotypes of the decoded samples of the specified list of pysam
+        records. The alleles are a numpy array of the allele indexes of
+        all the genotypes, with -1 for alleles that are not called, and
+        callIndexes holds the index of the call of each allele, counting
+        the numCalls calls of each record in order.
+        """
+        numCalls = len(records[0].samples)
+        genotypes = []
+        for record in records:
+            genotypes.extend(self._getRecordGenotypes(record, numCalls))
+        ploidies = [len(genotype) for genotype in genotypes]
+        alleles = numpy.fromiter(
+            itertools.chain.from_iterable(genotypes), dtype=numpy.int64,
+            count=sum(ploidies))
+        callIndexes = numpy.repeat(numpy.arange(len(genotypes)), ploidies)
+        return alleles, callIndexes, numCalls
+
+    def _getBlockAlleleFrequencies(self, records):
+        """
+        Returns the list of allele frequency TranscodedRecords for the
+        specified list of pysam records.
+        """
+        alleles, callIndexes, numCalls = self._getBlockGenotypes(records)
+        recordIndexes = callIndexes // max(numCalls, 1)
+        maxNumAlleles = max(len(record.alleles) for record in records)
+        called = (alleles >= 0) & (alleles < maxNumAlleles)
+        alleleCounts = numpy.bincount(
+            recordIndexes[called] * maxNumAlleles + alleles[called],
+            minlength=len(records) * maxNumAlleles).reshape(
+                len(records), maxNumAlleles)
+        return [
+            self._getAlleleFrequencyRecord(
+                "{}:{}:{}".format(self._id, record.contig, record.pos),
+                record.contig, record.start, record.stop, record.ref,
+                record.alts or (),
+                alleleCounts[index, :len(record.alleles)].tolist())
+            for index, record in enumerate(records)]
+
+    def getGenotypeMatrix(
+            self, referenceName, startPosition, endPosition,
+            callSetIds=None, variantFilter=None):
+        callSetIds, records = self._getRecords(
+            referenceName, startPosition, endPosition, None, callSetIds,
+            None, variantFilter)
+        # The decoded samples are in the order of the file, which is
+        # therefore the order of the columns.
+        samples = [
+            self._callSetIdMap[callSetId].getSampleName()
+            for callSetId in self._callSetIds]
+        if referenceName in self._chromFileMap:
+            samples = self._chromFileMap[referenceName].header.samples
+        callSetIds = [
+            self.getCallSetId(sample) for sample in samples
+            if self.getCallSetId(sample) in callSetIds]
+        return callSetIds, self._getHtslibGenotypeMatrixBlocks(
+            len(callSetIds), records)
+
+    def _getHtslibGenotypeMatrixBlocks(self, numCalls, records):
+        for block in _getBlocks(records, self.genotypeBlockSize):
+            alleles, callIndexes, _ = self._getBlockGenotypes(block)
+            numAlternateAlleles = numpy.bincount(
+                callIndexes, weights=alleles > 0,
+                minlength=len(block) * numCalls)
+            numMissingAlleles = numpy.bincount(
+                callIndexes, weights=alleles < 0,
+                minlength=len(block) * numCalls)
+            genotypeCodes = numAlternateAlleles.astype(numpy.int8)
+            genotypeCodes[numMissingAlleles > 0] = \
+                protocol.GenotypeMatrixFormat.missingCode
+            yield (
+                [record.start for record in block],
+                [record.stop for record in block],
+                [(record.ref, record.alts or ()) for record in block],
+                genotypeCodes.reshape(len(block), numCalls))
+
+    def getAlleleCounts(self, referenceName, position, allele):
+        variantAlleleIndex = self._variantAlleleIndexes.get(referenceName)
+        if variantAlleleIndex is not None:
+            return variantAlleleIndex.getAlleleCounts(
+                referenceName, position, allele)
+        if referenceName not in self._chromFileMap:
+            return None
+        # Without an index, the records at the position are read, and
+        # counted in the same way as when building the index.
+        varFile = self._chromFileMap[referenceName]
+        useInfo = VariantAlleleIndex.usesInfo(varFile)
+        if useInfo:
+            varFile = self._getSampleSubsetFile(varFile, set())
+        else:
+            varFile = self._getSampleSubsetFile(varFile, self._callSetIds)
+        referenceName, start, end = self.sanitizeVariantFileFetch(
+            referenceName, position, position + 1)
+        found = False
+        alleleCount = alleleNumber = 0
+        for record in varFile.fetch(referenceName, start, end):
+            if record.start != position or record.alts is None:
+                continue
+            recordAlleleCounts, recordAlleleNumber = \
+                VariantAlleleIndex.getRecordAlleleCounts(record, useInfo)
+            for alt, count in zip(record.alts, recordAlleleCounts):
+                if alt.upper() == allele.upper():
+                    found = True
+                    alleleCount += count
+                    alleleNumber += recordAlleleNumber
+        if not found:
+            return None
+        return alleleCount, alleleNumber
+
+    def getVariantDensitySummary(
+            self, referenceName, startPosition=None, endPosition=None,
+            binSize=None):
+        variantDensityTiles = self._variantDensityTiles.get(referenceName)
+        if variantDensityTiles is None:
+            if (referenceName in self._chromFileMap or
+                    len(self._variantDensityTiles) == 0):
+                raise exceptions.SummaryTilesNotFoundException(self.getId())
+            # There are no variants on this reference, but we still need
+            # the bin sizes of the tiles to choose the bin size.
+            variantDensityTiles = next(iter(
+                self._variantDensityTiles.values()))
+        return variantDensityTiles.getSummary(
+            referenceName, startPosition, endPosition, binSize)
+
+    def _getRecordById(self, variantId, fieldMask):
+        """
+        Returns the (callSetIds, record) pair for the first pysam record
+        with the specified variant ID, using a fetch of the single base
+        at the 1-based position in the ID.
+        """
+        referenceName, position = self._parseVariantId(variantId)
+        callSetIds, records = self._getRecords(
+            referenceName, position - 1, position, None, None, fieldMask,
+            None)
+        for record in records:
+            if record.pos == position:
+                return callSetIds, record
+        raise exceptions.VariantNotFoundException(variantId)
+
+    def getVariant(self, variantId, fieldMask=None):
+        callSetIds, record = self._getRecordById(variantId, fieldMask)
+        return self.convertVariant(record, callSetIds, fieldMask)
+
+    def getTranscodedVariant(self, variantId, fieldMask=None):
+        callSetIds, record = self._getRecordById(variantId, fieldMask)
+        return datamodel.TranscodedRecord(
+            record.start, record.stop,
+            self.transcodeVariant(record, callSetIds, fieldMask))
 
     def getMetadata(self):
         return self._metadata
@@ -494,3 +1572,664 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
                         number="{}".format(value.number),
                         description=description))
         return ret
+
+
+class StringColumnWriter(object):
+    """
+    Writes a string column of a ColumnarVariantSet store as the strings
+    are appended: the UTF-8 bytes of all the strings, and the offsets of
+    each in the bytes. The bytes are written to a temporary file and
+    copied into the column when it is closed, so that they are not held
+    in memory.
+    """
+    copyChunkSize = 2**24
+
+    def __init__(self, storeDir, name):
+        self._storeDir = storeDir
+        self._name = name
+        self._bytesFileName = os.path.join(storeDir, name + ".bytes")
+        self._bytesFile = open(self._bytesFileName, "wb")
+        self._offsets = array.array(str("l"), [0])
+
+    def append(self, string):
+        encodedString = string.encode("utf-8")
+        self._bytesFile.write(encodedString)
+        self._offsets.append(self._offsets[-1] + len(encodedString))
+
+    def close(self):
+        self._bytesFile.close()
+        numpy.save(
+            os.path.join(self._storeDir, self._name + "Offsets.npy"),
+            numpy.frombuffer(self._offsets, dtype=numpy.int_).astype(
+                numpy.int64))
+        numBytes = self._offsets[-1]
+        column = numpy.lib.format.open_memmap(
+            os.path.join(self._storeDir, self._name + ".npy"), mode="w+",
+            dtype=numpy.uint8, shape=(numBytes,))
+        with open(self._bytesFileName, "rb") as bytesFile:
+            for start in xrange(0, numBytes, self.copyChunkSize):
+                chunk = bytesFile.read(self.copyChunkSize)
+                column[start:start + len(chunk)] = numpy.frombuffer(
+                    chunk, dtype=numpy.uint8)
+        column.flush()
+        del column
+        os.remove(self._bytesFileName)
+
+
+class ColumnarVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
+    """
+    A variant set backed by a columnar store ingested from the VCF or BCF
+    files of a VariantSet directory by ga4gh_ingest_variants. The store
+    is the storeDirName subdirectory, holding a manifest and the columns
+    of the variants as numpy arrays. The columns are memory mapped, so
+    the pages of the store are shared by all the server processes.
+
+    The variants are sorted by reference and start. The rows overlapping
+    an interval are found by binary search of the starts and of the
+    running maximum of the ends on each reference, using a coarse
+    in-memory index of every positionIndexInterval-th row to find the
+    pages to search. The genotypes are stored as an int16 array of
+    variants by call sets by alleles, padded with paddingAllele, and the
+    genotype likelihoods as a float64 array padded with NaN. The info of
+    each call is a separate string, so that only the calls requested are
+    decoded.
+    """
+    storeDirName = "columns"
+    manifestFileName = "manifest.json"
+    formatVersion = 2
+    positionIndexInterval = 1024
+    paddingAllele = -2
+    _dataFilePatterns = ["*.bcf", "*.vcf.gz"]
+    _rowColumnNames = [
+        "starts", "ends", "maxEnds", "quals", "passed", "genotypes",
+        "phased", "likelihoods"]
+    _stringColumnNames = ["names", "alleles", "infos", "callInfos"]
+    _indexColumnNames = ["indexStarts", "indexMaxEnds"]
+
+    def __init__(self, id_, dataDir):
+        super(ColumnarVariantSet, self).__init__(id_)
+        self._dataDir = dataDir
+        self._setAccessTimes(dataDir)
+        self._storeDir = self.getStoreDir(dataDir)
+        manifestFileName = os.path.join(
+            self._storeDir, self.manifestFileName)
+        try:
+            with open(manifestFileName) as manifestFile:
+                manifest = json.load(manifestFile)
+        except (IOError, ValueError):
+            raise exceptions.InvalidColumnarVariantStoreException(
+                self._storeDir)
+        # The variant files may be removed once they have been ingested,
+        # but if they are still there, they must not have changed.
+        dataFileSizes = self._getDataFileSizes(dataDir)
+        if (manifest.get("formatVersion") != self.formatVersion or
+                (len(dataFileSizes) > 0 and
+                 dataFileSizes != manifest["dataFiles"])):
+            raise exceptions.InvalidColumnarVariantStoreException(
+                self._storeDir)
+        for sampleName in manifest["sampleNames"]:
+            self.addCallSet(sampleName)
+        self._callSetColumns = dict(
+            (callSetId, column)
+            for column, callSetId in enumerate(self._callSetIds))
+        self._metadata = [
+            protocol.VariantSetMetadata.fromJsonDict(metadata)
+            for metadata in manifest["metadata"]]
+        self._references = manifest["references"]
+        self._positionIndexInterval = manifest["positionIndexInterval"]
+        self._columns = {}
+        for name in self._rowColumnNames:
+            self._columns[name] = self._loadColumn(name)
+        for name in self._stringColumnNames:
+            self._columns[name + "Offsets"] = self._loadColumn(
+                name + "Offsets")
+            self._columns[name] = self._loadColumn(name)
+        # The coarse index is small, so it is read into memory.
+        for name in self._indexColumnNames:
+            self._columns[name] = numpy.array(self._loadColumn(name))
+        numVariants = len(self._columns["starts"])
+        numCallSets = len(self._callSetIds)
+        numStrings = dict(
+            (name, numVariants) for name in self._stringColumnNames)
+        numStrings["callInfos"] = numVariants * numCallSets
+        if (any(len(self._columns[name]) != numVariants
+                for name in self._rowColumnNames) or
+                any(len(self._columns[name + "Offsets"]) !=
+                    numStrings[name] + 1
+                    for name in self._stringColumnNames) or
+                self._columns["genotypes"].shape[1] != numCallSets):
+            raise exceptions.InvalidColumnarVariantStoreException(
+                self._storeDir)
+
+    @classmethod
+    def getStoreDir(cls, dataDir):
+        """
+        Returns the directory of the columnar store of the VariantSet in
+        the specified directory.
+        """
+        return os.path.join(dataDir, cls.storeDirName)
+
+    @classmethod
+    def hasStore(cls, dataDir):
+        """
+        Returns True if the VariantSet directory holds a columnar store.
+        """
+        return os.path.exists(os.path.join(
+            cls.getStoreDir(dataDir), cls.manifestFileName))
+
+    @classmethod
+    def _getDataFileSizes(cls, dataDir):
+        dataFileSizes = {}
+        for pattern in cls._dataFilePatterns:
+            for fileName in glob.glob(os.path.join(dataDir, pattern)):
+                dataFileSizes[os.path.basename(fileName)] = \
+                    os.path.getsize(fileName)
+        return dataFileSizes
+
+    @classmethod
+    def ingest(cls, dataDir):
+        """
+        Writes the columnar store of the variants in the VCF or BCF files
+        in the specified VariantSet directory, replacing any existing
+        store. The records are converted in the same way as by the
+        HtslibVariantSet. Returns the number of variants stored.
+
+        The records are read twice: first to find the shape of the call
+        columns, and then to write each variant into them as it is read,
+        so that the calls are never all held in memory.
+        """
+        variantSet = HtslibVariantSet(os.path.basename(dataDir), dataDir)
+        callSetIds = variantSet.getCallSetIds()
+        callSetColumns = dict(
+            (callSet.getSampleName(), column)
+            for column, callSet in enumerate(variantSet.getCallSets()))
+        numVariants, maxPloidy, maxNumLikelihoods = 0, 0, 0
+        for referenceName in variantSet.getReferenceNames():
+            for record in variantSet.getRecords(referenceName):
+                variant = variantSet.convertVariant(record, callSetIds)
+                numVariants += 1
+                for call in variant.calls:
+                    maxPloidy = max(maxPloidy, len(call.genotype))
+                    maxNumLikelihoods = max(
+                        maxNumLikelihoods, len(call.genotypeLikelihood))
+        # The store is written next to the existing one and then moved
+        # into place, so that it is never seen half written.
+        storeDir = cls.getStoreDir(dataDir)
+        tempStoreDir = storeDir + ".tmp"
+        if os.path.exists(tempStoreDir):
+            shutil.rmtree(tempStoreDir)
+        os.mkdir(tempStoreDir)
+        numCallSets = len(callSetIds)
+        genotypes = cls._createColumn(
+            tempStoreDir, "genotypes", numpy.int16,
+            (numVariants, numCallSets, maxPloidy))
+        genotypes.fill(cls.paddingAllele)
+        likelihoods = cls._createColumn(
+            tempStoreDir, "likelihoods", numpy.float64,
+            (numVariants, numCallSets, maxNumLikelihoods))
+        likelihoods.fill(numpy.nan)
+        phased = cls._createColumn(
+            tempStoreDir, "phased", bool, (numVariants, numCallSets))
+        phased.fill(False)
+        stringColumns = dict(
+            (name, StringColumnWriter(tempStoreDir, name))
+            for name in cls._stringColumnNames)
+        columns = collections.defaultdict(list)
+        references = {}
+        row = 0
+        for referenceName in variantSet.getReferenceNames():
+            rowStart = row
+            indexStart = len(columns["indexStarts"])
+            maxEnd = 0
+            for record in variantSet.getRecords(referenceName):
+                variant = variantSet.convertVariant(record, callSetIds)
+                maxEnd = max(maxEnd, variant.end)
+                if (row - rowStart) % cls.positionIndexInterval == 0:
+                    columns["indexStarts"].append(variant.start)
+                    columns["indexMaxEnds"].append(maxEnd)
+                columns["starts"].append(variant.start)
+                columns["ends"].append(variant.end)
+                columns["maxEnds"].append(maxEnd)
+                columns["quals"].append(
+                    numpy.nan if record.qual is None else record.qual)
+                columns["passed"].append(
+                    list(record.filter.keys()) == ["PASS"])
+                stringColumns["names"].append(";".join(variant.names))
+                stringColumns["alleles"].append("\t".join(
+                    [variant.referenceBases] + variant.alternateBases))
+                stringColumns["infos"].append(json.dumps(variant.info))
+                variantCalls = [None] * numCallSets
+                for call in variant.calls:
+                    variantCalls[callSetColumns[call.callSetName]] = call
+                for column, call in enumerate(variantCalls):
+                    genotypes[row, column, :len(call.genotype)] = \
+                        call.genotype
+                    likelihoods[row, column, :len(call.genotypeLikelihood)] = \
+                        [numpy.nan if likelihood is None else likelihood
+                         for likelihood in call.genotypeLikelihood]
+                    phased[row, column] = call.phaseset is not None
+                    stringColumns["callInfos"].append(
+                        json.dumps(call.info))
+                row += 1
+            references[referenceName] = [rowStart, row, indexStart]
+        for callColumn in [genotypes, likelihoods, phased]:
+            callColumn.flush()
+        del genotypes, likelihoods, phased
+        for stringColumn in stringColumns.values():
+            stringColumn.close()
+        rowColumns = {
+            "starts": numpy.array(columns["starts"], dtype=numpy.int64),
+            "ends": numpy.array(columns["ends"], dtype=numpy.int64),
+            "maxEnds": numpy.array(columns["maxEnds"], dtype=numpy.int64),
+            "quals": numpy.array(columns["quals"], dtype=numpy.float64),
+            "passed": numpy.array(columns["passed"], dtype=bool),
+            "indexStarts": numpy.array(
+                columns["indexStarts"], dtype=numpy.int64),
+            "indexMaxEnds": numpy.array(
+                columns["indexMaxEnds"], dtype=numpy.int64)}
+        for name, values in rowColumns.items():
+            numpy.save(os.path.join(tempStoreDir, name + ".npy"), values)
+        manifest = {
+            "formatVersion": cls.formatVersion,
+            "sampleNames": [
+                callSet.getSampleName()
+                for callSet in variantSet.getCallSets()],
+            "metadata": [
+                metadata.toJsonDict()
+                for metadata in variantSet.getMetadata()],
+            "references": references,
+            "positionIndexInterval": cls.positionIndexInterval,
+            "dataFiles": cls._getDataFileSizes(dataDir)}
+        with open(os.path.join(
+                tempStoreDir, cls.manifestFileName), "w") as manifestFile:
+            json.dump(manifest, manifestFile)
+        if os.path.exists(storeDir):
+            shutil.rmtree(storeDir)
+        os.rename(tempStoreDir, storeDir)
+        return numVariants
+
+    @classmethod
+    def _createColumn(cls, storeDir, name, dtype, shape):
+        """
+        Creates the named column file with the specified type and shape
+        in the store, and returns it as a writable memory-mapped array.
+        """
+        return numpy.lib.format.open_memmap(
+            os.path.join(storeDir, name + ".npy"), mode="w+", dtype=dtype,
+            shape=shape)
+
+    def _loadColumn(self, name):
+        fileName = os.path.join(self._storeDir, name + ".npy")
+        try:
+            return numpy.load(fileName, mmap_mode="r")
+        except ValueError:
+            # Empty arrays cannot be memory mapped.
+            return numpy.load(fileName)
+        except IOError:
+            raise exceptions.InvalidColumnarVariantStoreException(
+                self._storeDir)
+
+    def _getString(self, name, index):
+        offsets = self._columns[name + "Offsets"]
+        return self._columns[name][
+            offsets[index]:offsets[index + 1]].tostring().decode("utf-8")
+
+    def getNumVariants(self):
+        return len(self._columns["starts"])
+
+    def getMetadata(self):
+        return self._metadata
+
+    def _getCallSetColumns(self, callSetIds):
+        """
+        Returns the numpy array of the columns of the specified call sets
+        in the order of the store, which is that of the variant files.
+        As for the HtslibVariantSet, None or an empty list selects all
+        the call sets.
+        """
+        if not callSetIds:
+            return numpy.arange(len(self._callSetIds))
+        for callSetId in callSetIds:
+            if callSetId not in self._callSetColumns:
+                raise exceptions.CallSetNotInVariantSetException(
+                    callSetId, self.getId())
+        return numpy.array(sorted(set(
+            self._callSetColumns[callSetId] for callSetId in callSetIds)))
+
+    def _searchColumn(self, name, index, rowStart, rowEnd, value, side):
+        """
+        Returns the position of the specified value in the sorted rows
+        [rowStart, rowEnd) of the named column, as for numpy.searchsorted.
+        The index holds every positionIndexInterval-th value of the rows,
+        using the interval of the store, so only one interval of the
+        column is searched.
+        """
+        block = int(numpy.searchsorted(index, value, side))
+        low = rowStart + max(block - 1, 0) * self._positionIndexInterval
+        high = min(rowStart + block * self._positionIndexInterval, rowEnd)
+        return low + int(numpy.searchsorted(
+            self._columns[name][low:high], value, side))
+
+    def _getRowBlocks(
+            self, referenceName, startPosition, endPosition, variantName,
+            columns, variantFilter, minStart=None):
+        """
+        Returns an iterator over the numpy arrays of the rows of the
+        variants on the specified reference that overlap the specified
+        interval, start at or after minStart if it is not None, have the
+        specified name if it is not None and pass the VariantFilter, in
+        blocks of at most genotypeBlockSize rows. The genotype filters
+        count the alleles in the specified columns.
+        """
+        referenceName, startPosition, endPosition = \
+            self.sanitizeVariantFileFetch(
+                referenceName, startPosition, endPosition)
+        if referenceName not in self._references:
+            return
+        rowStart, rowEnd, indexStart = self._references[referenceName]
+        indexEnd = indexStart + (
+            rowEnd - rowStart + self._positionIndexInterval - 1) // \
+            self._positionIndexInterval
+        # The variants overlapping the interval are those after the first
+        # whose running maximum end is after the start, that start before
+        # the end, and that end after the start.
+        firstRow = self._searchColumn(
+            "maxEnds", self._columns["indexMaxEnds"][indexStart:indexEnd],
+            rowStart, rowEnd, startPosition, "right")
+        lastRow = self._searchColumn(
+            "starts", self._columns["indexStarts"][indexStart:indexEnd],
+            rowStart, rowEnd, endPosition, "left")
+        if minStart is not None:
+            firstRow = max(firstRow, self._searchColumn(
+                "starts", self._columns["indexStarts"][indexStart:indexEnd],
+                rowStart, rowEnd, minStart, "left"))
+        for blockStart in xrange(firstRow, lastRow, self.genotypeBlockSize):
+            blockEnd = min(blockStart + self.genotypeBlockSize, lastRow)
+            accepted = self._columns["ends"][blockStart:blockEnd] > \
+                startPosition
+            if variantName is not None:
+                accepted &= numpy.array([
+                    variantName in self._getString("names", row).split(";")
+                    for row in xrange(blockStart, blockEnd)], dtype=bool)
+            if variantFilter is not None:
+                alleleCounts = None
+                if variantFilter.usesGenotypes():
+                    genotypes = self._columns["genotypes"][
+                        blockStart:blockEnd][:, columns]
+                    alleleCounts = (genotypes > 0).sum(axis=(1, 2))
+                accepted &= variantFilter.acceptsColumns(
+                    self._columns["quals"][blockStart:blockEnd],
+                    self._columns["passed"][blockStart:blockEnd],
+                    alleleCounts)
+            rows = numpy.arange(blockStart, blockEnd)[accepted]
+            if len(rows) > 0:
+                yield rows
+
+    def getVariants(self, referenceName, startPosition, endPosition,
+                    variantName=None, callSetIds=None, fieldMask=None,
+                    variantFilter=None, minStart=None):
+        columns = self._getCallSetColumns(callSetIds)
+        for rows in self._getRowBlocks(
+                referenceName, startPosition, endPosition, variantName,
+                columns, variantFilter, minStart):
+            for row in rows.tolist():
+                yield self._getVariant(referenceName, row, columns, fieldMask)
+
+    def _getVariant(self, referenceName, row, columns, fieldMask=None):
+        """
+        Returns the GA4GH Variant in the specified row, with the calls in
+        the specified columns. If a FieldMask is specified, the fields
+        that it does not select may be left unset.
+        """
+        variant = self._createGaVariant()
+        variant.referenceName = referenceName
+        variant.start = int(self._columns["starts"][row])
+        variant.end = int(self._columns["ends"][row])
+        variant.id = "{0}:{1}:{2}".format(
+            self._id, referenceName, variant.start + 1)
+        names = self._getString("names", row)
+        if names != "":
+            variant.names = names.split(";")
+        alleles = self._getString("alleles", row).split("\t")
+        variant.referenceBases = alleles[0]
+        variant.alternateBases = alleles[1:]
+        if fieldMask is None or fieldMask.includes("info"):
+            variant.info = json.loads(self._getString("infos", row))
+        variant.calls = []
+        if fieldMask is not None and not fieldMask.includes("calls"):
+            return variant
+        callFieldMask = None
+        if fieldMask is not None:
+            callFieldMask = fieldMask.getSubMask("calls")
+        includeGenotype = (
+            callFieldMask is None or callFieldMask.includes("genotype") or
+            callFieldMask.includes("phaseset"))
+        includeInfo = callFieldMask is None or callFieldMask.includes("info")
+        includeLikelihood = (
+            includeInfo or callFieldMask.includes("genotypeLikelihood"))
+        genotypes = self._columns["genotypes"][row][columns].tolist()
+        likelihoods = self._columns["likelihoods"][row][columns].tolist()
+        phased = self._columns["phased"][row][columns].tolist()
+        callInfoStart = row * len(self._callSetIds)
+        for index, column in enumerate(columns.tolist()):
+            callSet = self._callSets[column]
+            call = protocol.Call()
+            call.callSetId = callSet.getId()
+            call.callSetName = callSet.getSampleName()
+            call.sampleId = callSet.getSampleName()
+            call.phaseset = None
+            if includeGenotype:
+                call.genotype = [
+                    allele for allele in genotypes[index]
+                    if allele != self.paddingAllele]
+                if phased[index]:
+                    call.phaseset = "*"
+            call.genotypeLikelihood = []
+            call.info = {}
+            if includeLikelihood:
+                # NaN is the only float that is not equal to itself.
+                call.genotypeLikelihood = [
+                    likelihood for likelihood in likelihoods[index]
+                    if likelihood == likelihood]
+            if includeInfo:
+                call.info = json.loads(
+                    self._getString("callInfos", callInfoStart + column))
+            variant.calls.append(call)
+        return variant
+
+    def _getGenotypes(self, rows, columns):
+        return self._columns["genotypes"][rows][:, columns]
+
+    def _getAlleles(self, row):
+        alleles = self._getString("alleles", row).split("\t")
+        return alleles[0], alleles[1:]
+
+    def getVariantCounts(
+            self, referenceName, startPosition, endPosition,
+            variantName=None, callSetIds=None, variantFilter=None,
+            binSize=None):
+        columns = self._getCallSetColumns(callSetIds)
+        starts = itertools.chain.from_iterable(
+            self._columns["starts"][rows].tolist()
+            for rows in self._getRowBlocks(
+                referenceName, startPosition, endPosition, variantName,
+                columns, variantFilter))
+        return datamodel.countPositions(starts, startPosition, binSize)
+
+    def getAlleleFrequencies(
+            self, referenceName, startPosition, endPosition,
+            callSetIds=None, variantFilter=None, minStart=None):
+        columns = self._getCallSetColumns(callSetIds)
+        for rows in self._getRowBlocks(
+                referenceName, startPosition, endPosition, None, columns,
+                variantFilter, minStart):
+            alleles = [self._getAlleles(row) for row in rows.tolist()]
+            maxNumAlleles = max(
+                len(alternateBases) + 1 for _, alternateBases in alleles)
+            genotypes = self._getGenotypes(rows, columns).reshape(
+                len(rows), -1)
+            called = (genotypes >= 0) & (genotypes < maxNumAlleles)
+            rowIndexes = numpy.nonzero(called)[0]
+            alleleCounts = numpy.bincount(
+                rowIndexes * maxNumAlleles + genotypes[called],
+                minlength=len(rows) * maxNumAlleles).reshape(
+                    len(rows), maxNumAlleles)
+            starts = self._columns["starts"][rows].tolist()
+            ends = self._columns["ends"][rows].tolist()
+            for index, (referenceBases, alternateBases) in enumerate(
+                    alleles):
+                yield self._getAlleleFrequencyRecord(
+                    "{}:{}:{}".format(
+                        self._id, referenceName, starts[index] + 1),
+                    referenceName, starts[index], ends[index],
+                    referenceBases, alternateBases,
+                    alleleCounts[index, :len(alternateBases) + 1].tolist())
+
+    def getGenotypeMatrix(
+            self, referenceName, startPosition, endPosition,
+            callSetIds=None, variantFilter=None):
+        columns = self._getCallSetColumns(callSetIds)
+        callSetIds = [self._callSetIds[column] for column in columns]
+        return callSetIds, self._getColumnarGenotypeMatrixBlocks(
+            referenceName, startPosition, endPosition, columns,
+            variantFilter)
+
+    def _getColumnarGenotypeMatrixBlocks(
+            self, referenceName, startPosition, endPosition, columns,
+            variantFilter):
+        for rows in self._getRowBlocks(
+                referenceName, startPosition, endPosition, None, columns,
+                variantFilter):
+            genotypes = self._getGenotypes(rows, columns)
+            genotypeCodes = (genotypes > 0).sum(axis=2).astype(numpy.int8)
+            genotypeCodes[(genotypes == -1).any(axis=2)] = \
+                protocol.GenotypeMatrixFormat.missingCode
+            yield (
+                self._columns["starts"][rows].tolist(),
+                self._columns["ends"][rows].tolist(),
+                [self._getAlleles(row) for row in rows.tolist()],
+                genotypeCodes)
+
+
+class InMemoryVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
+    """
+    A variant set whose VCF or BCF files are small enough to be read
+    fully into memory when it is opened. The variants are converted once
+    by an HtslibVariantSet and kept, on each reference, in a list with
+    an IntervalIndex over their positions and the quality and PASS
+    columns used by VariantFilters, so that searches bypass pysam
+    entirely.
+    """
+    def __init__(self, id_, dataDir):
+        super(InMemoryVariantSet, self).__init__(id_)
+        self._dataDir = dataDir
+        self._setAccessTimes(dataDir)
+        htslibVariantSet = HtslibVariantSet(id_, dataDir)
+        for callSet in htslibVariantSet.getCallSets():
+            self.addCallSet(callSet.getSampleName())
+        self._callSetColumns = dict(
+            (callSetId, column)
+            for column, callSetId in enumerate(self._callSetIds))
+        self._metadata = htslibVariantSet.getMetadata()
+        self._references = {}
+        callSetIds = htslibVariantSet.getCallSetIds()
+        for referenceName in htslibVariantSet.getReferenceNames():
+            variants, quals, passed = [], [], []
+            for record in htslibVariantSet.getRecords(referenceName):
+                variants.append(
+                    htslibVariantSet.convertVariant(record, callSetIds))
+                quals.append(numpy.nan if record.qual is None else record.qual)
+                passed.append(list(record.filter.keys()) == ["PASS"])
+            index = datamodel.IntervalIndex(
+                [variant.start for variant in variants],
+                [variant.end for variant in variants])
+            self._references[referenceName] = (
+                variants, index, numpy.array(quals, dtype=numpy.float64),
+                numpy.array(passed, dtype=bool))
+
+    def getNumVariants(self):
+        return sum(
+            len(variants) for variants, _, _, _ in self._references.values())
+
+    def getMetadata(self):
+        return self._metadata
+
+    def _getCallSetColumns(self, callSetIds):
+        """
+        Returns the sorted list of the positions of the calls for the
+        specified call sets in the variants. As for the HtslibVariantSet,
+        None or an empty list selects all the call sets.
+        """
+        if not callSetIds:
+            return range(len(self._callSetIds))
+        for callSetId in callSetIds:
+            if callSetId not in self._callSetColumns:
+                raise exceptions.CallSetNotInVariantSetException(
+                    callSetId, self.getId())
+        return sorted(set(
+            self._callSetColumns[callSetId] for callSetId in callSetIds))
+
+    def getVariants(self, referenceName, startPosition, endPosition,
+                    variantName=None, callSetIds=None, fieldMask=None,
+                    variantFilter=None, minStart=None):
+        columns = self._getCallSetColumns(callSetIds)
+        referenceName, startPosition, endPosition = \
+            self.sanitizeVariantFileFetch(
+                referenceName, startPosition, endPosition)
+        if referenceName not in self._references:
+            return
+        variants, index, quals, passed = self._references[referenceName]
+        rows = index.getOverlapping(startPosition, endPosition, minStart)
+        if variantName is not None:
+            rows = rows[numpy.array([
+                variantName in variants[row].names for row in rows.tolist()],
+                dtype=bool)]
+        if variantFilter is not None:
+            alleleCounts = None
+            if variantFilter.usesGenotypes():
+                alleleCounts = numpy.array([
+                    self._getAlleleCount(variants[row], columns)
+                    for row in rows.tolist()], dtype=numpy.int64)
+            rows = rows[variantFilter.acceptsColumns(
+                quals[rows], passed[rows], alleleCounts)]
+        for row in rows.tolist():
+            yield self._copyVariant(variants[row], columns)
+
+    def _getAlleleCount(self, variant, columns):
+        """
+        Returns the number of non-reference alleles called in the calls
+        of the specified Variant in the specified columns.
+        """
+        return sum(
+            1 for column in columns
+            for allele in variant.calls[column].genotype if allele > 0)
+
+    def _copyVariant(self, variant, columns):
+        """
+        Returns a shallow copy of the specified stored Variant with the
+        calls in the specified columns, so that the stored variants are
+        not changed by the code serialising the results.
+        """
+        copy = protocol.Variant()
+        for name in protocol.Variant.__slots__:
+            setattr(copy, name, getattr(variant, name))
+        copy.calls = [variant.calls[column] for column in columns]
+        return copy
+
+
+def openVariantSet(variantSetId, dataDir, maxInMemorySize=0):
+    """
+    Returns the VariantSet for the specified directory. Variant sets that
+    have been ingested into a columnar store are served from the store,
+    and those whose local VCF or BCF files take at most maxInMemorySize
+    bytes in total are read into memory; the others are read with
+    htslib.
+    """
+    if ColumnarVariantSet.hasStore(dataDir):
+        return ColumnarVariantSet(variantSetId, dataDir)
+    dataFileSizes = ColumnarVariantSet._getDataFileSizes(dataDir)
+    if (maxInMemorySize > 0 and
+            sum(dataFileSizes.values()) <= maxInMemorySize and
+            not os.path.exists(os.path.join(dataDir, "urls.json"))):
+        return InMemoryVariantSet(variantSetId, dataDir)
+    return HtslibVariantSet(variantSetId, dataDir)
@@ -115,11 +115,38 @@ class BadPageTokenException(BadRequestException):
     message = "Request page token invalid"
 
 
+class BadFieldMaskException(BadRequestException):
+    def __init__(self, fields):
+        self.message = "Field mask '{}' is invalid".format(fields)
+
+
+class BadSearchOptionException(BadRequestException):
+    def __init__(self, name, value):
+        self.message = "Value '{}' for search option '{}' is invalid".format(
+            value, name)
+
+
 class InvalidJsonException(BadRequestException):
     def __init__(self, jsonString):
         self.message = "Cannot parse JSON: '{}'".format(jsonString)
 
 
+class BadIdListException(BadRequestException):
+    message = "Request must be a JSON object with a list of string 'ids'"
+
+
+class BadBatchSearchRequestException(BadRequestException):
+    message = (
+        "Batch search requests must be JSON objects with a list of "
+        "'requests', or a 'request' and a list of 'intervals'")
+
+
+class BadBeaconQueryException(BadRequestException):
+    def __init__(self, name, value):
+        self.message = "Value '{}' for beacon query '{}' is invalid".format(
+            value, name)
+
+
 class RequestValidationFailureException(BadRequestException):
     """
     A validation of the request data failed
@@ -172,6 +199,16 @@ class ReadGroupNotFoundException(ObjectNotFoundException):
         self.message = "readGroupId '{}' not found".format(readGroupId)
 
 
+class VariantNotFoundException(ObjectNotFoundException):
+    def __init__(self, variantId):
+        self.message = "variantId '{}' not found".format(variantId)
+
+
+class ReadAlignmentNotFoundException(ObjectNotFoundException):
+    def __init__(self, readId):
+        self.message = "readId '{}' not found".format(readId)
+
+
 class UnsupportedMediaTypeException(RuntimeException):
     httpStatus = 415
     message = "Unsupported media type"
@@ -196,6 +233,16 @@ class NotImplementedException(RuntimeException):
         self.message = message
 
 
+class SummaryTilesNotFoundException(NotFoundException):
+    """
+    Exception thrown when summary tiles are requested for an object for
+    which they have not been built.
+    """
+    def __init__(self, objectId):
+        self.message = (
+            "No summary tiles have been built for '{}'".format(objectId))
+
+
 class CallSetNotInVariantSetException(NotFoundException):
     """
     Indicates a request was made for a callSet not in the actual variantSet
@@ -294,6 +341,95 @@ class InconsistentCallSetIdException(MalformedException):
             " directory.".format(fileName))
 
 
+class InvalidNameIndexException(MalformedException):
+    """
+    Exception thrown when a name index is corrupt or does not match the
+    data file that it indexes.
+    """
+    def __init__(self, fileName):
+        self.message = (
+            "Name index {} is not valid for its data file, and must be"
+            " rebuilt.".format(fileName))
+
+
+class InvalidVariantNameIndexException(InvalidNameIndexException):
+    """
+    Exception thrown when a variant name index is corrupt or does not
+    match the VCF file that it indexes.
+    """
+    def __init__(self, fileName):
+        self.message = (
+            "Variant name index {} is not valid for its variant file, and"
+            " must be rebuilt using ga4gh_index_variants.".format(fileName))
+
+
+class InvalidReadNameIndexException(InvalidNameIndexException):
+    """
+    Exception thrown when a read name index is corrupt or does not match
+    the BAM file that it indexes.
+    """
+    def __init__(self, fileName):
+        self.message = (
+            "Read name index {} is not valid for its BAM file, and must be"
+            " rebuilt using ga4gh_index_reads.".format(fileName))
+
+
+class InvalidVariantAlleleIndexException(InvalidNameIndexException):
+    """
+    Exception thrown when a variant allele index is corrupt or does not
+    match the VCF file that it indexes.
+    """
+    def __init__(self, fileName):
+        self.message = (
+            "Variant allele index {} is not valid for its variant file, and"
+            " must be rebuilt using ga4gh_index_alleles.".format(fileName))
+
+
+class InvalidSummaryTilesException(MalformedException):
+    """
+    Exception thrown when a summary tiles file is corrupt or does not
+    match the data file that it summarises.
+    """
+    def __init__(self, fileName):
+        self.message = (
+            "Summary tiles {} are not valid for their data file, and must"
+            " be rebuilt using ga4gh_build_tiles.".format(fileName))
+
+
+class InvalidColumnarVariantStoreException(MalformedException):
+    """
+    Exception thrown when a columnar variant store is corrupt or does not
+    match the variant files that it was ingested from.
+    """
+    def __init__(self, storeDir):
+        self.message = (
+            "Columnar variant store {} is not valid for its variant files,"
+            " and must be rebuilt using ga4gh_ingest_variants.".format(
+                storeDir))
+
+
+class InvalidRepositoryException(MalformedException):
+    """
+    Exception thrown when a repository database is corrupt or does not
+    match the data files that it was built from.
+    """
+    def __init__(self, fileName):
+        self.message = (
+            "Repository {} is not valid for its data files, and must be"
+            " rebuilt using ga4gh_build_repository.".format(fileName))
+
+
+class DuplicateRepositoryIdException(MalformedException):
+    """
+    Exception thrown when two objects in the data directories added to a
+    repository have the same ID.
+    """
+    def __init__(self, objectId):
+        self.message = (
+            "More than one object has the ID {}; the data directories"
+            " added to a repository must not overlap.".format(objectId))
+
+
 ###############################################################
 #
 # Internal errors. These are exceptions that we regard as bugs.
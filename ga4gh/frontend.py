@@ -13,6 +13,7 @@ import datetime
 import flask
 import flask.ext.cors as cors
 import humanize
+import werkzeug.routing
 
 import ga4gh
 import ga4gh.backend as backend
@@ -25,6 +26,19 @@ MIMETYPE = "application/json"
 app = flask.Flask(__name__)
 
 
+class CompoundIdConverter(werkzeug.routing.BaseConverter):
+    """
+    Matches the IDs of objects that are contained in other objects, such
+    as variants and reads. These are formed from the ID of the parent and
+    a local ID separated by a colon, so they cannot be confused with the
+    names of the other routes for a type, such as "search".
+    """
+    regex = r"[^/]*:[^/]*"
+
+
+app.url_map.converters["compoundId"] = CompoundIdConverter
+
+
 class Version(object):
     """
     A major/minor/revision version tag
@@ -180,31 +194,49 @@ def configure(configFile=None, baseConfig="ProductionConfig", extraConfig={}):
             randomSeed, numCalls, variantDensity, numVariantSets)
     elif dataSource == "__EMPTY__":
         theBackend = backend.EmptyBackend()
+    elif os.path.isfile(dataSource):
+        theBackend = backend.SqliteBackend(
+            dataSource, app.config["IN_MEMORY_VARIANT_SET_SIZE"])
     else:
-        theBackend = backend.FileSystemBackend(dataSource)
+        theBackend = backend.FileSystemBackend(
+            dataSource, app.config["IN_MEMORY_VARIANT_SET_SIZE"])
     theBackend.setRequestValidation(app.config["REQUEST_VALIDATION"])
     theBackend.setResponseValidation(app.config["RESPONSE_VALIDATION"])
     theBackend.setDefaultPageSize(app.config["DEFAULT_PAGE_SIZE"])
     theBackend.setMaxResponseLength(app.config["MAX_RESPONSE_LENGTH"])
+    theBackend.setTranscodeSearchResults(
+        app.config["TRANSCODE_SEARCH_RESULTS"])
+    theBackend.setSearchCursors(
+        app.config["SEARCH_CURSORS"], app.config["SEARCH_CURSOR_TABLE_SIZE"],
+        app.config["SEARCH_CURSOR_TIMEOUT"])
+    # The search workers are forked before any other threads are started.
+    theBackend.setPipelinedSearch(
+        app.config["PIPELINED_SEARCH_WORKERS"],
+        app.config["PIPELINED_SEARCH_CHUNK_RECORDS"])
+    theBackend.setPrefetchNextPage(
+        app.config["PREFETCH_NEXT_PAGE"], app.config["PREFETCH_CACHE_SIZE"],
+        app.config["PREFETCH_CACHE_TIMEOUT"])
     app.backend = theBackend
 
 
-def getFlaskResponse(responseString, httpStatus=200):
+def getFlaskResponse(responseString, httpStatus=200, mimetype=MIMETYPE):
     """
     Returns a Flask response object for the specified data and HTTP status.
     """
-    return flask.Response(responseString, status=httpStatus, mimetype=MIMETYPE)
+    return flask.Response(responseString, status=httpStatus, mimetype=mimetype)
 
 
-def handleHttpPost(request, endpoint):
+def handleHttpPost(request, endpoint, mimetype=MIMETYPE):
     """
     Handles the specified HTTP POST request, which maps to the specified
-    protocol handler handpoint and protocol request class.
+    protocol handler handpoint and protocol request class. The query
+    parameters of the request are passed to the endpoint as search
+    options. The response has the specified mimetype.
     """
     if request.mimetype != MIMETYPE:
         raise exceptions.UnsupportedMediaTypeException()
-    responseStr = endpoint(request.get_data())
-    return getFlaskResponse(responseStr)
+    responseStr = endpoint(request.get_data(), request.args)
+    return getFlaskResponse(responseStr, mimetype=mimetype)
 
 
 def handleHttpOptions():
@@ -231,22 +263,45 @@ def handleException(exception):
     return getFlaskResponse(responseStr, serverException.httpStatus)
 
 
-def handleFlaskPostRequest(version, flaskRequest, endpoint):
+def handleFlaskPostRequest(
+        version, flaskRequest, endpoint, mimetype=MIMETYPE):
     """
     Handles the specified flask request for one of the POST URLS
     at at the specified version. Invokes the specified endpoint to
-    generate a response.
+    generate a response of the specified mimetype.
     """
     if not Version.isCurrentVersion(version):
         raise exceptions.VersionNotSupportedException()
     if flaskRequest.method == "POST":
-        return handleHttpPost(flaskRequest, endpoint)
+        return handleHttpPost(flaskRequest, endpoint, mimetype)
     elif flaskRequest.method == "OPTIONS":
         return handleHttpOptions()
     else:
         raise exceptions.MethodNotAllowedException()
 
 
+def handleFlaskGetRequest(version, flaskRequest, endpoint, id_):
+    """
+    Handles the specified flask request for the object with the specified
+    ID at the specified version. Invokes the specified endpoint with the
+    ID and the query parameters of the request to generate a response.
+    """
+    if not Version.isCurrentVersion(version):
+        raise exceptions.VersionNotSupportedException()
+    return getFlaskResponse(endpoint(id_, flaskRequest.args))
+
+
+def handleFlaskQueryRequest(version, flaskRequest, endpoint):
+    """
+    Handles the specified flask request for one of the GET URLS taking
+    query parameters at the specified version. Invokes the specified
+    endpoint with the query parameters to generate a response.
+    """
+    if not Version.isCurrentVersion(version):
+        raise exceptions.VersionNotSupportedException()
+    return getFlaskResponse(endpoint(flaskRequest.args))
+
+
 @app.route('/')
 def index():
     return flask.render_template('index.html', info=app.serverStatus)
@@ -293,6 +348,85 @@ def searchVariants(version):
         version, flask.request, app.backend.searchVariants)
 
 
+@app.route('/<version>/variants/frequencies', methods=['POST', 'OPTIONS'])
+def searchAlleleFrequencies(version):
+    return handleFlaskPostRequest(
+        version, flask.request, app.backend.searchAlleleFrequencies)
+
+
+@app.route('/<version>/variants/genotypes', methods=['POST', 'OPTIONS'])
+def exportGenotypeMatrix(version):
+    return handleFlaskPostRequest(
+        version, flask.request, app.backend.exportGenotypeMatrix,
+        protocol.GenotypeMatrixFormat.mimetype)
+
+
+@app.route('/<version>/reads/search/batch', methods=['POST', 'OPTIONS'])
+def batchSearchReads(version):
+    return handleFlaskPostRequest(
+        version, flask.request, app.backend.batchSearchReads)
+
+
+@app.route('/<version>/variants/search/batch', methods=['POST', 'OPTIONS'])
+def batchSearchVariants(version):
+    return handleFlaskPostRequest(
+        version, flask.request, app.backend.batchSearchVariants)
+
+
+@app.route('/<version>/reads/count', methods=['POST', 'OPTIONS'])
+def countReads(version):
+    return handleFlaskPostRequest(
+        version, flask.request, app.backend.countReads)
+
+
+@app.route('/<version>/variants/count', methods=['POST', 'OPTIONS'])
+def countVariants(version):
+    return handleFlaskPostRequest(
+        version, flask.request, app.backend.countVariants)
+
+
+@app.route('/<version>/reads/summary', methods=['POST', 'OPTIONS'])
+def summarizeReads(version):
+    return handleFlaskPostRequest(
+        version, flask.request, app.backend.summarizeReads)
+
+
+@app.route('/<version>/variants/summary', methods=['POST', 'OPTIONS'])
+def summarizeVariants(version):
+    return handleFlaskPostRequest(
+        version, flask.request, app.backend.summarizeVariants)
+
+
+@app.route('/<version>/beacon/query', methods=['GET'])
+def beaconQuery(version):
+    return handleFlaskQueryRequest(
+        version, flask.request, app.backend.beaconQuery)
+
+
+@app.route('/<version>/variants/<compoundId:id>', methods=['GET'])
+def getVariant(version, id):
+    return handleFlaskGetRequest(
+        version, flask.request, app.backend.getVariant, id)
+
+
+@app.route('/<version>/variants/batch', methods=['POST', 'OPTIONS'])
+def batchGetVariants(version):
+    return handleFlaskPostRequest(
+        version, flask.request, app.backend.batchGetVariants)
+
+
+@app.route('/<version>/reads/<compoundId:id>', methods=['GET'])
+def getReadAlignment(version, id):
+    return handleFlaskGetRequest(
+        version, flask.request, app.backend.getReadAlignment, id)
+
+
+@app.route('/<version>/reads/batch', methods=['POST', 'OPTIONS'])
+def batchGetReadAlignments(version):
+    return handleFlaskPostRequest(
+        version, flask.request, app.backend.batchGetReadAlignments)
+
+
 # The below methods ensure that JSON is returned for various errors
 # instead of the default, html
 @app.errorhandler(404)
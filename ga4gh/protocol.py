@@ -7,6 +7,7 @@ from __future__ import unicode_literals
 
 import sys
 import json
+import struct
 import inspect
 import datetime
 import itertools
@@ -26,6 +27,107 @@ def convertDatetime(t):
     return int(millis)
 
 
+class FieldMask(object):
+    """
+    A selection of the fields of a ProtocolElement, used to return
+    partial responses. Field masks are parsed from strings such as
+    "variants(start,end,calls(genotype))", where the fields selected
+    within an embedded element are given in parentheses. The form
+    "calls/genotype" is equivalent to "calls(genotype)". A field that
+    is selected without parentheses is included with all its subfields.
+    """
+    def __init__(self):
+        self._fields = {}
+
+    @classmethod
+    def parse(cls, fieldsString):
+        """
+        Returns the FieldMask described by the specified string. Raises
+        a ValueError if the string is not a valid field mask.
+        """
+        fieldMask, position = cls._parseFieldList(fieldsString, 0)
+        if position != len(fieldsString):
+            raise ValueError(
+                "Unexpected '{}' in field mask '{}'".format(
+                    fieldsString[position], fieldsString))
+        return fieldMask
+
+    @classmethod
+    def _parseFieldList(cls, fieldsString, position):
+        fieldMask = cls()
+        while True:
+            start = position
+            while (position < len(fieldsString) and
+                    fieldsString[position] not in ",()"):
+                position += 1
+            path = [
+                name.strip() for name in
+                fieldsString[start:position].split("/")]
+            if "" in path:
+                raise ValueError(
+                    "Empty field name in field mask '{}'".format(
+                        fieldsString))
+            subMask = None
+            if position < len(fieldsString) and fieldsString[position] == "(":
+                subMask, position = cls._parseFieldList(
+                    fieldsString, position + 1)
+                if (position == len(fieldsString) or
+                        fieldsString[position] != ")"):
+                    raise ValueError(
+                        "Unbalanced parentheses in field mask '{}'".format(
+                            fieldsString))
+                position += 1
+            for name in reversed(path[1:]):
+                parentMask = cls()
+                parentMask.addField(name, subMask)
+                subMask = parentMask
+            fieldMask.addField(path[0], subMask)
+            if position == len(fieldsString) or fieldsString[position] != ",":
+                return fieldMask, position
+            position += 1
+
+    def addField(self, fieldName, subMask=None):
+        """
+        Selects the specified field. If subMask is None, all subfields
+        of the field are selected; otherwise, only the subfields selected
+        by subMask are.
+        """
+        if fieldName in self._fields:
+            existing = self._fields[fieldName]
+            if existing is None or subMask is None:
+                subMask = None
+            else:
+                for name, fieldSubMask in subMask._fields.items():
+                    existing.addField(name, fieldSubMask)
+                subMask = existing
+        self._fields[fieldName] = subMask
+
+    def includes(self, fieldName):
+        """
+        Returns True if the specified field is selected by this mask.
+        """
+        return fieldName in self._fields
+
+    def getSubMask(self, fieldName):
+        """
+        Returns the FieldMask selecting the subfields of the specified
+        field. This is None if all the subfields are selected, and an
+        empty FieldMask if the field itself is not selected.
+        """
+        if fieldName not in self._fields:
+            return FieldMask()
+        return self._fields[fieldName]
+
+    def __str__(self):
+        fields = []
+        for name, subMask in sorted(self._fields.items()):
+            if subMask is None:
+                fields.append(name)
+            else:
+                fields.append("{}({})".format(name, subMask))
+        return ",".join(fields)
+
+
 class SearchResponseBuilder(object):
     """
     A class to allow sequential building of SearchResponse objects.
@@ -34,18 +136,25 @@ class SearchResponseBuilder(object):
     we are building responses, as we write the JSON representation
     of ProtocolElements directly to a buffer.
     """
-    def __init__(self, responseClass, pageSize, maxResponseLength):
+    def __init__(
+            self, responseClass, pageSize, maxResponseLength, fieldMask=None):
         """
         Allocates a new SearchResponseBuilder for the specified
         subclass of SearchResponse, with the specified
         user-requested pageSize and the system mandated
         maxResponseLength (in bytes). The maxResponseLength is an
         approximate limit on the overall length of the JSON
-        response.
+        response. If a FieldMask is specified, only the selected
+        fields of the values are written; the nextPageToken is
+        always included.
         """
         self._responseClass = responseClass
         self._pageSize = pageSize
         self._maxResponseLength = maxResponseLength
+        self._valueFieldMask = None
+        if fieldMask is not None:
+            self._valueFieldMask = fieldMask.getSubMask(
+                responseClass.getValueListName())
         self._valueListBuffer = StringIO()
         self._numElements = 0
         self._nextPageToken = None
@@ -88,7 +197,8 @@ class SearchResponseBuilder(object):
         if self._numElements > 0:
             self._valueListBuffer.write(", ")
         self._numElements += 1
-        self._valueListBuffer.write(protocolElement.toJsonString())
+        self._valueListBuffer.write(
+            protocolElement.toJsonString(self._valueFieldMask))
 
     def isFull(self):
         """
@@ -114,6 +224,65 @@ class SearchResponseBuilder(object):
             self._responseClass.getValueListName(), pageListString)
 
 
+class GenotypeMatrixFormat(object):
+    """
+    The binary layout used to export the genotypes of the variants in a
+    region as a dense matrix of sites by call sets. The stream starts
+    with a header holding the magic string, the number of call sets and
+    the length of their IDs, which follow separated by newlines. Blocks
+    of sites follow. Each block starts with the number of sites and the
+    length of their alleles, and holds the int64 starts and ends of the
+    sites, their alleles (the reference and alternate bases of a site
+    separated by commas, and the sites separated by newlines) and the
+    int8 genotype codes of the sites in row-major order. A block with
+    no sites ends the stream. All integers are little-endian.
+
+    The genotype code of a call is the number of alternate alleles
+    called, or missingCode if any allele of the genotype is not called.
+    """
+    mimetype = "application/octet-stream"
+    magic = b"GA4GHGTM"
+    missingCode = -1
+    headerStruct = struct.Struct(b"<8sII")
+    blockStruct = struct.Struct(b"<II")
+
+    @classmethod
+    def encodeHeader(cls, callSetIds):
+        """
+        Returns the header of the stream for the specified list of the
+        call set IDs of the columns.
+        """
+        callSetIdsString = "\n".join(callSetIds).encode("utf-8")
+        return cls.headerStruct.pack(
+            cls.magic, len(callSetIds), len(callSetIdsString)) + \
+            callSetIdsString
+
+    @classmethod
+    def encodeBlock(cls, starts, ends, alleles, genotypeCodes):
+        """
+        Returns the block of the stream for the sites with the specified
+        lists of starts, ends and (referenceBases, alternateBases) pairs.
+        The genotypeCodes are the bytes of the int8 genotype codes of the
+        sites in row-major order.
+        """
+        allelesString = "\n".join(
+            ",".join([referenceBases] + list(alternateBases))
+            for referenceBases, alternateBases in alleles).encode("utf-8")
+        coordinatesFormat = "<{}q".format(len(starts)).encode("ascii")
+        return b"".join([
+            cls.blockStruct.pack(len(starts), len(allelesString)),
+            struct.pack(coordinatesFormat, *starts),
+            struct.pack(coordinatesFormat, *ends),
+            allelesString, genotypeCodes])
+
+    @classmethod
+    def encodeEnd(cls):
+        """
+        Returns the empty block that ends the stream.
+        """
+        return cls.blockStruct.pack(0, 0)
+
+
 class ProtocolElementEncoder(json.JSONEncoder):
     """
     Class responsible for encoding ProtocolElements as JSON.
@@ -149,32 +318,66 @@ class ProtocolElement(object):
     def __ne__(self, other):
         return not self == other
 
-    def toJsonString(self):
+    def toJsonString(self, fieldMask=None):
         """
         Returns a JSON encoded string representation of this ProtocolElement.
+        If a FieldMask is specified, only the selected fields are included.
         """
-        return json.dumps(self, cls=ProtocolElementEncoder)
+        if fieldMask is None:
+            return json.dumps(self, cls=ProtocolElementEncoder)
+        return json.dumps(self.toJsonDict(fieldMask))
 
-    def toJsonDict(self):
+    def toJsonDict(self, fieldMask=None):
         """
         Returns a JSON dictionary representation of this ProtocolElement.
+        If a FieldMask is specified, only the selected fields are included.
         """
         out = {}
         for field in self.schema.fields:
+            subMask = None
+            if fieldMask is not None:
+                if not fieldMask.includes(field.name):
+                    continue
+                subMask = fieldMask.getSubMask(field.name)
             val = getattr(self, field.name)
             if self.isEmbeddedType(field.name):
                 if isinstance(val, list):
-                    out[field.name] = list(el.toJsonDict() for el in val)
+                    out[field.name] = list(
+                        el.toJsonDict(subMask) for el in val)
                 elif val is None:
                     out[field.name] = None
                 else:
-                    out[field.name] = val.toJsonDict()
+                    out[field.name] = val.toJsonDict(subMask)
             elif isinstance(val, list):
                 out[field.name] = list(val)
             else:
                 out[field.name] = val
         return out
 
+    @classmethod
+    def maskJsonDict(cls, jsonDict, fieldMask):
+        """
+        Returns a copy of the specified JSON dictionary representation of
+        an instance of this class that includes only the fields selected
+        by the specified FieldMask.
+        """
+        out = {}
+        for field in cls.schema.fields:
+            if not fieldMask.includes(field.name):
+                continue
+            val = jsonDict[field.name]
+            subMask = fieldMask.getSubMask(field.name)
+            if (subMask is not None and val is not None and
+                    cls.isEmbeddedType(field.name)):
+                embeddedType = cls.getEmbeddedType(field.name)
+                if isinstance(val, list):
+                    val = [embeddedType.maskJsonDict(el, subMask)
+                           for el in val]
+                else:
+                    val = embeddedType.maskJsonDict(val, subMask)
+            out[field.name] = val
+        return out
+
     @classmethod
     def validate(cls, jsonDict):
         """
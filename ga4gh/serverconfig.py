@@ -19,6 +19,29 @@ class BaseConfig(object):
     RESPONSE_VALIDATION = False
     DEFAULT_PAGE_SIZE = 100
     DATA_SOURCE = "__EMPTY__"
+    TRANSCODE_SEARCH_RESULTS = True
+    # VariantSets whose variant files take at most this many bytes are
+    # read into memory when they are opened; 0 disables this.
+    IN_MEMORY_VARIANT_SET_SIZE = 0
+
+    # Options for server-side cursors over variant and read searches.
+    SEARCH_CURSORS = False
+    SEARCH_CURSOR_TABLE_SIZE = 256
+    SEARCH_CURSOR_TIMEOUT = 60
+
+    # Options for speculatively computing the next page of search results.
+    PREFETCH_NEXT_PAGE = False
+    PREFETCH_CACHE_SIZE = 128
+    PREFETCH_CACHE_TIMEOUT = 30
+
+    # Options for reading variant and read searches in worker processes.
+    PIPELINED_SEARCH_WORKERS = 0
+    PIPELINED_SEARCH_CHUNK_RECORDS = 256
+
+    # Options for the Twisted frontend, used with --frontend twisted.
+    TWISTED_FRONTEND_THREADS = 10
+    TWISTED_FRONTEND_IDLE_TIMEOUT = 60
+    TWISTED_FRONTEND_LISTEN_BACKLOG = 1024
 
     # Options for the simulated backend.
     SIMULATED_BACKEND_RANDOM_SEED = 0
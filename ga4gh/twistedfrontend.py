@@ -0,0 +1,59 @@
+"""
+Serves the Flask frontend from a Twisted event loop.
+
+The reactor accepts connections, reads requests and writes responses,
+so idle keep-alive connections and clients that read responses slowly
+do not hold a thread. Only the handling of each request, which runs the
+backend search, is done on a bounded pool of threads.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+
+import twisted.python.log as log
+import twisted.python.threadpool as threadpool
+import twisted.web.server as server
+import twisted.web.wsgi as wsgi
+
+
+def createSite(reactor, threadPool, app, idleTimeout):
+    """
+    Returns a twisted Site that serves the specified WSGI application on
+    the specified thread pool, closing connections that have been idle
+    for idleTimeout seconds.
+    """
+    resource = wsgi.WSGIResource(reactor, threadPool, app)
+    return server.Site(resource, timeout=idleTimeout)
+
+
+def createThreadPool(reactor, numThreads):
+    """
+    Returns a thread pool of at most numThreads threads that is started
+    and stopped with the specified reactor.
+    """
+    threadPool = threadpool.ThreadPool(
+        minthreads=1, maxthreads=numThreads, name="ga4gh")
+    reactor.callWhenRunning(threadPool.start)
+    reactor.addSystemEventTrigger("during", "shutdown", threadPool.stop)
+    return threadPool
+
+
+def run(app, host, port):
+    """
+    Serves the specified configured Flask application on the specified
+    host and port until the reactor is stopped.
+    """
+    # Importing the reactor installs the best one for the platform, such
+    # as epoll on Linux, which is not limited in its number of connections.
+    import twisted.internet.reactor as reactor
+    log.startLogging(sys.stderr)
+    threadPool = createThreadPool(
+        reactor, app.config["TWISTED_FRONTEND_THREADS"])
+    site = createSite(
+        reactor, threadPool, app, app.config["TWISTED_FRONTEND_IDLE_TIMEOUT"])
+    reactor.listenTCP(
+        port, site, backlog=app.config["TWISTED_FRONTEND_LISTEN_BACKLOG"],
+        interface=host)
+    reactor.run()
@@ -0,0 +1,130 @@
+"""
+Benchmark for paging through variant searches over regions dense in
+structural variants. Every variant in the generated data is a long
+deletion, so each page boundary is overlapped by all the variants
+returned on earlier pages. The time taken to read each page should not
+grow with the number of the page.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import pysam
+
+import ga4gh.backend as backend
+import ga4gh.protocol as protocol
+
+
+def writeVariantSet(
+        variantSetDir, numVariants, numSamples, spacing, svLength):
+    """
+    Writes a tabix indexed VCF file in the specified directory, holding
+    numVariants deletions of svLength bases starting every spacing bases,
+    with random genotypes for numSamples samples.
+    """
+    os.makedirs(variantSetDir)
+    randomNumberGenerator = random.Random(0)
+    sampleNames = ["sample{}".format(j) for j in range(numSamples)]
+    length = numVariants * spacing + svLength + 1
+    lines = [
+        "##fileformat=VCFv4.1",
+        "##contig=<ID=1,length={}>".format(length),
+        '##INFO=<ID=END,Number=1,Type=Integer,Description="End">',
+        '##INFO=<ID=SVTYPE,Number=1,Type=String,Description="SV type">',
+        '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+        "\t".join(
+            ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO",
+             "FORMAT"] + sampleNames)]
+    for i in range(numVariants):
+        position = 1 + i * spacing
+        genotypes = [
+            randomNumberGenerator.choice(["0/0", "0/1", "1/1"])
+            for _ in sampleNames]
+        lines.append("\t".join([
+            "1", str(position), "del{}".format(i), "N", "<DEL>", "50",
+            "PASS", "SVTYPE=DEL;END={}".format(position + svLength), "GT"] +
+            genotypes))
+    vcfFileName = os.path.join(variantSetDir, "deletions.vcf")
+    with open(vcfFileName, "w") as vcfFile:
+        vcfFile.write("\n".join(lines) + "\n")
+    pysam.tabix_index(vcfFileName, preset="vcf")
+
+
+def timePages(theBackend, variantSetId, pageSize, end):
+    """
+    Returns the list of the (numVariants, seconds) pairs for the pages of
+    a search for all the variants in the variant set.
+    """
+    request = protocol.SearchVariantsRequest()
+    request.variantSetIds = [variantSetId]
+    request.referenceName = "1"
+    request.start = 0
+    request.end = end
+    request.pageSize = pageSize
+    pageTimes = []
+    while True:
+        startTime = time.time()
+        responseString = theBackend.searchVariants(request.toJsonString())
+        elapsedTime = time.time() - startTime
+        response = json.loads(responseString)
+        pageTimes.append((len(response["variants"]), elapsedTime))
+        if response["nextPageToken"] is None:
+            return pageTimes
+        request.pageToken = response["nextPageToken"]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="GA4GH variant pagination benchmark")
+    parser.add_argument(
+        "--numVariants", type=int, default=5000,
+        help="the number of deletions (default: %(default)s)")
+    parser.add_argument(
+        "--numSamples", type=int, default=100,
+        help="the number of samples (default: %(default)s)")
+    parser.add_argument(
+        "--spacing", type=int, default=10,
+        help="the distance between deletions (default: %(default)s)")
+    parser.add_argument(
+        "--svLength", type=int, default=10**6,
+        help="the length of the deletions (default: %(default)s)")
+    parser.add_argument(
+        "--pageSize", type=int, default=500,
+        help="the number of variants in a page (default: %(default)s)")
+    parser.add_argument(
+        "--convertOverlapping", action="store_true",
+        help="convert the variants overlapping each page boundary before "
+             "skipping them, as was done before they were skipped by "
+             "the variant set")
+    args = parser.parse_args()
+    if args.convertOverlapping:
+        backend.IntervalIterator._getMinStart = lambda self: None
+    dataDir = tempfile.mkdtemp()
+    try:
+        for name in ["references", "reads"]:
+            os.makedirs(os.path.join(dataDir, name))
+        writeVariantSet(
+            os.path.join(dataDir, "variants", "deletions"),
+            args.numVariants, args.numSamples, args.spacing, args.svLength)
+        theBackend = backend.FileSystemBackend(dataDir)
+        theBackend.setMaxResponseLength(2**30)
+        pageTimes = timePages(
+            theBackend, "deletions", args.pageSize,
+            args.numVariants * args.spacing + args.svLength)
+        for page, (numVariants, elapsedTime) in enumerate(pageTimes):
+            print("page {:4d}: {:6d} variants in {:.3f}s".format(
+                page, numVariants, elapsedTime))
+        firstTime = pageTimes[0][1]
+        lastTime = pageTimes[-1][1]
+        print("last page / first page time: {:.2f}".format(
+            lastTime / firstTime))
+    finally:
+        shutil.rmtree(dataDir)
@@ -48,6 +48,12 @@ setup(
             'ga4gh_server=ga4gh.cli:server_main',
             'ga2vcf=ga4gh.cli:ga2vcf_main',
             'ga2sam=ga4gh.cli:ga2sam_main',
+            'ga4gh_index_variants=ga4gh.cli:index_variants_main',
+            'ga4gh_index_reads=ga4gh.cli:index_reads_main',
+            'ga4gh_index_alleles=ga4gh.cli:index_alleles_main',
+            'ga4gh_build_tiles=ga4gh.cli:build_tiles_main',
+            'ga4gh_ingest_variants=ga4gh.cli:ingest_variants_main',
+            'ga4gh_build_repository=ga4gh.cli:build_repository_main',
         ]
     },
     classifiers=[
@@ -7,8 +7,12 @@ from __future__ import unicode_literals
 
 import collections
 import glob
+import json
 import os
+import shutil
+import tempfile
 
+import ga4gh.exceptions as exceptions
 import ga4gh.protocol as protocol
 import ga4gh.datamodel.reads as reads
 import tests.datadriven as datadriven
@@ -82,6 +86,250 @@ class ReadGroupSetTest(datadriven.DataDrivenTest):
                     protocol.ReadAlignment,
                     gaAlignment.toJsonDict())
 
+    def testFieldMask(self):
+        fieldMask = protocol.FieldMask.parse("id,alignment(position)")
+        readGroupSet = self._gaObject
+        for readGroup in readGroupSet.getReadGroups():
+            gaAlignments = list(readGroup.getReadAlignments())
+            maskedGaAlignments = list(readGroup.getReadAlignments(
+                fieldMask=fieldMask))
+            self.assertEqual(
+                [alignment.toJsonDict(fieldMask)
+                 for alignment in gaAlignments],
+                [alignment.toJsonDict(fieldMask)
+                 for alignment in maskedGaAlignments])
+            for alignment in maskedGaAlignments:
+                self.assertEqual(alignment.alignment.cigar, [])
+
+    def testTranscodedReadAlignments(self):
+        fieldMasks = [None, protocol.FieldMask.parse("id,alignment(cigar)")]
+        readGroupSet = self._gaObject
+        for fieldMask in fieldMasks:
+            for readGroup in readGroupSet.getReadGroups():
+                gaAlignments = list(readGroup.getReadAlignments())
+                records = list(readGroup.getTranscodedReadAlignments(
+                    fieldMask=fieldMask))
+                self.assertEqual(len(gaAlignments), len(records))
+                for gaAlignment, record in zip(gaAlignments, records):
+                    self.assertEqual(
+                        gaAlignment.alignment.position.position,
+                        record.start)
+                    self.assertEqual(
+                        gaAlignment.toJsonDict(fieldMask),
+                        json.loads(record.toJsonString()))
+
+    def testGetReadAlignment(self):
+        readGroupSet = self._gaObject
+        for readGroup in readGroupSet.getReadGroups():
+            readId = "{}:{}".format(
+                readGroup.getId(), self._readGroupInfos[
+                    readGroup.getSamFilePath()].reads[0].query_name)
+            with self.assertRaises(exceptions.NotImplementedException):
+                readGroup.getReadAlignment(readId)
+        tempDir = tempfile.mkdtemp()
+        try:
+            dataDir = os.path.join(tempDir, self._setId)
+            shutil.copytree(self._dataDir, dataDir)
+            for samFileName in glob.glob(os.path.join(dataDir, "*.bam")):
+                reads.ReadNameIndex.build(samFileName)
+            readGroupSet = reads.HtslibReadGroupSet(self._setId, dataDir)
+            for readGroup in readGroupSet.getReadGroups():
+                readGroupInfo = self._readGroupInfos[os.path.join(
+                    self._dataDir,
+                    os.path.basename(readGroup.getSamFilePath()))]
+                for read in readGroupInfo.reads[:20]:
+                    readId = "{}:{}".format(
+                        readGroup.getId(), read.query_name)
+                    firstRead = [
+                        other for other in readGroupInfo.reads
+                        if other.query_name == read.query_name][0]
+                    gaAlignment = readGroup.getReadAlignment(readId)
+                    self.assertEqual(gaAlignment.id, readId)
+                    self.assertAlignmentsEqual(
+                        gaAlignment, firstRead, readGroupInfo)
+                    transcodedRecord = readGroup.getTranscodedReadAlignment(
+                        readId)
+                    self.assertEqual(
+                        gaAlignment.toJsonDict(),
+                        json.loads(transcodedRecord.toJsonString()))
+                for readId in [
+                        "{}:nonexistentRead".format(readGroup.getId()),
+                        "{}x:{}".format(readGroup.getId(), read.query_name)]:
+                    with self.assertRaises(
+                            exceptions.ReadAlignmentNotFoundException):
+                        readGroup.getReadAlignment(readId)
+            indexFile = reads.ReadNameIndex.getIndexFileName(samFileName)
+            with open(indexFile, "ab") as indexFileHandle:
+                indexFileHandle.write(b"\0")
+            with self.assertRaises(exceptions.InvalidReadNameIndexException):
+                reads.HtslibReadGroupSet(self._setId, dataDir)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testCoverageSummary(self):
+        binSizes = [100, 1000, 10000]
+        for readGroup in self._gaObject.getReadGroups():
+            with self.assertRaises(
+                    exceptions.SummaryTilesNotFoundException):
+                readGroup.getCoverageSummary(0)
+        tempDir = tempfile.mkdtemp()
+        try:
+            dataDir = os.path.join(tempDir, self._setId)
+            shutil.copytree(self._dataDir, dataDir)
+            for samFileName in glob.glob(os.path.join(dataDir, "*.bam")):
+                reads.ReadCoverageTiles.build(samFileName, binSizes=binSizes)
+            readGroupSet = reads.HtslibReadGroupSet(self._setId, dataDir)
+            for readGroup in readGroupSet.getReadGroups():
+                readGroupInfo = self._readGroupInfos[os.path.join(
+                    self._dataDir,
+                    os.path.basename(readGroup.getSamFilePath()))]
+                for refId, refIdReads in readGroupInfo.refIds.items():
+                    if refId < 0:
+                        continue
+                    for binSize in binSizes:
+                        numBases = collections.Counter()
+                        for read in refIdReads:
+                            if read.flag & (
+                                    reads.SamFlags.UNMAPPED |
+                                    reads.SamFlags.SECONDARY_ALIGNMENT |
+                                    reads.SamFlags.DUPLICATE_FRAGMENT |
+                                    reads.SamFlags.
+                                    FAILED_VENDOR_QUALITY_CHECKS):
+                                continue
+                            for blockStart, blockEnd in read.get_blocks():
+                                for position in range(blockStart, blockEnd):
+                                    numBases[position // binSize] += 1
+                        expectedBins = [
+                            (binIndex * binSize, count / binSize)
+                            for binIndex, count in sorted(numBases.items())]
+                        self.assertEqual(
+                            readGroup.getCoverageSummary(
+                                refId, binSize=binSize),
+                            (binSize, expectedBins))
+                        start = expectedBins[-1][0]
+                        self.assertEqual(
+                            readGroup.getCoverageSummary(
+                                refId, start, start + 1, binSize + 1),
+                            (binSize, expectedBins[-1:]))
+            tilesFile = reads.ReadCoverageTiles.getTilesFileName(samFileName)
+            with open(tilesFile, "ab") as tilesFileHandle:
+                tilesFileHandle.write(b"\0")
+            with self.assertRaises(exceptions.InvalidSummaryTilesException):
+                reads.HtslibReadGroupSet(self._setId, dataDir)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testReadFilter(self):
+        readFilter = reads.ReadFilter(
+            excludeDuplicates=True, excludeSecondary=True,
+            excludeFailedQualityChecks=True, minMappingQuality=30,
+            mappedOnly=True)
+        excludedFlags = (
+            reads.SamFlags.DUPLICATE_FRAGMENT |
+            reads.SamFlags.SECONDARY_ALIGNMENT |
+            reads.SamFlags.FAILED_VENDOR_QUALITY_CHECKS |
+            reads.SamFlags.UNMAPPED)
+        readGroupSet = self._gaObject
+        for readGroup in readGroupSet.getReadGroups():
+            readGroupInfo = self._readGroupInfos[readGroup.getSamFilePath()]
+            alignments = list(readGroup.getReadAlignments(
+                readFilter=readFilter))
+            pysamAlignments = [
+                read for read in readGroupInfo.reads
+                if read.flag & excludedFlags == 0 and
+                read.mapping_quality >= 30]
+            self.assertEqual(len(alignments), len(pysamAlignments))
+            for gaAlignment, pysamAlignment in zip(
+                    alignments, pysamAlignments):
+                self.assertAlignmentsEqual(
+                    gaAlignment, pysamAlignment, readGroupInfo)
+
+    def testReadAlignmentCounts(self):
+        readFilter = reads.ReadFilter(mappedOnly=True)
+        readGroupSet = self._gaObject
+        for readGroup in readGroupSet.getReadGroups():
+            count, binCounts = readGroup.getReadAlignmentCounts()
+            self.assertEqual(count, len(list(readGroup.getReadAlignments())))
+            self.assertIsNone(binCounts)
+            readGroupInfo = self._readGroupInfos[readGroup.getSamFilePath()]
+            for refId in readGroupInfo.refIds:
+                if refId < 0:
+                    continue
+                for start, binSize in [(0, None), (0, 1000), (100, 10)]:
+                    alignments = list(readGroup.getReadAlignments(
+                        refId, start, readFilter=readFilter))
+                    count, binCounts = readGroup.getReadAlignmentCounts(
+                        refId, start, readFilter=readFilter,
+                        binSize=binSize)
+                    self.assertEqual(count, len(alignments))
+                    if binSize is None:
+                        continue
+                    expectedBinCounts = collections.Counter(
+                        start + (max(position, start) - start) //
+                        binSize * binSize
+                        for position in (
+                            alignment.alignment.position.position
+                            for alignment in alignments))
+                    self.assertEqual(
+                        binCounts, sorted(expectedBinCounts.items()))
+
+    def testDownsampling(self):
+        # The reads are longer than the smaller windows, so the reads
+        # overlapping a start position start in several windows.
+        for windowSize in [1000, 10]:
+            self._testDownsampling(2, windowSize)
+
+    def _testDownsampling(self, maxDepth, windowSize):
+        readFilter = reads.ReadFilter(
+            mappedOnly=True, maxDepth=maxDepth, windowSize=windowSize)
+        readGroupSet = self._gaObject
+        for readGroup in readGroupSet.getReadGroups():
+            readGroupInfo = self._readGroupInfos[readGroup.getSamFilePath()]
+            for refId, refIdReads in readGroupInfo.refIds.items():
+                alignments = list(readGroup.getReadAlignments(
+                    refId, readFilter=readFilter))
+                windowDepths = collections.Counter(
+                    alignment.alignment.position.position // windowSize
+                    for alignment in alignments)
+                expectedDepths = collections.Counter(
+                    read.reference_start // windowSize for read in refIdReads
+                    if not read.is_unmapped)
+                for window, depth in expectedDepths.items():
+                    self.assertEqual(
+                        windowDepths[window], min(depth, maxDepth))
+                # Starting part of the way through a window must not
+                # change the reads that are kept.
+                starts = sorted(set(
+                    read.reference_start + offset for read in refIdReads
+                    for offset in [1, windowSize + 3]))
+                for start in starts:
+                    startAlignments = list(readGroup.getReadAlignments(
+                        refId, start, readFilter=readFilter))
+                    self.assertEqual(
+                        [alignment.id for alignment in startAlignments],
+                        [alignment.id for alignment in alignments
+                         if self.getAlignmentEnd(alignment) > start])
+                # Neither must ending part of the way through a window.
+                end = starts[len(starts) // 2] + windowSize // 2
+                endAlignments = list(readGroup.getReadAlignments(
+                    refId, 0, end, readFilter=readFilter))
+                self.assertEqual(
+                    [alignment.id for alignment in endAlignments],
+                    [alignment.id for alignment in alignments
+                     if alignment.alignment.position.position < end])
+
+    def getAlignmentEnd(self, gaAlignment):
+        referenceOperations = [
+            protocol.CigarOperation.ALIGNMENT_MATCH,
+            protocol.CigarOperation.DELETE,
+            protocol.CigarOperation.SKIP,
+            protocol.CigarOperation.SEQUENCE_MATCH,
+            protocol.CigarOperation.SEQUENCE_MISMATCH]
+        return gaAlignment.alignment.position.position + sum(
+            cigarUnit.operationLength
+            for cigarUnit in gaAlignment.alignment.cigar
+            if cigarUnit.operation in referenceOperations)
+
     def testGetReadAlignmentsRefId(self):
         # test that searching with a reference id succeeds
         readGroupSet = self._gaObject
@@ -5,11 +5,16 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import collections
 import os
 import glob
+import json
+import shutil
+import tempfile
 
 import vcf
 
+import ga4gh.exceptions as exceptions
 import ga4gh.protocol as protocol
 import ga4gh.datamodel.variants as variants
 import tests.datadriven as datadriven
@@ -22,6 +27,14 @@ def testVariantSets():
         yield test
 
 
+class SmallIntervalColumnarVariantSet(variants.ColumnarVariantSet):
+    """
+    A columnar variant set whose position index has a small interval, so
+    that the index is used on the test data.
+    """
+    positionIndexInterval = 3
+
+
 class VariantSetTest(datadriven.DataDrivenTest):
     """
     Data driven test class for variant sets. Builds an alternative model of
@@ -188,6 +201,546 @@ class VariantSetTest(datadriven.DataDrivenTest):
                 sampleIds = self.vcfSamples
             self._verifyVariantsCallSetIds(None, list(sampleIds))
 
+    def testSampleSubsetFilesReused(self):
+        gaVariantSet = self._gaObject
+        for referenceName in self._referenceNames:
+            callSetIds = [gaVariantSet.getCallSetId(self.vcfSamples[0])]
+            for _ in range(2):
+                gaVariants = list(gaVariantSet.getVariants(
+                    referenceName, 0, 2**30, None, callSetIds))
+                self._verifyGaVariantsSample(
+                    gaVariants, self.vcfSamples[:1])
+            self.assertLessEqual(
+                len(gaVariantSet._sampleSubsetFiles),
+                gaVariantSet.sampleSubsetPoolSize)
+            sampleSubsetFile = gaVariantSet._getSampleSubsetFile(
+                gaVariantSet._chromFileMap[referenceName], set(callSetIds))
+            self.assertIs(
+                sampleSubsetFile, gaVariantSet._getSampleSubsetFile(
+                    gaVariantSet._chromFileMap[referenceName],
+                    set(callSetIds)))
+            if len(self.vcfSamples) > 1:
+                self.assertEqual(
+                    list(sampleSubsetFile.header.samples),
+                    self.vcfSamples[:1])
+
+    def testFieldMask(self):
+        end = 2**30  # TODO This is arbitrary, and pysam can choke. FIX!
+        for fieldsString in ["id,start,calls(callSetId,genotype)", "end"]:
+            fieldMask = protocol.FieldMask.parse(fieldsString)
+            for referenceName in self._referenceNames:
+                gaVariants = list(self._gaObject.getVariants(
+                    referenceName, 0, end))
+                maskedGaVariants = list(self._gaObject.getVariants(
+                    referenceName, 0, end, fieldMask=fieldMask))
+                self.assertEqual(
+                    [variant.toJsonDict(fieldMask) for variant in gaVariants],
+                    [variant.toJsonDict(fieldMask)
+                     for variant in maskedGaVariants])
+                for variant in maskedGaVariants:
+                    self.assertEqual(variant.info, {})
+
+    def testTranscodedVariants(self):
+        end = 2**30  # TODO This is arbitrary, and pysam can choke. FIX!
+        callSetIds = self._gaObject.getCallSetIds()[:2]
+        fieldMasks = [
+            None, protocol.FieldMask.parse("id,start,calls(genotype,info)")]
+        for fieldMask in fieldMasks:
+            for referenceName in self._referenceNames:
+                gaVariants = list(self._gaObject.getVariants(
+                    referenceName, 0, end, None, callSetIds))
+                records = list(self._gaObject.getTranscodedVariants(
+                    referenceName, 0, end, None, callSetIds, fieldMask))
+                self.assertEqual(len(gaVariants), len(records))
+                for gaVariant, record in zip(gaVariants, records):
+                    self.assertEqual(gaVariant.start, record.start)
+                    self.assertEqual(gaVariant.end, record.end)
+                    self.assertEqual(
+                        gaVariant.toJsonDict(fieldMask),
+                        json.loads(record.toJsonString()))
+
+    def testVariantNameSearch(self):
+        end = 2**30  # TODO This is arbitrary, and pysam can choke. FIX!
+        namedRecords = [
+            record for record in self._variantRecords
+            if record.ID is not None][:20]
+        if len(namedRecords) > 0:
+            with self.assertRaises(exceptions.NotImplementedException):
+                record = namedRecords[0]
+                list(self._gaObject.getVariants(
+                    record.CHROM, 0, end, record.ID.split(";")[0]))
+        tempDir = tempfile.mkdtemp()
+        try:
+            dataDir = os.path.join(tempDir, self._setId)
+            shutil.copytree(self._dataDir, dataDir)
+            for vcfFile in glob.glob(os.path.join(dataDir, "*.vcf.gz")):
+                variants.VariantNameIndex.build(vcfFile)
+            variantSet = variants.HtslibVariantSet(self._setId, dataDir)
+            for record in namedRecords:
+                for name in record.ID.split(";"):
+                    gaVariants = list(variantSet.getVariants(
+                        record.CHROM, 0, end, name))
+                    expectedStarts = [
+                        other.start for other in self._variantRecords
+                        if other.CHROM == record.CHROM and
+                        other.ID is not None and
+                        name in other.ID.split(";")]
+                    self.assertEqual(
+                        [variant.start for variant in gaVariants],
+                        expectedStarts)
+                    for variant in gaVariants:
+                        self.assertIn(name, variant.names)
+                    self.assertEqual(list(variantSet.getVariants(
+                        record.CHROM, record.end, end, name)), [])
+            for referenceName in self._referenceNames:
+                self.assertEqual(list(variantSet.getVariants(
+                    referenceName, 0, end, "nonexistentName")), [])
+            indexFile = variants.VariantNameIndex.getIndexFileName(vcfFile)
+            with open(indexFile, "ab") as indexFileHandle:
+                indexFileHandle.write(b"\0")
+            with self.assertRaises(
+                    exceptions.InvalidVariantNameIndexException):
+                variants.HtslibVariantSet(self._setId, dataDir)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testGetVariant(self):
+        for record in self._variantRecords[:20]:
+            variantId = "{}:{}:{}".format(
+                self._setId, record.CHROM, record.POS)
+            firstRecord = [
+                other for other in self._variantRecords
+                if other.CHROM == record.CHROM and
+                other.POS == record.POS][0]
+            gaVariant = self._gaObject.getVariant(variantId)
+            self.assertEqual(gaVariant.id, variantId)
+            self.assertEqual(gaVariant.start, firstRecord.start)
+            self.assertEqual(gaVariant.referenceBases, firstRecord.REF)
+            transcodedRecord = self._gaObject.getTranscodedVariant(
+                variantId)
+            self.assertEqual(transcodedRecord.start, gaVariant.start)
+            self.assertEqual(
+                gaVariant.toJsonDict(),
+                json.loads(transcodedRecord.toJsonString()))
+        positions = set(
+            (record.CHROM, record.POS) for record in self._variantRecords)
+        for referenceName in self._referenceNames:
+            position = 1
+            while (referenceName, position) in positions:
+                position += 1
+            for variantId in [
+                    "{}:{}:{}".format(self._setId, referenceName, position),
+                    "{}:{}:x".format(self._setId, referenceName),
+                    "{}x:{}:1".format(self._setId, referenceName),
+                    "{}:nonexistentReference:1".format(self._setId)]:
+                with self.assertRaises(exceptions.VariantNotFoundException):
+                    self._gaObject.getVariant(variantId)
+                with self.assertRaises(exceptions.VariantNotFoundException):
+                    self._gaObject.getTranscodedVariant(variantId)
+
+    def testVariantFilters(self):
+        def alleleCount(pyvcfVariant, samples):
+            return sum(
+                allele not in (None, ".", "0")
+                for call in pyvcfVariant.samples if call.sample in samples
+                for allele in (call.gt_alleles or []))
+
+        end = 2**30  # TODO This is arbitrary, and pysam can choke. FIX!
+        samples = self.vcfSamples[:2]
+        callSetIds = [
+            self._gaObject.getCallSetId(sample) for sample in samples]
+        filterPredicates = [
+            (variants.VariantFilter(minQuality=50),
+             lambda v: v.QUAL is not None and v.QUAL >= 50),
+            (variants.VariantFilter(passOnly=True),
+             lambda v: v.FILTER == []),
+            (variants.VariantFilter(nonReference=True),
+             lambda v: alleleCount(v, samples) > 0),
+            (variants.VariantFilter(minAlleleCount=2, maxAlleleCount=3),
+             lambda v: 2 <= alleleCount(v, samples) <= 3),
+        ]
+        for variantFilter, predicate in filterPredicates:
+            for referenceName in self._referenceNames:
+                gaVariants = list(self._gaObject.getVariants(
+                    referenceName, 0, end, None, callSetIds,
+                    variantFilter=variantFilter))
+                pyvcfVariants = [
+                    variant for variant in self._variantRecords
+                    if variant.CHROM == referenceName and predicate(variant)]
+                self.assertEqual(
+                    [variant.start for variant in gaVariants],
+                    [variant.POS - 1 for variant in pyvcfVariants])
+
+    def testVariantCounts(self):
+        end = 2**30  # TODO This is arbitrary, and pysam can choke. FIX!
+        self.assertEqual(
+            self._gaObject.getNumVariants(), len(self._variantRecords))
+        callSetIds = self._gaObject.getCallSetIds()[:1]
+        variantFilter = variants.VariantFilter(nonReference=True)
+        for referenceName in self._referenceNames:
+            for start, binSize in [(0, None), (0, 1000), (10000, 7)]:
+                gaVariants = list(self._gaObject.getVariants(
+                    referenceName, start, end, None, callSetIds,
+                    variantFilter=variantFilter))
+                count, binCounts = self._gaObject.getVariantCounts(
+                    referenceName, start, end, None, callSetIds,
+                    variantFilter=variantFilter, binSize=binSize)
+                self.assertEqual(count, len(gaVariants))
+                if binSize is None:
+                    self.assertIsNone(binCounts)
+                    continue
+                expectedBinCounts = collections.Counter(
+                    start + (max(variant.start, start) - start) //
+                    binSize * binSize for variant in gaVariants)
+                self.assertEqual(
+                    binCounts, sorted(expectedBinCounts.items()))
+
+    def testVariantDensitySummary(self):
+        binSizes = [100, 1000, 10000]
+        with self.assertRaises(exceptions.SummaryTilesNotFoundException):
+            self._gaObject.getVariantDensitySummary(
+                sorted(self._referenceNames)[0])
+        tempDir = tempfile.mkdtemp()
+        try:
+            dataDir = os.path.join(tempDir, self._setId)
+            shutil.copytree(self._dataDir, dataDir)
+            for variantFileName in glob.glob(
+                    os.path.join(dataDir, "*.vcf.gz")):
+                variants.VariantDensityTiles.build(
+                    variantFileName, binSizes=binSizes)
+            variantSet = variants.HtslibVariantSet(self._setId, dataDir)
+            for referenceName in self._referenceNames:
+                for binSize in binSizes:
+                    counts = collections.Counter(
+                        (variant.POS - 1) // binSize
+                        for variant in self._variantRecords
+                        if variant.CHROM == referenceName)
+                    expectedBins = [
+                        (binIndex * binSize, count)
+                        for binIndex, count in sorted(counts.items())]
+                    self.assertEqual(
+                        variantSet.getVariantDensitySummary(
+                            referenceName, binSize=binSize),
+                        (binSize, expectedBins))
+                    start = expectedBins[0][0]
+                    self.assertEqual(
+                        variantSet.getVariantDensitySummary(
+                            referenceName, start, start + binSize,
+                            binSize),
+                        (binSize, expectedBins[:1]))
+            self.assertEqual(
+                variantSet.getVariantDensitySummary("nonexistentReference"),
+                (binSizes[-1], []))
+            tilesFile = variants.VariantDensityTiles.getTilesFileName(
+                variantFileName)
+            with open(tilesFile, "ab") as tilesFileHandle:
+                tilesFileHandle.write(b"\0")
+            with self.assertRaises(exceptions.InvalidSummaryTilesException):
+                variants.HtslibVariantSet(self._setId, dataDir)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testAlleleCounts(self):
+        records = [
+            record for record in self._variantRecords
+            if None not in record.ALT][:50]
+        queries = []
+        for record in records:
+            for alt in record.ALT:
+                queries.append((record.CHROM, record.POS - 1, str(alt)))
+            queries.append((record.CHROM, record.POS - 1, "ACGTACGTACGT"))
+            queries.append((record.CHROM, record.POS, str(record.ALT[0])))
+        queries.append(("nonexistentReference", 0, "A"))
+        expected = [
+            self._gaObject.getAlleleCounts(*query) for query in queries]
+        self.assertIsNone(expected[-1])
+        record = records[0] if len(records) > 0 else None
+        if record is not None:
+            self.assertIsNotNone(expected[0])
+        if (record is not None and "AC" in record.INFO and
+                "AN" in record.INFO):
+            alleleCount = record.INFO["AC"]
+            if isinstance(alleleCount, list):
+                alleleCount = alleleCount[0]
+            self.assertEqual(expected[0], (alleleCount, record.INFO["AN"]))
+        tempDir = tempfile.mkdtemp()
+        try:
+            dataDir = os.path.join(tempDir, self._setId)
+            shutil.copytree(self._dataDir, dataDir)
+            for bloomFilterBits in [0, 10]:
+                for variantFileName in glob.glob(
+                        os.path.join(dataDir, "*.vcf.gz")):
+                    variants.VariantAlleleIndex.build(
+                        variantFileName, bloomFilterBits=bloomFilterBits)
+                variantSet = variants.HtslibVariantSet(self._setId, dataDir)
+                self.assertEqual(
+                    [variantSet.getAlleleCounts(*query) for query in queries],
+                    expected)
+            indexFile = variants.VariantAlleleIndex.getIndexFileName(
+                variantFileName)
+            with open(indexFile, "ab") as indexFileHandle:
+                indexFileHandle.write(b"\0")
+            with self.assertRaises(
+                    exceptions.InvalidVariantAlleleIndexException):
+                variants.HtslibVariantSet(self._setId, dataDir)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testAlleleFrequencies(self):
+        end = 2**30
+        allCallSetIds = self._gaObject.getCallSetIds()
+        for callSetIds in [None, allCallSetIds[:1], allCallSetIds[1:3]]:
+            for referenceName in self._referenceNames:
+                expected = [
+                    json.loads(record.toJsonString()) for record in
+                    variants.AbstractVariantSet.getAlleleFrequencies(
+                        self._gaObject, referenceName, 0, end, callSetIds)]
+                for blockSize in [1, 7, 256]:
+                    self._gaObject.genotypeBlockSize = blockSize
+                    records = list(self._gaObject.getAlleleFrequencies(
+                        referenceName, 0, end, callSetIds))
+                    self.assertEqual(
+                        [json.loads(record.toJsonString())
+                         for record in records], expected)
+                    for record, jsonDict in zip(records, expected):
+                        self.assertEqual(record.start, jsonDict["start"])
+                        self.assertEqual(record.end, jsonDict["end"])
+                del self._gaObject.genotypeBlockSize
+        for jsonDict in expected:
+            self.assertEqual(
+                len(jsonDict["alleleCounts"]),
+                len(jsonDict["alternateBases"]))
+            if jsonDict["alleleNumber"] > 0:
+                self.assertEqual(
+                    [frequency["frequency"] for frequency in
+                     jsonDict["frequencies"]],
+                    [count / jsonDict["alleleNumber"]
+                     for count in jsonDict["alleleCounts"]])
+
+    def testGenotypeMatrix(self):
+        end = 2**30
+        allCallSetIds = self._gaObject.getCallSetIds()
+        for callSetIds in [None, allCallSetIds[:1], allCallSetIds[3:1:-1]]:
+            for referenceName in self._referenceNames:
+                expectedCallSetIds, blocks = \
+                    variants.AbstractVariantSet.getGenotypeMatrix(
+                        self._gaObject, referenceName, 0, end, callSetIds)
+                expected = [
+                    (starts, ends, alleles, genotypeCodes.tolist())
+                    for starts, ends, alleles, genotypeCodes in blocks]
+                self._gaObject.genotypeBlockSize = 7
+                matrixCallSetIds, blocks = self._gaObject.getGenotypeMatrix(
+                    referenceName, 0, end, callSetIds)
+                self.assertEqual(
+                    sorted(matrixCallSetIds), sorted(expectedCallSetIds))
+                columns = [
+                    expectedCallSetIds.index(callSetId)
+                    for callSetId in matrixCallSetIds]
+                rows = []
+                for starts, ends, alleles, genotypeCodes in blocks:
+                    self.assertLessEqual(len(starts), 7)
+                    self.assertEqual(
+                        genotypeCodes.shape,
+                        (len(starts), len(matrixCallSetIds)))
+                    rows.extend(zip(
+                        starts, ends,
+                        [(referenceBases, list(alternateBases))
+                         for referenceBases, alternateBases in alleles],
+                        genotypeCodes.tolist()))
+                del self._gaObject.genotypeBlockSize
+                expectedRows = []
+                for starts, ends, alleles, genotypeCodes in expected:
+                    expectedRows.extend(zip(
+                        starts, ends, alleles,
+                        [[row[column] for column in columns]
+                         for row in genotypeCodes]))
+                self.assertEqual(rows, expectedRows)
+        with self.assertRaises(exceptions.CallSetNotInVariantSetException):
+            self._gaObject.getGenotypeMatrix(
+                sorted(self._referenceNames)[0], 0, end, ["noSuchCallSet"])
+
+    def testColumnarVariantSet(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            dataDir = os.path.join(tempDir, self._setId)
+            shutil.copytree(self._dataDir, dataDir)
+            self.assertFalse(variants.ColumnarVariantSet.hasStore(dataDir))
+            numVariants = SmallIntervalColumnarVariantSet.ingest(dataDir)
+            self.assertTrue(variants.ColumnarVariantSet.hasStore(dataDir))
+            htslibVariantSet = variants.HtslibVariantSet(self._setId, dataDir)
+            variantSet = variants.ColumnarVariantSet(self._setId, dataDir)
+            self.assertEqual(numVariants, htslibVariantSet.getNumVariants())
+            self.assertEqual(variantSet.getNumVariants(), numVariants)
+            self.assertEqual(
+                variantSet.getCallSetIds(), htslibVariantSet.getCallSetIds())
+            self.assertEqual(
+                variantSet.toProtocolElement(),
+                htslibVariantSet.toProtocolElement())
+            callSetIds = variantSet.getCallSetIds()
+            variantFilters = [
+                None, variants.VariantFilter(minQuality=50),
+                variants.VariantFilter(passOnly=True),
+                variants.VariantFilter(nonReference=True, maxAlleleCount=3)]
+            fieldMask = protocol.FieldMask.parse(
+                "start,calls(callSetId,genotype)")
+            for referenceName in self._referenceNames:
+                intervals = [(0, 2**30), (0, 0)]
+                records = [
+                    record for record in self._variantRecords
+                    if record.CHROM == referenceName]
+                for record in records[::25]:
+                    intervals.append((record.POS - 1, record.POS))
+                    intervals.append((record.POS - 5, record.POS + 500))
+                for start, end in intervals:
+                    for selectedCallSetIds in [None, callSetIds[1:3]]:
+                        for variantFilter in variantFilters:
+                            args = (
+                                referenceName, start, end, None,
+                                selectedCallSetIds)
+                            expected = list(htslibVariantSet.getVariants(
+                                *args, variantFilter=variantFilter))
+                            self.assertEqual(
+                                list(variantSet.getVariants(
+                                    *args, variantFilter=variantFilter)),
+                                expected)
+                            self.assertEqual(
+                                variantSet.getVariantCounts(
+                                    *args, variantFilter=variantFilter,
+                                    binSize=100),
+                                htslibVariantSet.getVariantCounts(
+                                    *args, variantFilter=variantFilter,
+                                    binSize=100))
+                        self.assertEqual(
+                            list(variantSet.getVariants(
+                                *args, minStart=start + 1)),
+                            list(htslibVariantSet.getVariants(
+                                *args, minStart=start + 1)))
+                        self.assertEqual(
+                            [variant.toJsonString(fieldMask) for variant in
+                             variantSet.getVariants(
+                                 *args, fieldMask=fieldMask)],
+                            [variant.toJsonString(fieldMask) for variant in
+                             htslibVariantSet.getVariants(*args)])
+                        self.assertEqual(
+                            [record.toJsonString() for record in
+                             variantSet.getAlleleFrequencies(
+                                 referenceName, start, end,
+                                 selectedCallSetIds)],
+                            [record.toJsonString() for record in
+                             variants.AbstractVariantSet.getAlleleFrequencies(
+                                 variantSet, referenceName, start, end,
+                                 selectedCallSetIds)])
+                        matrixCallSetIds, blocks = \
+                            variantSet.getGenotypeMatrix(
+                                referenceName, start, end, selectedCallSetIds)
+                        expectedCallSetIds, expectedBlocks = \
+                            variants.AbstractVariantSet.getGenotypeMatrix(
+                                variantSet, referenceName, start, end,
+                                selectedCallSetIds)
+                        self.assertEqual(matrixCallSetIds, expectedCallSetIds)
+                        self.assertEqual(
+                            [(starts, ends, alleles, codes.tolist())
+                             for starts, ends, alleles, codes in blocks],
+                            [(starts, ends, alleles, codes.tolist())
+                             for starts, ends, alleles, codes in
+                             expectedBlocks])
+                for record in records[:5]:
+                    if record.ID is not None:
+                        self.assertEqual(
+                            list(variantSet.getVariants(
+                                referenceName, 0, 2**30, record.ID)),
+                            [variant for variant in variantSet.getVariants(
+                                referenceName, 0, 2**30)
+                             if record.ID in variant.names])
+            with self.assertRaises(
+                    exceptions.CallSetNotInVariantSetException):
+                variantSet.getGenotypeMatrix(
+                    "1", 0, 2**30, ["noSuchCallSet"])
+            variantFileName = glob.glob(os.path.join(dataDir, "*.vcf.gz"))[0]
+            with open(variantFileName, "ab") as variantFile:
+                variantFile.write(b"\0")
+            with self.assertRaises(
+                    exceptions.InvalidColumnarVariantStoreException):
+                variants.ColumnarVariantSet(self._setId, dataDir)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testInMemoryVariantSet(self):
+        htslibVariantSet = variants.HtslibVariantSet(
+            self._setId, self._dataDir)
+        variantSet = variants.openVariantSet(
+            self._setId, self._dataDir, 2**30)
+        self.assertIsInstance(variantSet, variants.InMemoryVariantSet)
+        self.assertIsInstance(
+            variants.openVariantSet(self._setId, self._dataDir),
+            variants.HtslibVariantSet)
+        self.assertEqual(
+            variantSet.getNumVariants(), htslibVariantSet.getNumVariants())
+        self.assertEqual(
+            variantSet.toProtocolElement(),
+            htslibVariantSet.toProtocolElement())
+        callSetIds = variantSet.getCallSetIds()
+        variantFilters = [
+            None, variants.VariantFilter(minQuality=50),
+            variants.VariantFilter(passOnly=True),
+            variants.VariantFilter(nonReference=True, maxAlleleCount=3)]
+        for referenceName in self._referenceNames:
+            intervals = [(0, 2**30), (0, 0)]
+            records = [
+                record for record in self._variantRecords
+                if record.CHROM == referenceName]
+            for record in records[::25]:
+                intervals.append((record.POS - 1, record.POS))
+                intervals.append((record.POS - 5, record.POS + 500))
+            for start, end in intervals:
+                for selectedCallSetIds in [None, callSetIds[1:3]]:
+                    for variantFilter in variantFilters:
+                        args = (
+                            referenceName, start, end, None,
+                            selectedCallSetIds)
+                        self.assertEqual(
+                            list(variantSet.getVariants(
+                                *args, variantFilter=variantFilter)),
+                            list(htslibVariantSet.getVariants(
+                                *args, variantFilter=variantFilter)))
+            for record in records[:5]:
+                if record.ID is not None:
+                    self.assertEqual(
+                        list(variantSet.getVariants(
+                            referenceName, 0, 2**30, record.ID)),
+                        [variant for variant in htslibVariantSet.getVariants(
+                            referenceName, 0, 2**30)
+                         if record.ID in variant.names])
+        with self.assertRaises(exceptions.CallSetNotInVariantSetException):
+            list(variantSet.getVariants(
+                sorted(self._referenceNames)[0], 0, 2**30, None,
+                ["noSuchCallSet"]))
+
+    def testMinStart(self):
+        variantSets = [
+            variants.HtslibVariantSet(self._setId, self._dataDir),
+            variants.InMemoryVariantSet(self._setId, self._dataDir)]
+        for referenceName in self._referenceNames:
+            records = [
+                record for record in self._variantRecords
+                if record.CHROM == referenceName]
+            for record in records[::50]:
+                minStart = record.POS - 1
+                for variantSet in variantSets:
+                    args = (referenceName, 0, 2**30)
+                    self.assertEqual(
+                        list(variantSet.getVariants(
+                            *args, minStart=minStart)),
+                        [variant for variant in variantSet.getVariants(*args)
+                         if variant.start >= minStart])
+                    self.assertEqual(
+                        [record.toJsonString() for record in
+                         variantSet.getTranscodedVariants(
+                             *args, minStart=minStart)],
+                        [record.toJsonString() for record in
+                         variantSet.getTranscodedVariants(*args)
+                         if record.start >= minStart])
+
     def testVariantsValid(self):
         end = 2**30  # TODO This is arbitrary, and pysam can choke. FIX!
         for referenceName in self._referenceNames:
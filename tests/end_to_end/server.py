@@ -195,6 +195,15 @@ python server_dev.py
         print(self.getConfig())
 
 
+class Ga4ghTwistedServerForTesting(Ga4ghServerForTesting):
+    """
+    A ga4gh test server that uses the Twisted frontend
+    """
+    def getCmdLine(self):
+        cmdLine = super(Ga4ghTwistedServerForTesting, self).getCmdLine()
+        return cmdLine + "--frontend twisted"
+
+
 class Ga4ghServerForTestingDataSource(Ga4ghServerForTesting):
     """
     A test server that reads data from a data source
@@ -0,0 +1,92 @@
+"""
+End to end tests of the server run with the Twisted frontend
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import socket
+import threading
+
+import requests
+
+import ga4gh.protocol as protocol
+import server as server
+import server_test as server_test
+import test_gestalt as test_gestalt
+
+
+class TestTwistedGestalt(test_gestalt.TestGestalt):
+    """
+    Runs the end-to-end test of the client and server with the Twisted
+    frontend.
+    """
+    def getServer(self):
+        return server.Ga4ghTwistedServerForTesting()
+
+
+class TestTwistedConnections(server_test.ServerTest):
+    """
+    Tests that idle connections do not stop the Twisted frontend from
+    serving other requests.
+    """
+    numIdleConnections = 200
+    numConcurrentSearches = 8
+
+    def getServer(self):
+        return server.Ga4ghTwistedServerForTesting()
+
+    def testIdleConnections(self):
+        idleConnections = []
+        try:
+            for _ in range(self.numIdleConnections):
+                idleConnections.append(socket.create_connection(
+                    ("localhost", server.ga4ghPort)))
+            url = "{}/{}/variantsets/search".format(
+                self.server.getUrl(), protocol.version)
+            request = protocol.SearchVariantSetsRequest()
+            request.pageSize = 1
+            session = requests.Session()
+            for _ in range(2):
+                response = session.post(
+                    url, data=request.toJsonString(),
+                    headers={"Content-Type": "application/json"},
+                    timeout=10)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("variantSets", response.json())
+        finally:
+            for connection in idleConnections:
+                connection.close()
+
+    def postRequest(self, path, request):
+        url = "{}/{}/{}".format(
+            self.server.getUrl(), protocol.version, path)
+        response = requests.post(
+            url, data=request.toJsonString(),
+            headers={"Content-Type": "application/json"}, timeout=10)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def testConcurrentSearches(self):
+        variantSets = self.postRequest(
+            "variantsets/search", protocol.SearchVariantSetsRequest())
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSets["variantSets"][0]["id"]]
+        request.referenceName = "1"
+        request.start = 0
+        request.end = 1000
+        results = [None] * self.numConcurrentSearches
+
+        def search(index):
+            results[index] = self.postRequest("variants/search", request)
+
+        threads = [
+            threading.Thread(target=search, args=(index,))
+            for index in range(self.numConcurrentSearches)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreater(len(results[0]["variants"]), 0)
+        for result in results:
+            self.assertEqual(result, results[0])
@@ -7,14 +7,26 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import argparse
 import os
 import glob
+import json
+import logging
+import Queue
+import shutil
+import tempfile
+import threading
 import unittest
 
+import mock
 import pysam
 
 import ga4gh.backend as backend
+import ga4gh.datamodel as datamodel
+import ga4gh.cli as cli
+import ga4gh.exceptions as exceptions
 import ga4gh.protocol as protocol
+import ga4gh.datamodel.variants as variants
 
 
 class TestAbstractBackend(unittest.TestCase):
@@ -28,7 +40,8 @@ class TestAbstractBackend(unittest.TestCase):
         # TODO arbitrary values, pepper to taste
 
     def resultIterator(
-            self, request, pageSize, searchMethod, ResponseClass, listMember):
+            self, request, pageSize, searchMethod, ResponseClass, listMember,
+            options=None):
         """
         Returns an iterator over the list of results from the specified
         request.  All results are returned, and paging is handled
@@ -38,7 +51,7 @@ class TestAbstractBackend(unittest.TestCase):
         request.pageSize = pageSize
         while notDone:
             # TODO validate the response there.
-            responseStr = searchMethod(request.toJsonString())
+            responseStr = searchMethod(request.toJsonString(), options)
             response = ResponseClass.fromJsonString(responseStr)
             objectList = getattr(response, listMember)
             self.assertLessEqual(len(objectList), pageSize)
@@ -74,16 +87,21 @@ class TestAbstractBackend(unittest.TestCase):
             request, pageSize, self._backend.searchVariants,
             protocol.SearchVariantsResponse, "variants")
 
-    def getCallSets(self, variantSetId, pageSize=100):
+    def getCallSets(
+            self, variantSetId, pageSize=100, name=None, namePrefix=None):
         """
         Returns an iterator over the callsets in a specified
         variant set.
         """
         request = protocol.SearchCallSetsRequest()
         request.variantSetIds = [variantSetId]
+        request.name = name
+        options = None
+        if namePrefix is not None:
+            options = {"namePrefix": namePrefix}
         return self.resultIterator(
             request, pageSize, self._backend.searchCallSets,
-            protocol.SearchCallSetsResponse, "callSets")
+            protocol.SearchCallSetsResponse, "callSets", options)
 
     def testGetVariantSets(self):
         sortedVariantSetsFromGetter = sorted(self._backend.getVariantSets())
@@ -138,6 +156,104 @@ class TestAbstractBackend(unittest.TestCase):
         self.assertTrue(
             isinstance(response, protocol.SearchCallSetsResponse))
 
+    def testSearchCallSetsByName(self):
+        variantSet = self._backend.getVariantSets()[0]
+        sampleNames = sorted(
+            callSet.getSampleName() for callSet in variantSet.getCallSets())
+        variantSetId = variantSet.getId()
+        for sampleName in sampleNames[:3]:
+            callSets = list(self.getCallSets(variantSetId, name=sampleName))
+            self.assertEqual(
+                [callSet.name for callSet in callSets], [sampleName])
+            prefix = sampleName[:-1]
+            callSets = list(self.getCallSets(
+                variantSetId, pageSize=2, namePrefix=prefix))
+            self.assertEqual(
+                [callSet.name for callSet in callSets],
+                [name for name in sampleNames if name.startswith(prefix)])
+            callSets = list(self.getCallSets(
+                variantSetId, name=sampleName, namePrefix=prefix))
+            self.assertEqual(
+                [callSet.name for callSet in callSets], [sampleName])
+            callSets = list(self.getCallSets(
+                variantSetId, name=sampleName, namePrefix=sampleName + "x"))
+            self.assertEqual(callSets, [])
+        callSets = list(self.getCallSets(variantSetId, namePrefix=""))
+        self.assertEqual(
+            [callSet.name for callSet in callSets], sampleNames)
+        callSets = list(self.getCallSets(variantSetId, name=prefix + "*"))
+        self.assertEqual(callSets, [])
+        callSets = list(self.getCallSets(variantSetId, name="nonexistent"))
+        self.assertEqual(callSets, [])
+
+    def testBatchSearchOrder(self):
+        variantSetId = self._backend.getVariantSets()[0].getId()
+        starts = [30, 10, 20, 0]
+        searchedStarts = []
+
+        def objectGenerator(request, searchOptions):
+            searchedStarts.append(request.start)
+            return self._backend.variantsGenerator(request, searchOptions)
+
+        batchRequest = {
+            "request": {
+                "variantSetIds": [variantSetId], "referenceName": "1"},
+            "intervals": [
+                {"start": start, "end": start + 5} for start in starts]}
+        responseStr = "".join(self._backend.runBatchSearchRequest(
+            json.dumps(batchRequest), protocol.SearchVariantsRequest,
+            protocol.SearchVariantsResponse, objectGenerator))
+        self.assertEqual(searchedStarts, sorted(starts))
+        responses = json.loads(responseStr)["responses"]
+        self.assertEqual(len(responses), len(starts))
+        for start, response in zip(starts, responses):
+            self.assertEqual(
+                [variant["start"] for variant in response["variants"]],
+                [variant.start for variant in self.getVariants(
+                    [variantSetId], "1", start, start + 5)])
+
+    def testBatchSearchErrors(self):
+        variantSetId = self._backend.getVariantSets()[0].getId()
+
+        def objectGenerator(request, searchOptions):
+            if request.start == 10:
+                raise ValueError("unexpected error")
+            if request.start == 20:
+                raise exceptions.BadPageTokenException()
+            return self._backend.variantsGenerator(request, searchOptions)
+
+        batchRequest = {
+            "request": {
+                "variantSetIds": [variantSetId], "referenceName": "1"},
+            "intervals": [
+                {"start": start, "end": start + 5} for start in [0, 10, 20]]}
+        logger = logging.getLogger("ga4gh.backend")
+        with mock.patch.object(logger, "exception") as logException:
+            responseStr = "".join(self._backend.runBatchSearchRequest(
+                json.dumps(batchRequest), protocol.SearchVariantsRequest,
+                protocol.SearchVariantsResponse, objectGenerator))
+        self.assertEqual(logException.call_count, 1)
+        responses = json.loads(responseStr)["responses"]
+        self.assertEqual(len(responses), 3)
+        self.assertIn("variants", responses[0])
+        self.assertEqual(
+            responses[1]["errorCode"],
+            exceptions.ServerError.getErrorCode())
+        self.assertEqual(
+            responses[2]["errorCode"],
+            exceptions.BadPageTokenException.getErrorCode())
+
+    def testCachedVariantSets(self):
+        variantSets = list(self.getVariantSets())
+        for variantSet in self._backend.getVariantSets():
+            fragment = variantSet.toJsonFragment()
+            self.assertIs(fragment, variantSet.toJsonFragment())
+        variantSetIdMap = self._backend._variantSetIdMap
+        self.assertEqual(
+            [variantSet.toJsonDict() for variantSet in variantSets],
+            [variantSetIdMap[variantSet.id].toProtocolElement().toJsonDict()
+             for variantSet in variantSets])
+
     def testVariantSetPagination(self):
         results = []
         for pageSize in range(1, 100):
@@ -179,6 +295,682 @@ class TestFileSystemBackend(TestAbstractBackend):
         ids = set(variantSet.id for variantSet in variantSets)
         self.assertEqual(ids, set(self._vcfs.keys()))
 
+    def testInterleavedCursors(self):
+        variantSetId = sorted(self._vcfs.keys())[0]
+        referenceName = sorted(self._chromFileMap[variantSetId].keys())[0]
+        referenceIds = [variant.id for variant in self.getVariants(
+            [variantSetId], referenceName, pageSize=3)]
+        self._backend.setSearchCursors(True, 16, 60)
+        self.addCleanup(self._backend.setSearchCursors, False, 0, 0)
+        self.assertTrue(datamodel.PysamDatamodelMixin.searchCursors)
+        iterators = [
+            self.getVariants([variantSetId], referenceName, pageSize=3)
+            for _ in range(2)]
+        results = [[], []]
+        done = False
+        while not done:
+            done = True
+            for iterator, result in zip(iterators, results):
+                for variant in iterator:
+                    result.append(variant.id)
+                    done = False
+                    break
+        self.assertGreater(len(referenceIds), 3)
+        self.assertEqual(results[0], referenceIds)
+        self.assertEqual(results[1], referenceIds)
+
+    def testTranscodeSearchResults(self):
+        self._backend.setResponseValidation(True)
+        for variantSetId, chromFileMap in self._chromFileMap.items():
+            referenceName = sorted(chromFileMap.keys())[0]
+            variants = list(self.getVariants(
+                [variantSetId], referenceName, pageSize=3))
+            self._backend.setTranscodeSearchResults(True)
+            transcodedVariants = list(self.getVariants(
+                [variantSetId], referenceName, pageSize=3))
+            self._backend.setTranscodeSearchResults(False)
+            self.assertGreater(len(variants), 0)
+            self.assertEqual(
+                [variant.toJsonDict() for variant in variants],
+                [variant.toJsonDict() for variant in transcodedVariants])
+
+    def testSummaries(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            dataDir = os.path.join(tempDir, "data")
+            shutil.copytree(self._dataDir, dataDir)
+            variantSetId = sorted(self._vcfs.keys())[0]
+            readGroupSetDir = glob.glob(
+                os.path.join(dataDir, "reads", "*"))[0]
+            readGroupSetId = os.path.basename(readGroupSetDir)
+            samFileName = glob.glob(
+                os.path.join(readGroupSetDir, "*.bam"))[0]
+            readGroupId = "{}:{}".format(
+                readGroupSetId,
+                os.path.splitext(os.path.basename(samFileName))[0])
+            cli.build_tiles_run(argparse.Namespace(
+                paths=[
+                    os.path.join(dataDir, "variants", variantSetId),
+                    samFileName],
+                binSizes=[1000, 10000]))
+            fileSystemBackend = backend.FileSystemBackend(dataDir)
+            referenceName = sorted(
+                self._chromFileMap[variantSetId].keys())[0]
+            request = protocol.SearchVariantsRequest()
+            request.variantSetIds = [variantSetId]
+            request.referenceName = referenceName
+            numVariants = json.loads(fileSystemBackend.countVariants(
+                request.toJsonString()))["count"]
+            for options, binSize in [({}, 10000), ({"binSize": "5000"}, 1000)]:
+                response = json.loads(fileSystemBackend.summarizeVariants(
+                    request.toJsonString(), options))
+                self.assertEqual(response["binSize"], binSize)
+                self.assertEqual(
+                    sum(bin_["count"] for bin_ in response["bins"]),
+                    numVariants)
+            request = protocol.SearchReadsRequest()
+            request.readGroupIds = [readGroupId]
+            request.referenceId = next(
+                pysam.AlignmentFile(samFileName).fetch()).reference_id
+            response = json.loads(fileSystemBackend.summarizeReads(
+                request.toJsonString()))
+            self.assertEqual(response["binSize"], 10000)
+            self.assertGreater(len(response["bins"]), 0)
+            for bin_ in response["bins"]:
+                self.assertGreater(bin_["meanDepth"], 0)
+            request.referenceId = None
+            with self.assertRaises(exceptions.NotImplementedException):
+                fileSystemBackend.summarizeReads(request.toJsonString())
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testColumnarVariantStore(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            dataDir = os.path.join(tempDir, "data")
+            shutil.copytree(self._dataDir, dataDir)
+            variantSetId = sorted(self._vcfs.keys())[0]
+            request = protocol.SearchVariantsRequest()
+            request.variantSetIds = [variantSetId]
+            request.referenceName = sorted(
+                self._chromFileMap[variantSetId].keys())[0]
+            request.start = 0
+            request.end = 2**30
+            request.pageSize = 1000
+            # The times of the variants are those of the VariantSet
+            # directory, which change when the store is written into it.
+            expected = json.loads(backend.FileSystemBackend(
+                dataDir).searchVariants(request.toJsonString()))
+            for variant in expected["variants"]:
+                del variant["created"], variant["updated"]
+            cli.ingest_variants_run(argparse.Namespace(
+                variantSetDirs=[
+                    os.path.join(dataDir, "variants", variantSetId)]))
+            fileSystemBackend = backend.FileSystemBackend(dataDir)
+            for variantSet in fileSystemBackend.getVariantSets():
+                self.assertEqual(
+                    isinstance(variantSet, variants.ColumnarVariantSet),
+                    variantSet.getId() == variantSetId)
+            response = json.loads(fileSystemBackend.searchVariants(
+                request.toJsonString()))
+            for variant in response["variants"]:
+                del variant["created"], variant["updated"]
+            self.assertEqual(response, expected)
+        finally:
+            shutil.rmtree(tempDir)
+
+
+class TestSqliteBackend(TestFileSystemBackend):
+    """
+    Runs the file system backend tests on a SqliteBackend built from the
+    tests/data directory, and tests the queries answered from the
+    repository.
+    """
+    def setUp(self):
+        super(TestSqliteBackend, self).setUp()
+        self._tempDir = tempfile.mkdtemp()
+        self._repositoryFileName = os.path.join(self._tempDir, "repo.db")
+        cli.build_repository_run(argparse.Namespace(
+            repositoryFile=self._repositoryFileName,
+            dataDirs=[self._dataDir]))
+        self._backend = backend.SqliteBackend(self._repositoryFileName)
+
+    def tearDown(self):
+        shutil.rmtree(self._tempDir)
+
+    def _getListings(self, theBackend):
+        listings = [
+            json.loads(theBackend.searchVariantSets("{}")),
+            json.loads(theBackend.searchReferenceSets("{}"))]
+        # The times of ReadGroups are those at which they are opened.
+        readGroupSets = json.loads(theBackend.searchReadGroupSets("{}"))
+        for readGroupSet in readGroupSets["readGroupSets"]:
+            for readGroup in readGroupSet["readGroups"]:
+                del readGroup["created"], readGroup["updated"]
+        listings.append(readGroupSets)
+        for variantSetId in sorted(self._vcfs.keys()):
+            request = protocol.SearchCallSetsRequest()
+            request.variantSetIds = [variantSetId]
+            listings.append(json.loads(
+                theBackend.searchCallSets(request.toJsonString())))
+        return listings
+
+    def testListings(self):
+        self.assertEqual(
+            self._getListings(self._backend),
+            self._getListings(backend.FileSystemBackend(self._dataDir)))
+        request = protocol.SearchVariantSetsRequest()
+        request.datasetIds = ["data"]
+        self.assertEqual(
+            [variantSet.id for variantSet in self.resultIterator(
+                request, 2, self._backend.searchVariantSets,
+                protocol.SearchVariantSetsResponse, "variantSets")],
+            sorted(self._vcfs.keys()))
+        request.datasetIds = ["nonexistent"]
+        self.assertEqual(list(self.resultIterator(
+            request, 2, self._backend.searchVariantSets,
+            protocol.SearchVariantSetsResponse, "variantSets")), [])
+        request = protocol.SearchReferenceSetsRequest()
+        request.accessions = ["nonexistent"]
+        response = json.loads(self._backend.searchReferenceSets(
+            request.toJsonString()))
+        self.assertEqual(response["referenceSets"], [])
+
+    def testDataFilesOpenedLazily(self):
+        self._getListings(self._backend)
+        variantSetIdMap = self._backend._variantSetIdMap
+        readGroupIdMap = self._backend._readGroupIdMap
+        self.assertEqual(variantSetIdMap.getNumLoaded(), 0)
+        self.assertEqual(readGroupIdMap.getNumLoaded(), 0)
+        variantSetId = sorted(self._vcfs.keys())[0]
+        referenceName = sorted(self._chromFileMap[variantSetId].keys())[0]
+        self.assertGreater(len(list(self.getVariants(
+            [variantSetId], referenceName))), 0)
+        self.assertEqual(variantSetIdMap.getNumLoaded(), 1)
+        response = json.loads(self._backend.beaconQuery({
+            "chromosome": "nonexistent", "position": "0", "allele": "A",
+            "reference": "GRCh37"}))
+        self.assertEqual(response["response"]["exists"], "false")
+        self.assertEqual(variantSetIdMap.getNumLoaded(), 1)
+
+    def testDensitySummaries(self):
+        for variantSetId, vcfFiles in self._vcfs.items():
+            for vcfFile in vcfFiles:
+                tilesFileName = os.path.join(self._tempDir, "vcf.tiles")
+                variants.VariantDensityTiles.build(
+                    vcfFile, tilesFileName=tilesFileName)
+                tiles = variants.VariantDensityTiles(tilesFileName)
+                for referenceName in pysam.VariantFile(vcfFile).index:
+                    request = protocol.SearchVariantsRequest()
+                    request.variantSetIds = [variantSetId]
+                    request.referenceName = referenceName
+                    request.start = 1000
+                    request.end = 200000
+                    for binSize in [None, 5000, 20000]:
+                        options = {}
+                        if binSize is not None:
+                            options["binSize"] = str(binSize)
+                        response = json.loads(
+                            self._backend.summarizeVariants(
+                                request.toJsonString(), options))
+                        expectedBinSize, bins = tiles.getSummary(
+                            referenceName, request.start, request.end,
+                            binSize)
+                        self.assertEqual(response["binSize"], expectedBinSize)
+                        self.assertEqual(
+                            [(bin_["start"], bin_["count"])
+                             for bin_ in response["bins"]], bins)
+        self.assertEqual(self._backend._variantSetIdMap.getNumLoaded(), 0)
+
+    def testStaleRepository(self):
+        dataDir = os.path.join(self._tempDir, "data")
+        shutil.copytree(self._dataDir, dataDir)
+        repositoryFileName = os.path.join(self._tempDir, "stale.db")
+        cli.build_repository_run(argparse.Namespace(
+            repositoryFile=repositoryFileName, dataDirs=[dataDir]))
+        variantSetId = sorted(self._vcfs.keys())[0]
+        vcfFile = glob.glob(os.path.join(
+            dataDir, "variants", variantSetId, "*.vcf.gz"))[0]
+        with open(vcfFile, "ab") as dataFile:
+            dataFile.write(b"\0")
+        sqliteBackend = backend.SqliteBackend(repositoryFileName)
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSetId]
+        request.referenceName = "1"
+        with self.assertRaises(exceptions.InvalidRepositoryException):
+            sqliteBackend.searchVariants(request.toJsonString())
+
+    def testInvalidRepository(self):
+        with self.assertRaises(exceptions.DuplicateRepositoryIdException):
+            cli.build_repository_run(argparse.Namespace(
+                repositoryFile=self._repositoryFileName,
+                dataDirs=[self._dataDir, self._dataDir]))
+        fileName = os.path.join(self._tempDir, "notarepository.db")
+        with open(fileName, "w") as notARepository:
+            notARepository.write("not a database")
+        with self.assertRaises(exceptions.InvalidRepositoryException):
+            backend.SqliteBackend(fileName)
+
+
+class TestPrefetchCache(unittest.TestCase):
+    """
+    Tests the cache used to hold speculatively computed pages.
+    """
+    def testPutGet(self):
+        cache = backend.PrefetchCache(2, 60)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+
+    def testMaxSize(self):
+        cache = backend.PrefetchCache(2, 60)
+        for key in ["a", "b", "c"]:
+            cache.put(key, key)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), "c")
+
+    def testExpiry(self):
+        cache = backend.PrefetchCache(2, -1)
+        cache.put("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def testReserve(self):
+        cache = backend.PrefetchCache(2, 60)
+        self.assertTrue(cache.reserve("a"))
+        self.assertFalse(cache.reserve("a"))
+        cache.put("a", 1)
+        cache.release("a")
+        self.assertFalse(cache.reserve("a"))
+        self.assertEqual(cache.get("a"), 1)
+
+
+class TestPagePrefetch(TestAbstractBackend):
+    """
+    Tests that paging through results with prefetching enabled gives
+    the same results as without it.
+    """
+    def setUp(self):
+        super(TestPagePrefetch, self).setUp()
+        self._backend.setPrefetchNextPage(True, 16, 60)
+        self._referenceBackend = backend.SimulatedBackend(
+            numCalls=100, numVariantSets=10)
+
+    def tearDown(self):
+        self._backend.setPrefetchNextPage(False, 0, 0)
+
+    def testVariantsPagination(self):
+        variantSetId = self._backend.getVariantSets()[0].getId()
+        variants = list(self.getVariants(
+            [variantSetId], "1", end=100, pageSize=7))
+        self._backend = self._referenceBackend
+        referenceVariants = list(self.getVariants(
+            [variantSetId], "1", end=100, pageSize=7))
+        self.assertGreater(len(variants), 7)
+        self.assertEqual(
+            [(v.id, v.alternateBases) for v in variants],
+            [(v.id, v.alternateBases) for v in referenceVariants])
+
+    def testErrorsLogged(self):
+        def objectGenerator(request, searchOptions):
+            raise exceptions.BadPageTokenException()
+
+        request = protocol.SearchVariantsRequest()
+        request.pageSize = 1
+        prefetchCache = backend.PrefetchCache(16, 60)
+        prefetchQueue = Queue.Queue()
+        prefetchCache.reserve("key")
+        prefetchQueue.put((
+            "key", request, backend.SearchOptions(),
+            protocol.SearchVariantsResponse, objectGenerator))
+        prefetchQueue.put(None)
+        logger = logging.getLogger("ga4gh.backend")
+        with mock.patch.object(logger, "exception") as logException:
+            self._backend._prefetchWorker(prefetchCache, prefetchQueue)
+        self.assertEqual(logException.call_count, 1)
+        self.assertIsNone(prefetchCache.get("key"))
+
+
+class TestSearchCursors(TestAbstractBackend):
+    """
+    Tests that paging through results with server-side cursors gives
+    the same results as restarting the search for each page.
+    """
+    def setUp(self):
+        super(TestSearchCursors, self).setUp()
+        self._backend.setSearchCursors(True, 16, 60)
+        self._referenceBackend = backend.SimulatedBackend(
+            numCalls=100, numVariantSets=10)
+
+    def tearDown(self):
+        self._backend.setSearchCursors(False, 0, 0)
+        self.assertFalse(datamodel.PysamDatamodelMixin.searchCursors)
+
+    def getReferenceVariants(self, *args, **kwargs):
+        self._backend, backendUnderTest = (
+            self._referenceBackend, self._backend)
+        try:
+            return list(self.getVariants(*args, **kwargs))
+        finally:
+            self._backend = backendUnderTest
+
+    def assertVariantsEqual(self, variants, referenceVariants):
+        self.assertEqual(
+            [(v.id, v.alternateBases) for v in variants],
+            [(v.id, v.alternateBases) for v in referenceVariants])
+
+    def testVariantsPagination(self):
+        variantSetId = self._backend.getVariantSets()[0].getId()
+        variants = list(self.getVariants(
+            [variantSetId], "1", end=100, pageSize=7))
+        self.assertGreater(len(variants), 7)
+        self.assertVariantsEqual(variants, self.getReferenceVariants(
+            [variantSetId], "1", end=100, pageSize=7))
+        # Exhausted cursors are discarded.
+        self.assertEqual(len(self._backend._cursorTable), 0)
+
+    def testCursorResumed(self):
+        variantSetId = self._backend.getVariantSets()[0].getId()
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSetId]
+        request.referenceName = "1"
+        request.start = 0
+        request.end = 100
+        request.pageSize = 7
+        response = protocol.SearchVariantsResponse.fromJsonString(
+            self._backend.searchVariants(request.toJsonString()))
+        self.assertEqual(response.nextPageToken.count(":"), 2)
+        self.assertEqual(len(self._backend._cursorTable), 1)
+        request.pageToken = response.nextPageToken
+        intervalIterator = self._backend.variantsGenerator(request)
+        # The cursor is taken out of the table while it is in use.
+        self.assertNotIn(
+            intervalIterator.getCursorId(), self._backend._cursorTable)
+        self.assertIsNot(
+            self._backend.variantsGenerator(request), intervalIterator)
+        self._backend._cursorTable.save(intervalIterator)
+        # A different query with the same token must not use the cursor.
+        request.end = 200
+        self.assertIsNot(
+            self._backend.variantsGenerator(request), intervalIterator)
+        self.assertIn(
+            intervalIterator.getCursorId(), self._backend._cursorTable)
+
+    def testCursorsNotCrossed(self):
+        variantSetId = self._backend.getVariantSets()[0].getId()
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSetId]
+        request.referenceName = "1"
+        request.start = 0
+        request.end = 100
+        request.pageSize = 7
+        frequenciesResponse = json.loads(
+            self._backend.searchAlleleFrequencies(request.toJsonString()))
+        variantsResponse = protocol.SearchVariantsResponse.fromJsonString(
+            self._backend.searchVariants(request.toJsonString()))
+        cursorIds = [
+            backend._parseIntervalPageToken(pageToken)[2] for pageToken in [
+                frequenciesResponse["nextPageToken"],
+                variantsResponse.nextPageToken]]
+        # The token of each search is used by the other one.
+        variantsRequest = protocol.SearchVariantsRequest.fromJsonDict(
+            request.toJsonDict())
+        variantsRequest.pageToken = frequenciesResponse["nextPageToken"]
+        response = protocol.SearchVariantsResponse.fromJsonString(
+            self._backend.searchVariants(variantsRequest.toJsonString()))
+        referenceVariants = self.getReferenceVariants(
+            [variantSetId], "1", end=100, pageSize=7)
+        self.assertVariantsEqual(response.variants, referenceVariants[7:14])
+        request.pageToken = variantsResponse.nextPageToken
+        response = json.loads(
+            self._backend.searchAlleleFrequencies(request.toJsonString()))
+        self.assertEqual(
+            [site["variantId"] for site in response["sites"]],
+            [variant.id for variant in referenceVariants[7:14]])
+        self.assertTrue(
+            all("alleleNumber" in site for site in response["sites"]))
+        # Neither cursor was used or discarded by the other search.
+        for cursorId in cursorIds:
+            self.assertIn(cursorId, self._backend._cursorTable)
+
+    def testExpiredCursors(self):
+        self._backend.setSearchCursors(True, 16, -1)
+        variantSetId = self._backend.getVariantSets()[0].getId()
+        variants = list(self.getVariants(
+            [variantSetId], "1", end=100, pageSize=7))
+        self.assertVariantsEqual(variants, self.getReferenceVariants(
+            [variantSetId], "1", end=100, pageSize=7))
+
+    def testUnknownCursor(self):
+        variantSetId = self._backend.getVariantSets()[0].getId()
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSetId]
+        request.referenceName = "1"
+        request.start = 0
+        request.end = 100
+        request.pageSize = 7
+        response = protocol.SearchVariantsResponse.fromJsonString(
+            self._referenceBackend.searchVariants(request.toJsonString()))
+        request.pageToken = response.nextPageToken + ":12345"
+        response = protocol.SearchVariantsResponse.fromJsonString(
+            self._backend.searchVariants(request.toJsonString()))
+        referenceVariants = self.getReferenceVariants(
+            [variantSetId], "1", end=100, pageSize=7)
+        self.assertVariantsEqual(response.variants, referenceVariants[7:14])
+
+
+class TestPipelinedSearch(unittest.TestCase):
+    """
+    Tests that searches read by the worker processes of a SearchPipeline
+    give the same pages as those read in the server process.
+    """
+    def setUp(self):
+        dataDir = os.path.join("tests", "data")
+        self._backend = backend.FileSystemBackend(dataDir)
+        self._backend.setTranscodeSearchResults(True)
+        self._backend.setPipelinedSearch(2, 4)
+        self._referenceBackend = backend.FileSystemBackend(dataDir)
+        self._referenceBackend.setTranscodeSearchResults(True)
+
+    def tearDown(self):
+        self._backend.setPipelinedSearch(0, 0)
+
+    def getPages(self, searchMethod, request):
+        pages = []
+        while True:
+            responseString = searchMethod(request.toJsonString())
+            pages.append(responseString)
+            request.pageToken = json.loads(responseString)["nextPageToken"]
+            if request.pageToken is None:
+                return pages
+
+    def assertPagesEqual(self, searchMethodName, request):
+        referencePages = self.getPages(
+            getattr(self._referenceBackend, searchMethodName),
+            request.fromJsonDict(request.toJsonDict()))
+        self.assertEqual(
+            self.getPages(getattr(self._backend, searchMethodName), request),
+            referencePages)
+        return referencePages
+
+    def testVariants(self):
+        numPages = []
+        for variantSet in self._backend.getVariantSets():
+            referenceName = sorted(variantSet._chromFileMap.keys())[0]
+            request = protocol.SearchVariantsRequest()
+            request.variantSetIds = [variantSet.getId()]
+            request.referenceName = referenceName
+            request.start = 0
+            request.end = 2**30
+            request.pageSize = 7
+            numPages.append(len(
+                self.assertPagesEqual("searchVariants", request)))
+            request.pageToken = None
+            request.callSetIds = variantSet.getCallSetIds()[:1]
+            self.assertPagesEqual("searchVariants", request)
+        self.assertGreater(max(numPages), 1)
+
+    def testReads(self):
+        readGroupId = self._backend._readGroupIds[0]
+        readGroup = self._backend._readGroupIdMap[readGroupId]
+        request = protocol.SearchReadsRequest()
+        request.readGroupIds = [readGroupId]
+        request.referenceId = next(pysam.AlignmentFile(
+            readGroup.getSamFilePath()).fetch()).reference_id
+        request.start = 0
+        request.end = 2**20
+        request.pageSize = 2
+        self.assertGreater(
+            len(self.assertPagesEqual("searchReads", request)), 1)
+
+    def testErrorsReported(self):
+        variantSet = self._backend.getVariantSets()[0]
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSet.getId()]
+        request.referenceName = sorted(variantSet._chromFileMap.keys())[0]
+        request.start = 0
+        request.end = 2**30
+        request.callSetIds = ["noSuchCallSet"]
+        with self.assertRaises(exceptions.CallSetNotInVariantSetException):
+            self._backend.searchVariants(request.toJsonString())
+
+
+class TestConcurrentSearches(TestPipelinedSearch):
+    """
+    Tests that searches run at the same time on several threads, while
+    the next pages are prefetched, give the same pages as those run one
+    at a time.
+    """
+    numThreads = 4
+
+    def setUp(self):
+        dataDir = os.path.join("tests", "data")
+        self._backend = backend.FileSystemBackend(dataDir)
+        self._backend.setPrefetchNextPage(True, 16, 60)
+        self._referenceBackend = backend.FileSystemBackend(dataDir)
+
+    def tearDown(self):
+        self._backend.setPrefetchNextPage(False, 0, 0)
+
+    def getPages(self, searchMethod, request):
+        getPages = super(TestConcurrentSearches, self).getPages
+        if searchMethod.__self__ is not self._backend:
+            return getPages(searchMethod, request)
+        results = [None] * self.numThreads
+
+        def search(index):
+            results[index] = getPages(
+                searchMethod, request.fromJsonDict(request.toJsonDict()))
+
+        threads = [
+            threading.Thread(target=search, args=(index,))
+            for index in range(self.numThreads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for pages in results:
+            self.assertEqual(pages, results[0])
+        return results[0]
+
+
+class TestCursorTable(unittest.TestCase):
+    """
+    Tests the table used to hold server-side cursors.
+    """
+    def testNewCursorId(self):
+        cursorTable = backend.CursorTable(2, 60)
+        cursorIds = [cursorTable.newCursorId() for _ in range(10)]
+        self.assertEqual(len(set(cursorIds)), 10)
+
+    def testResumeWithoutCursor(self):
+        cursorTable = backend.CursorTable(2, 60)
+        searchOptions = backend.SearchOptions()
+        request = protocol.SearchVariantsRequest()
+        iteratorClass = backend.VariantsIntervalIterator
+        self.assertIsNone(
+            cursorTable.resume(request, searchOptions, iteratorClass))
+        request.pageToken = "1:0"
+        self.assertIsNone(
+            cursorTable.resume(request, searchOptions, iteratorClass))
+        request.pageToken = "1:0:0"
+        self.assertIsNone(
+            cursorTable.resume(request, searchOptions, iteratorClass))
+
+
+class TestSearchOptions(unittest.TestCase):
+    """
+    Tests the search options given outside the protocol request.
+    """
+    def setUp(self):
+        self._backend = backend.SimulatedBackend()
+
+    def testSearchVariantsFieldMask(self):
+        variantSetId = self._backend.getVariantSets()[0].getId()
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSetId]
+        request.referenceName = "1"
+        request.start = 0
+        request.end = 100
+        request.pageSize = 5
+        responseStr = self._backend.searchVariants(
+            request.toJsonString(), {"fields": "variants(id,start)"})
+        response = json.loads(responseStr)
+        self.assertIsNotNone(response["nextPageToken"])
+        self.assertEqual(len(response["variants"]), 5)
+        for variant in response["variants"]:
+            self.assertEqual(set(variant.keys()), set(["id", "start"]))
+
+    def testVariantFilterOptions(self):
+        searchOptions = backend.SearchOptions({})
+        self.assertIsNone(searchOptions.getVariantFilter())
+        self.assertEqual(searchOptions.getKey(), "")
+        searchOptions = backend.SearchOptions(
+            {"passOnly": "true", "minQuality": "20", "other": "x"})
+        self.assertIsNotNone(searchOptions.getVariantFilter())
+        self.assertEqual(searchOptions.getKey(), "minQuality=20&passOnly=true")
+        searchOptions = backend.SearchOptions({"passOnly": "false"})
+        self.assertIsNone(searchOptions.getVariantFilter())
+        for name, value in [
+                ("minQuality", "high"), ("passOnly", "yes"),
+                ("minAlleleCount", "1.5")]:
+            self.assertRaises(
+                exceptions.BadSearchOptionException, backend.SearchOptions,
+                {name: value})
+
+    def testReadFilterOptions(self):
+        searchOptions = backend.SearchOptions({})
+        self.assertIsNone(searchOptions.getReadFilter())
+        searchOptions = backend.SearchOptions(
+            {"excludeDuplicates": "1", "maxDepth": "100"})
+        self.assertIsNotNone(searchOptions.getReadFilter())
+        self.assertIsNone(searchOptions.getVariantFilter())
+        for name, value in [
+                ("mappedOnly", "maybe"), ("minMappingQuality", "-1"),
+                ("maxDepth", "many"), ("depthWindowSize", "0"),
+                ("downsamplingSeed", "-1")]:
+            self.assertRaises(
+                exceptions.BadSearchOptionException, backend.SearchOptions,
+                {name: value})
+
+    def testSimulatedVariantFilter(self):
+        variantSetId = self._backend.getVariantSets()[0].getId()
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSetId]
+        request.referenceName = "1"
+        request.start = 0
+        request.end = 100
+        self.assertRaises(
+            exceptions.NotImplementedException, self._backend.searchVariants,
+            request.toJsonString(), {"nonReference": "true"})
+
+    def testBadFieldMask(self):
+        request = protocol.SearchVariantSetsRequest()
+        self.assertRaises(
+            exceptions.BadFieldMaskException, self._backend.searchVariantSets,
+            request.toJsonString(), {"fields": "variantSets("})
+
 
 class TestTopLevelObjectGenerator(unittest.TestCase):
     """
@@ -192,6 +984,9 @@ class TestTopLevelObjectGenerator(unittest.TestCase):
             def toProtocolElement(self):
                 return self
 
+            def toJsonFragment(self):
+                return self
+
         self.request = FakeRequest()
         self.request.pageToken = None
         self.idMap = {
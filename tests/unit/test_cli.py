@@ -150,6 +150,12 @@ class TestClientArguments(unittest.TestCase):
     def testReferenceGetArguments(self):
         self.cliInput = """references-get --id ID"""
 
+    def testVariantGetArguments(self):
+        self.cliInput = """variants-get --id ID"""
+
+    def testReadGetArguments(self):
+        self.cliInput = """reads-get --id ID"""
+
     def testReferenceBasesListArguments(self):
         self.cliInput = """references-list-bases --id ID
         --start 1 --end 2"""
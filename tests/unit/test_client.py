@@ -6,6 +6,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import io
 import unittest
 import json
 
@@ -122,6 +123,16 @@ class TestSearchMethodsCallRunRequest(unittest.TestCase):
         self.httpClient.runGetRequest.assert_called_once_with(
             "references", protocol.Reference, self._id)
 
+    def testGetVariant(self):
+        self.httpClient.getVariant(self._id)
+        self.httpClient.runGetRequest.assert_called_once_with(
+            "variants", protocol.Variant, self._id)
+
+    def testGetReadAlignment(self):
+        self.httpClient.getReadAlignment(self._id)
+        self.httpClient.runGetRequest.assert_called_once_with(
+            "reads", protocol.ReadAlignment, self._id)
+
     def testListReferenceBases(self):
         self.httpClient.listReferenceBases(self.protocolRequest, self._id)
         self.httpClient.runListRequest.assert_called_once_with(
@@ -225,3 +236,50 @@ class TestRunRequest(unittest.TestCase):
             params = {"start": 1, "end": 5}
             httpMethod = 'GET'
             mockGet.assert_called_twice_with(httpMethod, url, params=params)
+
+
+class TestGenotypeMatrix(unittest.TestCase):
+    """
+    Test reading genotype matrices
+    """
+    def setUp(self):
+        self.httpClient = utils.makeHttpClient()
+        formatClass = protocol.GenotypeMatrixFormat
+        self.callSetIds = ["cs1", "cs2", "cs3"]
+        self.data = b"".join([
+            formatClass.encodeHeader(self.callSetIds),
+            formatClass.encodeBlock(
+                [10, 20], [11, 22], [("A", ["C"]), ("AG", ["A", "AGG"])],
+                b"\x00\x01\x02\x01\xff\x00"),
+            formatClass.encodeBlock([30], [31], [("T", [])], b"\x02\x02\x00"),
+            formatClass.encodeEnd()])
+
+    def testReadGenotypeMatrix(self):
+        matrix = self.httpClient.readGenotypeMatrix(io.BytesIO(self.data))
+        self.assertEqual(matrix.callSetIds, self.callSetIds)
+        self.assertEqual(matrix.starts.tolist(), [10, 20, 30])
+        self.assertEqual(matrix.ends.tolist(), [11, 22, 31])
+        self.assertEqual(
+            matrix.alleles,
+            [("A", ["C"]), ("AG", ["A", "AGG"]), ("T", [])])
+        self.assertEqual(
+            matrix.genotypes.tolist(), [[0, 1, 2], [1, -1, 0], [2, 2, 0]])
+        self.assertEqual(self.httpClient.getBytesRead(), len(self.data))
+
+    def testReadBadGenotypeMatrix(self):
+        for data in [b"NOTMAGIC" + self.data[8:], self.data[:-1]]:
+            with self.assertRaises(Exception):
+                self.httpClient.readGenotypeMatrix(io.BytesIO(data))
+
+    def testExportGenotypeMatrix(self):
+        response = DummyResponse("")
+        response.raw = io.BytesIO(self.data)
+        mockPost = mock.Mock(return_value=response)
+        with mock.patch('requests.request', mockPost):
+            protocolRequest = protocol.SearchVariantsRequest()
+            matrix = self.httpClient.exportGenotypeMatrix(protocolRequest)
+            self.assertEqual(matrix.callSetIds, self.callSetIds)
+            mockPost.assert_called_once_with(
+                'POST', "http://example.com/variants/genotypes",
+                params={}, data=protocolRequest.toJsonString(),
+                headers={"Content-type": "application/json"}, stream=True)
@@ -155,12 +155,13 @@ class ImportGraphLayerChecker(object):
     moduleGroupNames = {
         'cli': ['ga4gh/cli.py'],
         'client': ['ga4gh/client.py'],
-        'frontend': ['ga4gh/frontend.py'],
+        'frontend': ['ga4gh/frontend.py', 'ga4gh/twistedfrontend.py'],
         'backend': ['ga4gh/backend.py'],
         'exceptions': ['ga4gh/exceptions.py'],
         'datamodel': ['ga4gh/datamodel/reads.py',
                       'ga4gh/datamodel/references.py',
-                      'ga4gh/datamodel/variants.py'],
+                      'ga4gh/datamodel/variants.py',
+                      'ga4gh/datamodel/repository.py'],
         'libraries': ['ga4gh/converters.py'],
         'protocol': ['ga4gh/protocol.py', 'ga4gh/_protocol_definitions.py'],
         'config': ['ga4gh/serverconfig.py'],
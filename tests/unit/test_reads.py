@@ -0,0 +1,218 @@
+"""
+Unit tests for read objects. This is used for all tests
+that can be performed in isolation from input data.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import pysam
+
+import ga4gh.protocol as protocol
+import ga4gh.datamodel.reads as reads
+
+
+class TestSamFlags(unittest.TestCase):
+    """
+    Unit tests for decoding SAM flags.
+    """
+    def testDecode(self):
+        flags = reads.SamFlags
+        for flag in range(2**16):
+            (duplicateFragment, failedVendorQualityChecks, properPlacement,
+             secondaryAlignment, supplementaryAlignment, numberReads,
+             readNumber) = flags.decode(flag)
+            self.assertEqual(
+                duplicateFragment,
+                flags.isFlagSet(flag, flags.DUPLICATE_FRAGMENT))
+            self.assertEqual(
+                failedVendorQualityChecks,
+                flags.isFlagSet(flag, flags.FAILED_VENDOR_QUALITY_CHECKS))
+            self.assertEqual(
+                properPlacement,
+                flags.isFlagSet(flag, flags.PROPER_PLACEMENT))
+            self.assertEqual(
+                secondaryAlignment,
+                flags.isFlagSet(flag, flags.SECONDARY_ALIGNMENT))
+            self.assertEqual(
+                supplementaryAlignment,
+                flags.isFlagSet(flag, flags.SUPPLEMENTARY_ALIGNMENT))
+            if flags.isFlagSet(flag, flags.NUMBER_READS):
+                self.assertEqual(numberReads, 2)
+            else:
+                self.assertIsNone(numberReads)
+                self.assertIsNone(readNumber)
+
+    def testReadNumber(self):
+        flags = reads.SamFlags
+        self.assertEqual(
+            flags.decode(flags.NUMBER_READS | flags.READ_NUMBER_ONE)[-1], 0)
+        self.assertEqual(
+            flags.decode(flags.NUMBER_READS | flags.READ_NUMBER_TWO)[-1], 1)
+        self.assertIsNone(flags.decode(flags.NUMBER_READS)[-1])
+
+
+class TestCigarUnits(unittest.TestCase):
+    """
+    Unit tests for the shared CigarUnits.
+    """
+    def testCigarUnit(self):
+        cigarUnit = reads.HtslibReadGroup._getCigarUnit(0, 36)
+        self.assertEqual(
+            cigarUnit.operation, protocol.CigarOperation.ALIGNMENT_MATCH)
+        self.assertEqual(cigarUnit.operationLength, 36)
+        self.assertIsNone(cigarUnit.referenceSequence)
+        self.assertIs(
+            cigarUnit, reads.HtslibReadGroup._getCigarUnit(0, 36))
+        self.assertIsNot(
+            cigarUnit, reads.HtslibReadGroup._getCigarUnit(4, 36))
+
+
+class TestReadFilter(unittest.TestCase):
+    """
+    Tests the downsampling of reads by the ReadFilter.
+    """
+    Read = collections.namedtuple(
+        "Read", ["query_name", "flag", "mapping_quality", "reference_start",
+                 "reference_end"])
+
+    def getReads(self, names, start):
+        return [
+            self.Read(name, 0, 60, start + index, start + index + 100)
+            for index, name in enumerate(names)]
+
+    def getNames(self, reads):
+        return [read.query_name for read in reads]
+
+    def testDownsampling(self):
+        readFilter = reads.ReadFilter(maxDepth=2, windowSize=10)
+        names = ["read{}".format(index) for index in range(10)]
+        windowReads = self.getReads(names, 0)
+        keptNames = self.getNames(readFilter.filterReads(windowReads))
+        self.assertEqual(len(keptNames), 2)
+        # The reads kept are those with the smallest keys, whatever their
+        # order in the file.
+        keys = sorted(readFilter.getSamplingKey(read) for read in windowReads)
+        self.assertEqual(
+            sorted(readFilter.getSamplingKey(read) for read in windowReads
+                   if read.query_name in keptNames),
+            keys[:2])
+        reversedNames = self.getNames(readFilter.filterReads(
+            self.getReads(list(reversed(names)), 0)))
+        self.assertEqual(sorted(reversedNames), sorted(keptNames))
+        # Each window is downsampled separately.
+        nextWindowReads = self.getReads(names, 10)
+        self.assertEqual(
+            len(list(readFilter.filterReads(windowReads + nextWindowReads))),
+            4)
+        # The reads kept only change with the seed.
+        seedNames = []
+        for seed in range(10):
+            readFilter = reads.ReadFilter(maxDepth=2, windowSize=10, seed=seed)
+            seedNames.append(sorted(self.getNames(
+                readFilter.filterReads(windowReads))))
+        self.assertGreater(len(set(map(tuple, seedNames))), 1)
+
+    def testLongReads(self):
+        # The reads are longer than the windows, so the reads overlapping
+        # a position start in several windows before it.
+        readLength = 100
+        allReads = [
+            self.Read("read{}".format(index), 0, 60, index * 3,
+                      index * 3 + readLength)
+            for index in range(200)]
+
+        def fetch(fetchStart, fetchEnd):
+            return iter([
+                read for read in allReads
+                if (fetchStart is None or read.reference_end > fetchStart) and
+                (fetchEnd is None or read.reference_start < fetchEnd)])
+
+        readFilter = reads.ReadFilter(maxDepth=2, windowSize=10)
+        keptNames = self.getNames(readFilter.fetchReads(fetch))
+        self.assertLess(len(keptNames), len(allReads))
+        for start, end in [(250, 400), (255, 400), (301, 333), (0, 50)]:
+            self.assertEqual(
+                self.getNames(readFilter.fetchReads(fetch, start, end)),
+                [read.query_name for read in allReads
+                 if read.query_name in keptNames and
+                 read.reference_end > start and read.reference_start < end])
+        self.assertEqual(
+            list(readFilter.fetchReads(fetch, 1000, 1100)), [])
+
+    def testFetchRange(self):
+        readFilter = reads.ReadFilter(maxDepth=2, windowSize=10)
+        self.assertEqual(readFilter.getFetchStart(15), 10)
+        self.assertEqual(readFilter.getFetchStart(20), 20)
+        self.assertEqual(readFilter.getFetchEnd(15), 20)
+        self.assertEqual(readFilter.getFetchEnd(20), 20)
+        self.assertIsNone(readFilter.getFetchEnd(None))
+        readFilter = reads.ReadFilter(mappedOnly=True)
+        self.assertEqual(readFilter.getFetchStart(15), 15)
+        self.assertEqual(readFilter.getFetchEnd(15), 15)
+
+
+class TestUnmappedPlacedReads(unittest.TestCase):
+    """
+    Tests the conversion of an unmapped read placed at the position of
+    its mapped mate, which has neither a CIGAR nor qualities.
+    """
+    def setUp(self):
+        self._tempDir = tempfile.mkdtemp()
+        samFileName = os.path.join(self._tempDir, "placed.bam")
+        header = {
+            "HD": {"VN": "1.0", "SO": "coordinate"},
+            "SQ": [{"SN": "chr1", "LN": 1000}]}
+        samFile = pysam.AlignmentFile(samFileName, "wb", header=header)
+        flags = reads.SamFlags
+        for flag, cigar in [
+                (flags.NUMBER_READS | flags.READ_NUMBER_ONE, [(0, 10)]),
+                (flags.NUMBER_READS | flags.READ_NUMBER_TWO | 0x4, None)]:
+            read = pysam.AlignedSegment()
+            read.query_name = b"pair"
+            read.query_sequence = b"ACGTACGTAC"
+            read.flag = flag
+            read.reference_id = 0
+            read.reference_start = 100
+            if cigar is not None:
+                read.cigartuples = cigar
+                read.mapping_quality = 60
+            read.next_reference_id = 0
+            read.next_reference_start = 100
+            samFile.write(read)
+        samFile.close()
+        pysam.index(samFileName.encode())
+        self._readGroup = reads.HtslibReadGroup("set:placed", samFileName)
+
+    def tearDown(self):
+        shutil.rmtree(self._tempDir)
+
+    def testConvertReadAlignment(self):
+        mapped, unmapped = self._readGroup.getReadAlignments(0, 0, 1000)
+        self.assertEqual(len(mapped.alignment.cigar), 1)
+        self.assertEqual(unmapped.alignment.cigar, [])
+        self.assertEqual(unmapped.alignedQuality, [])
+        self.assertEqual(unmapped.alignment.position.position, 100)
+        self.assertEqual(unmapped.alignedSequence, "ACGTACGTAC")
+        self.assertTrue(protocol.ReadAlignment.validate(
+            unmapped.toJsonDict()))
+
+    def testTranscodeReadAlignment(self):
+        fieldMasks = [None, protocol.FieldMask.parse("id,alignment(cigar)")]
+        for fieldMask in fieldMasks:
+            gaAlignments = list(self._readGroup.getReadAlignments(
+                0, 0, 1000, fieldMask=fieldMask))
+            records = list(self._readGroup.getTranscodedReadAlignments(
+                0, 0, 1000, fieldMask=fieldMask))
+            self.assertEqual(len(gaAlignments), 2)
+            self.assertEqual(
+                [gaAlignment.toJsonDict(fieldMask)
+                 for gaAlignment in gaAlignments],
+                [json.loads(record.toJsonString()) for record in records])
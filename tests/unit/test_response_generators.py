@@ -26,7 +26,8 @@ class MockVariantSet(variants.AbstractVariantSet):
         self.numVariants = numVariants
 
     def getVariants(self, referenceName, startPosition, endPosition,
-                    variantName=None, callSetIds=None):
+                    variantName=None, callSetIds=None, fieldMask=None,
+                    variantFilter=None, minStart=None):
         for i in range(self.numVariants):
             yield generateVariant()
 
@@ -108,7 +109,8 @@ class MockReadGroup(reads.AbstractReadGroup):
         self.numAlignments = numAlignments
 
     def getReadAlignments(self, referenceName=None, referenceId=None,
-                          start=None, end=None):
+                          start=None, end=None, fieldMask=None,
+                          readFilter=None, minStart=None):
         for i in range(self.numAlignments):
             yield generateReadAlignment(i)
 
@@ -211,6 +213,21 @@ class TestReadsIntervalIteratorClassMethods(unittest.TestCase):
             self.intervalIterator._getStart(self.read) +
             len(self.read.alignedSequence), result)
 
+    def testGetReadEndFromCigar(self):
+        # The end is given by the reference span of the CIGAR, which
+        # includes deletions but not insertions.
+        self.read.alignment.cigar = []
+        for operation, length in [
+                (protocol.CigarOperation.ALIGNMENT_MATCH, 2),
+                (protocol.CigarOperation.DELETE, 100),
+                (protocol.CigarOperation.INSERT, 1)]:
+            cigarUnit = protocol.CigarUnit()
+            cigarUnit.operation = operation
+            cigarUnit.operationLength = length
+            self.read.alignment.cigar.append(cigarUnit)
+        result = self.intervalIterator._getEnd(self.read)
+        self.assertEqual(self.read.alignment.position.position + 102, result)
+
 
 class DummyReadsIntervalIterator(backend.ReadsIntervalIterator):
     """
@@ -225,6 +242,7 @@ class DummyReadsIntervalIterator(backend.ReadsIntervalIterator):
         self._startPosition = startPosition
         self._equalPositionsToSkip = equalPositionsToSkip
         self._iterator = iterator
+        self._cursorId = None
         self._generator = self._internalIterator()
 
 
@@ -5,6 +5,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
 import string
 import random
 import unittest
@@ -367,3 +368,69 @@ class SearchResponseBuilderTest(SchemaTest):
             self.assertEqual(nextPageToken, builder.getNextPageToken())
             instance = responseClass.fromJsonString(builder.getJsonString())
             self.assertEqual(nextPageToken, instance.nextPageToken)
+
+    def testFieldMask(self):
+        responseClass = protocol.SearchVariantsResponse
+        typicalValue = self.getTypicalInstance(protocol.Variant)
+        fieldMask = protocol.FieldMask.parse(
+            "variants(start,end,calls(genotype))")
+        builder = protocol.SearchResponseBuilder(
+            responseClass, 100, 2**32, fieldMask)
+        builder.addValue(typicalValue)
+        builder.setNextPageToken("string")
+        jsonDict = json.loads(builder.getJsonString())
+        self.assertEqual(jsonDict["nextPageToken"], "string")
+        value, = jsonDict[responseClass.getValueListName()]
+        self.assertEqual(set(value.keys()), set(["start", "end", "calls"]))
+        self.assertEqual(value["start"], typicalValue.start)
+        for call, typicalCall in zip(value["calls"], typicalValue.calls):
+            self.assertEqual(call, {"genotype": typicalCall.genotype})
+
+
+class FieldMaskTest(unittest.TestCase):
+    """
+    Tests the parsing and application of FieldMasks.
+    """
+    def testParse(self):
+        fieldMask = protocol.FieldMask.parse(
+            "nextPageToken,variants(start, calls/genotype,calls/info)")
+        self.assertTrue(fieldMask.includes("nextPageToken"))
+        self.assertIsNone(fieldMask.getSubMask("nextPageToken"))
+        self.assertFalse(fieldMask.includes("start"))
+        variantMask = fieldMask.getSubMask("variants")
+        self.assertTrue(variantMask.includes("start"))
+        self.assertFalse(variantMask.includes("end"))
+        callMask = variantMask.getSubMask("calls")
+        self.assertTrue(callMask.includes("genotype"))
+        self.assertTrue(callMask.includes("info"))
+        self.assertFalse(callMask.includes("callSetId"))
+        self.assertEqual(
+            str(fieldMask),
+            "nextPageToken,variants(calls(genotype,info),start)")
+
+    def testMerge(self):
+        fieldMask = protocol.FieldMask.parse("calls(genotype),calls")
+        self.assertIsNone(fieldMask.getSubMask("calls"))
+        fieldMask = protocol.FieldMask.parse("calls,calls(genotype)")
+        self.assertIsNone(fieldMask.getSubMask("calls"))
+
+    def testParseErrors(self):
+        for fieldsString in [
+                "", ",", "variants(", "variants)", "variants(start))",
+                "variants()", "a//b", "a(b)c"]:
+            self.assertRaises(
+                ValueError, protocol.FieldMask.parse, fieldsString)
+
+    def testToJsonDict(self):
+        variant = protocol.Variant()
+        variant.start = 5
+        variant.calls = [protocol.Call()]
+        variant.calls[0].genotype = [0, 1]
+        fieldMask = protocol.FieldMask.parse("start,calls/genotype")
+        self.assertEqual(
+            variant.toJsonDict(fieldMask),
+            {"start": 5, "calls": [{"genotype": [0, 1]}]})
+        self.assertEqual(
+            json.loads(variant.toJsonString(fieldMask)),
+            variant.toJsonDict(fieldMask))
+        self.assertEqual(variant.toJsonDict(protocol.FieldMask()), {})
@@ -6,8 +6,16 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
+import numpy
+import pysam
+
+import ga4gh.protocol as protocol
 import ga4gh.datamodel.variants as variants
 
 
@@ -70,3 +78,102 @@ class TestGenotypes(unittest.TestCase):
 
     def testGenotypeHaploid(self):
         self.verifyGenotypeConversion("1", "376", [1], None)
+
+
+class TestStringColumnWriter(unittest.TestCase):
+    """
+    Tests the writing of the string columns of the columnar store.
+    """
+    def setUp(self):
+        self._storeDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._storeDir)
+
+    def loadColumn(self, name):
+        offsets = numpy.load(
+            os.path.join(self._storeDir, name + "Offsets.npy"))
+        data = numpy.load(os.path.join(self._storeDir, name + ".npy"))
+        return [
+            data[start:end].tostring().decode("utf-8")
+            for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def testWrite(self):
+        strings = ["", "abc", "\u00e9t\u00e9", "", "x" * 10]
+        writer = variants.StringColumnWriter(self._storeDir, "strings")
+        # The bytes are copied into the column in several chunks.
+        writer.copyChunkSize = 3
+        for string in strings:
+            writer.append(string)
+        writer.close()
+        self.assertEqual(self.loadColumn("strings"), strings)
+        self.assertEqual(
+            sorted(os.listdir(self._storeDir)),
+            ["strings.npy", "stringsOffsets.npy"])
+
+    def testEmpty(self):
+        variants.StringColumnWriter(self._storeDir, "strings").close()
+        self.assertEqual(self.loadColumn("strings"), [])
+
+
+class TestGenotypeFormats(unittest.TestCase):
+    """
+    Tests that the genotypes read in blocks for allele frequencies and
+    genotype matrices are taken from the GT values of records, wherever
+    GT is in their FORMAT.
+    """
+    vcfLines = [
+        "##fileformat=VCFv4.1",
+        "##contig=<ID=1,length=1000>",
+        '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+        '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+        "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\ts1\ts2",
+        "1\t10\t.\tA\tC\t50\tPASS\t.\tGT:DP\t0/1:3\t1|1:4",
+        "1\t20\t.\tA\tC,G\t50\tPASS\t.\tDP:GT\t3:0/2\t4:./.",
+        "1\t30\t.\tA\tC\t50\tPASS\t.\tDP\t3\t4",
+        "1\t40\t.\tA\tC\t50\tPASS\t.\tGT\t1\t0/1",
+        "1\t50\t.\tA\tC,G\t50\tPASS\t.\tGT:DP\t./.:1\t2/1/1:5"]
+
+    def setUp(self):
+        self._tempDir = tempfile.mkdtemp()
+        vcfFileName = os.path.join(self._tempDir, "formats.vcf")
+        with open(vcfFileName, "w") as vcfFile:
+            vcfFile.write("\n".join(self.vcfLines) + "\n")
+        pysam.tabix_index(vcfFileName.encode(), preset=b"vcf")
+        self._variantSet = variants.HtslibVariantSet(
+            "dataset:formats", self._tempDir)
+
+    def tearDown(self):
+        shutil.rmtree(self._tempDir)
+
+    def getAlleleCounts(self, callSetIds):
+        return [
+            json.loads(record.toJsonString())["alleleCounts"]
+            for record in self._variantSet.getAlleleFrequencies(
+                "1", 0, 1000, callSetIds)]
+
+    def getGenotypeCodes(self, callSetIds):
+        blocks = self._variantSet.getGenotypeMatrix(
+            "1", 0, 1000, callSetIds)[1]
+        return [
+            row for _, _, _, genotypeCodes in blocks
+            for row in genotypeCodes.tolist()]
+
+    def testAlleleFrequencies(self):
+        self.assertEqual(
+            self.getAlleleCounts(None), [[3], [0, 1], [0], [2], [2, 1]])
+        callSetIds = [self._variantSet.getCallSetId("s2")]
+        self.assertEqual(
+            self.getAlleleCounts(callSetIds),
+            [[2], [0, 0], [0], [1], [2, 1]])
+
+    def testGenotypeMatrix(self):
+        missing = protocol.GenotypeMatrixFormat.missingCode
+        self.assertEqual(
+            self.getGenotypeCodes(None),
+            [[1, 2], [1, missing], [missing, missing], [1, 1],
+             [missing, 3]])
+        callSetIds = [self._variantSet.getCallSetId("s1")]
+        self.assertEqual(
+            self.getGenotypeCodes(callSetIds),
+            [[1], [1], [missing], [1], [missing]])
@@ -5,6 +5,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import io
+import json
 import unittest
 
 import ga4gh.frontend as frontend
@@ -167,6 +169,18 @@ class TestFrontend(unittest.TestCase):
             response.data)
         self.assertEqual(len(responseData.variants), 1)
 
+    def testSearchFieldMask(self):
+        request = protocol.SearchVariantSetsRequest()
+        response = self.sendRequest(
+            '/variantsets/search?fields=variantSets(id)', request)
+        self.assertEqual(200, response.status_code)
+        responseData = json.loads(response.data)
+        self.assertEqual(len(responseData["variantSets"]), 1)
+        self.assertEqual(responseData["variantSets"][0].keys(), ["id"])
+        response = self.sendRequest(
+            '/variantsets/search?fields=variantSets(', request)
+        self.assertEqual(400, response.status_code)
+
     def testVariantSetsSearch(self):
         response = self.sendVariantSetsSearch()
         self.assertEqual(200, response.status_code)
@@ -194,6 +208,288 @@ class TestFrontend(unittest.TestCase):
             responseData.alignments[1].id,
             "aReadGroupSet:one:simulated1")
 
+    def testGetVariant(self):
+        response = self.sendVariantsSearch()
+        variant = protocol.SearchVariantsResponse.fromJsonString(
+            response.data).variants[0]
+        path = utils.applyVersion('/variants/{}'.format(variant.id))
+        response = self.app.get(path)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            protocol.Variant.fromJsonString(response.data), variant)
+        response = self.app.get(path + "?fields=id,start")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            json.loads(response.data), {"id": variant.id, "start": 0})
+        for variantId in [variant.id + "0", "no:such:variant"]:
+            path = utils.applyVersion('/variants/{}'.format(variantId))
+            self.assertEqual(404, self.app.get(path).status_code)
+
+    def testGetReadAlignment(self):
+        readId = "aReadGroupSet:one:simulated1"
+        path = utils.applyVersion('/reads/{}'.format(readId))
+        response = self.app.get(path)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            protocol.ReadAlignment.fromJsonString(response.data).id, readId)
+        path = utils.applyVersion('/reads/aReadGroupSet:one:simulated2')
+        self.assertEqual(404, self.app.get(path).status_code)
+
+    def testBatchGet(self):
+        headers = {'Content-type': 'application/json'}
+        readIds = [
+            "aReadGroupSet:one:simulated1", "aReadGroupSet:one:simulated0"]
+        path = utils.applyVersion('/reads/batch')
+        response = self.app.post(
+            path, headers=headers, data=json.dumps({"ids": readIds}))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            [alignment["id"] for alignment in
+             json.loads(response.data)["alignments"]], readIds)
+        response = self.app.post(
+            path + "?fields=alignments(id)", headers=headers,
+            data=json.dumps({"ids": readIds}))
+        self.assertEqual(
+            json.loads(response.data),
+            {"alignments": [{"id": readId} for readId in readIds]})
+        for badRequest in [[], {}, {"ids": "x"}, {"ids": [1]}]:
+            response = self.app.post(
+                path, headers=headers, data=json.dumps(badRequest))
+            self.assertEqual(400, response.status_code)
+        response = self.app.post(
+            path, headers=headers,
+            data=json.dumps({"ids": readIds + ["aReadGroupSet:one:x"]}))
+        self.assertEqual(404, response.status_code)
+        response = self.sendVariantsSearch()
+        variantId = protocol.SearchVariantsResponse.fromJsonString(
+            response.data).variants[0].id
+        path = utils.applyVersion('/variants/batch')
+        response = self.app.post(
+            path, headers=headers, data=json.dumps({"ids": [variantId]}))
+        self.assertEqual(200, response.status_code)
+        responseData = json.loads(response.data)
+        self.assertEqual(len(responseData["variants"]), 1)
+        self.assertEqual(responseData["variants"][0]["id"], variantId)
+
+    def testBatchSearch(self):
+        headers = {'Content-type': 'application/json'}
+        response = self.sendVariantSetsSearch()
+        variantSetId = protocol.SearchVariantSetsResponse.fromJsonString(
+            response.data).variantSets[0].id
+        intervals = [
+            {"referenceName": "1", "start": 5, "end": 8},
+            {"referenceName": "1", "start": 0, "end": 2},
+            {"referenceName": "2", "start": 0, "end": 3, "pageSize": 2}]
+        expectedResponses = []
+        for interval in intervals:
+            request = protocol.SearchVariantsRequest()
+            request.variantSetIds = [variantSetId]
+            for key, value in interval.items():
+                setattr(request, key, value)
+            expectedResponses.append(json.loads(self.sendRequest(
+                '/variants/search', request).data))
+        self.assertIsNotNone(expectedResponses[2]["nextPageToken"])
+        path = utils.applyVersion('/variants/search/batch')
+        template = {"variantSetIds": [variantSetId]}
+        batchRequests = [
+            {"request": template, "intervals": intervals},
+            {"requests": [
+                dict(template, **interval) for interval in intervals]}]
+        for batchRequest in batchRequests:
+            response = self.app.post(
+                path, headers=headers, data=json.dumps(batchRequest))
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(
+                json.loads(response.data),
+                {"responses": expectedResponses})
+        batchRequest = {"requests": [
+            dict(template, **intervals[0]),
+            {"variantSetIds": ["noSuchVariantSet"], "referenceName": "1",
+             "start": 0, "end": 1}]}
+        response = self.app.post(
+            path, headers=headers, data=json.dumps(batchRequest))
+        self.assertEqual(200, response.status_code)
+        responses = json.loads(response.data)["responses"]
+        self.assertEqual(responses[0], expectedResponses[0])
+        protocol.GAException.fromJsonDict(responses[1])
+        for badRequest in [
+                [], {}, {"requests": {}}, {"request": template},
+                {"request": template, "intervals": [1]},
+                {"requests": [dict(template, pageSize=0, **intervals[0])]}]:
+            response = self.app.post(
+                path, headers=headers, data=json.dumps(badRequest))
+            self.assertEqual(400, response.status_code)
+        path = utils.applyVersion('/reads/search/batch')
+        batchRequest = {
+            "request": {"readGroupIds": ["aReadGroupSet:one"]},
+            "intervals": [{"pageSize": 1}, {}]}
+        response = self.app.post(
+            path, headers=headers, data=json.dumps(batchRequest))
+        self.assertEqual(200, response.status_code)
+        responses = json.loads(response.data)["responses"]
+        self.assertEqual(
+            [len(item["alignments"]) for item in responses], [1, 2])
+
+    def testCount(self):
+        headers = {'Content-type': 'application/json'}
+        response = self.sendVariantSetsSearch()
+        variantSetId = protocol.SearchVariantSetsResponse.fromJsonString(
+            response.data).variantSets[0].id
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSetId]
+        request.referenceName = "1"
+        request.start = 0
+        request.end = 5
+        request.pageSize = 100
+        numVariants = len(protocol.SearchVariantsResponse.fromJsonString(
+            self.sendRequest('/variants/search', request).data).variants)
+        response = self.sendRequest('/variants/count', request)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(json.loads(response.data), {"count": numVariants})
+        path = utils.applyVersion('/variants/count?binSize=2')
+        response = self.app.post(
+            path, headers=headers, data=request.toJsonString())
+        self.assertEqual(200, response.status_code)
+        responseDict = json.loads(response.data)
+        self.assertEqual(responseDict["count"], numVariants)
+        self.assertEqual(
+            sum(bin_["count"] for bin_ in responseDict["bins"]), numVariants)
+        path = utils.applyVersion('/variants/count?binSize=0')
+        response = self.app.post(
+            path, headers=headers, data=request.toJsonString())
+        self.assertEqual(400, response.status_code)
+        request = protocol.SearchReadsRequest()
+        request.readGroupIds = ["aReadGroupSet:one"]
+        response = self.sendRequest('/reads/count', request)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(json.loads(response.data), {"count": 2})
+        request.readGroupIds = ["noSuchReadGroup"]
+        response = self.sendRequest('/reads/count', request)
+        self.assertEqual(404, response.status_code)
+
+    def testSummary(self):
+        response = self.sendVariantSetsSearch()
+        variantSetId = protocol.SearchVariantSetsResponse.fromJsonString(
+            response.data).variantSets[0].id
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSetId]
+        request.referenceName = "1"
+        request.start = 0
+        request.end = 100
+        response = self.sendRequest('/variants/summary', request)
+        self.assertEqual(404, response.status_code)
+        request = protocol.SearchReadsRequest()
+        request.readGroupIds = ["aReadGroupSet:one"]
+        request.referenceId = "1"
+        response = self.sendRequest('/reads/summary', request)
+        self.assertEqual(404, response.status_code)
+
+    def testAlleleFrequencies(self):
+        response = self.sendVariantSetsSearch()
+        variantSetId = protocol.SearchVariantSetsResponse.fromJsonString(
+            response.data).variantSets[0].id
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSetId]
+        request.referenceName = "1"
+        request.start = 0
+        request.end = 100
+        variantsResponse = protocol.SearchVariantsResponse.fromJsonString(
+            self.sendRequest('/variants/search', request).data)
+        request.pageSize = 1
+        sites = []
+        while True:
+            response = self.sendRequest('/variants/frequencies', request)
+            self.assertEqual(200, response.status_code)
+            responseDict = json.loads(response.data)
+            self.assertLessEqual(len(responseDict["sites"]), 1)
+            sites.extend(responseDict["sites"])
+            request.pageToken = responseDict["nextPageToken"]
+            if request.pageToken is None:
+                break
+        self.assertEqual(
+            [site["variantId"] for site in sites],
+            [variant.id for variant in variantsResponse.variants])
+        for site, variant in zip(sites, variantsResponse.variants):
+            alleleCounts = [0] * len(variant.alternateBases)
+            for call in variant.calls:
+                for allele in call.genotype:
+                    if allele > 0:
+                        alleleCounts[allele - 1] += 1
+            self.assertEqual(site["alleleCounts"], alleleCounts)
+        request.variantSetIds = ["noSuchVariantSet"]
+        response = self.sendRequest('/variants/frequencies', request)
+        self.assertEqual(404, response.status_code)
+
+    def testGenotypeMatrix(self):
+        response = self.sendVariantSetsSearch()
+        variantSetId = protocol.SearchVariantSetsResponse.fromJsonString(
+            response.data).variantSets[0].id
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSetId]
+        request.referenceName = "1"
+        request.start = 0
+        request.end = 100
+        variants = protocol.SearchVariantsResponse.fromJsonString(
+            self.sendRequest('/variants/search', request).data).variants
+        response = self.sendRequest('/variants/genotypes', request)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            response.mimetype, protocol.GenotypeMatrixFormat.mimetype)
+        matrix = utils.makeHttpClient().readGenotypeMatrix(
+            io.BytesIO(response.data))
+        self.assertEqual(
+            matrix.callSetIds,
+            [call.callSetId for call in variants[0].calls])
+        self.assertEqual(
+            matrix.starts.tolist(), [variant.start for variant in variants])
+        self.assertEqual(
+            matrix.alleles,
+            [(variant.referenceBases, variant.alternateBases)
+             for variant in variants])
+        self.assertEqual(
+            matrix.genotypes.tolist(),
+            [[sum(1 for allele in call.genotype if allele > 0)
+              for call in variant.calls] for variant in variants])
+        request.callSetIds = ["noSuchCallSet"]
+        response = self.sendRequest('/variants/genotypes', request)
+        self.assertEqual(404, response.status_code)
+
+    def testBeaconQuery(self):
+        response = self.sendVariantSetsSearch()
+        variantSetId = protocol.SearchVariantSetsResponse.fromJsonString(
+            response.data).variantSets[0].id
+        request = protocol.SearchVariantsRequest()
+        request.variantSetIds = [variantSetId]
+        request.referenceName = "1"
+        request.start = 0
+        request.end = 100
+        variant = protocol.SearchVariantsResponse.fromJsonString(
+            self.sendRequest('/variants/search', request).data).variants[0]
+        query = {
+            "chromosome": "1", "position": variant.start,
+            "allele": variant.alternateBases[0], "reference": "GRCh37",
+            "dataset": variantSetId}
+        path = utils.applyVersion('/beacon/query')
+        response = self.app.get(path, query_string=query)
+        self.assertEqual(200, response.status_code)
+        beaconResponse = protocol.BeaconResponseResource.fromJsonString(
+            response.data)
+        self.assertEqual(beaconResponse.response.exists, "true")
+        self.assertEqual(beaconResponse.query.position, variant.start)
+        response = self.app.get(
+            path, query_string=dict(query, allele="ACGTACGTACGT"))
+        self.assertEqual(200, response.status_code)
+        beaconResponse = protocol.BeaconResponseResource.fromJsonString(
+            response.data)
+        self.assertEqual(beaconResponse.response.exists, "false")
+        response = self.app.get(
+            path, query_string=dict(query, dataset="noSuchVariantSet"))
+        self.assertEqual(404, response.status_code)
+        for name, value in [("position", "x"), ("allele", "")]:
+            response = self.app.get(
+                path, query_string=dict(query, **{name: value}))
+            self.assertEqual(400, response.status_code)
+
     def testWrongVersion(self):
         path = '/v0.1.2/variantsets/search'
         self.assertEqual(404, self.app.options(path).status_code)